@@ -9,13 +9,122 @@ class Settings(BaseSettings):
     # Model settings
     MODEL_PATH: str = os.environ.get("MODEL_PATH", "/app/models/llama-2-7b-chat.gguf")
     N_CTX: int = int(os.environ.get("N_CTX", "2048"))
-    N_THREADS: Optional[int] = os.cpu_count()  # Use all available CPU cores
+    N_THREADS: Optional[int] = os.cpu_count()  # Use all available CPU cores; the most AUTOTUNE tries
     N_GPU_LAYERS: int = int(os.environ.get("N_GPU_LAYERS", "-1"))  # -1 means use all if available
+    CHAT_FORMAT: str = os.environ.get("CHAT_FORMAT", "llama-2")
+    MODEL_CHAT_FORMATS: str = os.environ.get("MODEL_CHAT_FORMATS", "")  # Per-model overrides, e.g. "phi-2=chatml,mistral-7b=mistrallite"
+    USE_MMAP: bool = os.environ.get("USE_MMAP", "True").lower() == "true"
+    USE_MLOCK: bool = os.environ.get("USE_MLOCK", "False").lower() == "true"  # Pin model weights in RAM
+    
+    # Startup settings
+    WARMUP_PROMPT: str = os.environ.get("WARMUP_PROMPT", "Hello")  # Run once before the server reports ready, empty skips warmup
+    WARMUP_MAX_TOKENS: int = int(os.environ.get("WARMUP_MAX_TOKENS", "4"))
+    
+    # Worker settings (see app.dispatcher)
+    WORKERS: int = int(os.environ.get("WORKERS", "1"))  # Model worker processes, each with its own context
+    WORKER_BASE_PORT: int = int(os.environ.get("WORKER_BASE_PORT", "8100"))  # Workers listen on localhost from this port up
+    WORKER_ID: str = os.environ.get("WORKER_ID", "")  # Set by the dispatcher in each worker process
+    FORWARDED_ALLOW_IPS: str = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")  # Comma-separated proxies trusted to report the client's IP in X-Forwarded-For
+    
+    # Model registry settings
+    MODEL_DIR: str = os.environ.get("MODEL_DIR", "")  # Directory of selectable GGUF models, defaults to MODEL_PATH's directory
+    MODEL_RAM_BUDGET_MB: int = int(os.environ.get("MODEL_RAM_BUDGET_MB", "0"))  # Unload idle models beyond this, 0 means no limit
+    MODEL_CATALOG_PATH: str = os.environ.get("MODEL_CATALOG_PATH", "/tmp/llm_model_catalog.json")  # Cache of model file metadata, empty keeps it in memory only
+    SWAP_MEMORY_HEADROOM_MB: int = int(os.environ.get("SWAP_MEMORY_HEADROOM_MB", "512"))  # Free RAM needed beyond a swapped-in model's weights, for its context
+    
+    # Context settings
+    MAX_TOKENS: int = int(os.environ.get("MAX_TOKENS", "1024"))  # Longest reply, in tokens
+    TEMPERATURE: float = float(os.environ.get("TEMPERATURE", "0.7"))  # Default sampling temperature
+    CONTEXT_RESERVE_TOKENS: int = int(os.environ.get("CONTEXT_RESERVE_TOKENS", "256"))  # Room always left for the reply
+    CONTEXT_POLICY: str = os.environ.get("CONTEXT_POLICY", "truncate")  # "truncate" (drop oldest turns) or "summary" (summarize them)
+    SUMMARY_MAX_TOKENS: int = int(os.environ.get("SUMMARY_MAX_TOKENS", "200"))  # Length of background history summaries
+    
+    # Engine settings
+    ENGINE_MODE: str = os.environ.get("ENGINE_MODE", "single")  # "single" or "batched" (continuous batching)
+    N_SLOTS: int = int(os.environ.get("N_SLOTS", "4"))  # Concurrent sequences in batched mode
+    SLOT_CTX: int = int(os.environ.get("SLOT_CTX", "2048"))  # Context tokens per sequence in batched mode
+    N_BATCH: int = int(os.environ.get("N_BATCH", "512"))  # Max tokens per llama_decode call
+    STREAM_BUFFER_SIZE: int = int(os.environ.get("STREAM_BUFFER_SIZE", "64"))  # Unread chunks before decoding pauses
+    
+    # Auto-tuning settings (see app.services.autotune)
+    AUTOTUNE: bool = os.environ.get("AUTOTUNE", "False").lower() == "true"  # Calibrate threads and batch size per model and host, overriding N_BATCH
+    AUTOTUNE_PROFILE_PATH: str = os.environ.get("AUTOTUNE_PROFILE_PATH", "/tmp/llm_autotune.json")  # Calibration results, reused by later starts
+    AUTOTUNE_PROMPT_TOKENS: int = int(os.environ.get("AUTOTUNE_PROMPT_TOKENS", "512"))  # Prompt evaluated per measurement
+    AUTOTUNE_DECODE_TOKENS: int = int(os.environ.get("AUTOTUNE_DECODE_TOKENS", "32"))  # Tokens decoded per measurement
+    
+    # Speculative decoding settings (batched mode only)
+    SPECULATIVE_MODE: str = os.environ.get("SPECULATIVE_MODE", "")  # "", "prompt_lookup" or "draft_model"
+    DRAFT_MODEL_PATH: str = os.environ.get("DRAFT_MODEL_PATH", "")  # Small GGUF model sharing the main model's vocabulary
+    N_DRAFT: int = int(os.environ.get("N_DRAFT", "4"))  # Most tokens drafted per decode step
+    PROMPT_LOOKUP_NGRAM: int = int(os.environ.get("PROMPT_LOOKUP_NGRAM", "3"))  # Longest n-gram matched when drafting from the prompt
+    
+    # Prefix cache settings (single mode; batched mode reuses prefixes per slot)
+    PREFIX_CACHE_RAM_MB: int = int(os.environ.get("PREFIX_CACHE_RAM_MB", "0"))  # Off by default, each snapshot copies the whole context state
+    PREFIX_CACHE_MIN_TOKENS: int = int(os.environ.get("PREFIX_CACHE_MIN_TOKENS", "256"))  # Shorter contexts aren't worth snapshotting
+    PREFIX_CACHE_DISK_MB: int = int(os.environ.get("PREFIX_CACHE_DISK_MB", "0"))  # Spill evicted snapshots to disk
+    PREFIX_CACHE_DIR: str = os.environ.get("PREFIX_CACHE_DIR", "/tmp/llm_prefix_cache")
+    
+    # Response cache settings (deterministic requests only: temperature 0 or a fixed seed)
+    RESPONSE_CACHE_ENTRIES: int = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "0"))  # 0 disables the cache
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+    RESPONSE_CACHE_PATH: str = os.environ.get("RESPONSE_CACHE_PATH", "")  # JSON-lines file to persist entries in
+    RESPONSE_CACHE_REPLAY_DELAY_MS: int = int(os.environ.get("RESPONSE_CACHE_REPLAY_DELAY_MS", "0"))  # Pause between replayed chunks, 0 replays at once
+    
+    # Scheduler settings
+    MAX_CONCURRENT_REQUESTS: Optional[int] = int(os.environ["MAX_CONCURRENT_REQUESTS"]) if os.environ.get("MAX_CONCURRENT_REQUESTS") else None  # Requests generating at once, empty matches the engine's capacity
+    MAX_QUEUE_DEPTH: int = int(os.environ.get("MAX_QUEUE_DEPTH", "32"))  # Requests waiting before 429s are returned
+    
+    # Rate limit settings (per client, in prompt + completion tokens). Every worker process
+    # keeps its own balances, so with WORKERS > 1 a client can use up to WORKERS times these
+    RATE_LIMIT_TOKENS_PER_MINUTE: int = int(os.environ.get("RATE_LIMIT_TOKENS_PER_MINUTE", "0"))  # Refill rate, 0 disables the limit
+    RATE_LIMIT_BURST_TOKENS: int = int(os.environ.get("RATE_LIMIT_BURST_TOKENS", "8192"))  # Most tokens a client can use at once
+    RATE_LIMIT_DAILY_TOKENS: int = int(os.environ.get("RATE_LIMIT_DAILY_TOKENS", "0"))  # Quota per client per UTC day, 0 disables it
+    RATE_LIMIT_KEY_HEADER: str = os.environ.get("RATE_LIMIT_KEY_HEADER", "X-API-Key")  # Identifies clients, falling back to their IP
+    RATE_LIMIT_API_KEYS: str = os.environ.get("RATE_LIMIT_API_KEYS", "")  # Comma-separated keys that get their own budget, others are limited by IP
+    RATE_LIMIT_DB_PATH: str = os.environ.get("RATE_LIMIT_DB_PATH", "")  # SQLite file to persist balances in, empty keeps them in memory only
+    
+    # Batch job settings
+    BATCH_JOBS_DIR: str = os.environ.get("BATCH_JOBS_DIR", "/tmp/llm_batch_jobs")  # Inputs, results and progress of batch jobs
+    BATCH_JOB_CONCURRENCY: int = int(os.environ.get("BATCH_JOB_CONCURRENCY", "1"))  # Conversations of a job run at once when capacity is idle
+    BATCH_MAX_ITEMS: int = int(os.environ.get("BATCH_MAX_ITEMS", "10000"))  # Conversations accepted per job
+    
+    # Streaming settings
+    SSE_FLUSH_INTERVAL_MS: int = int(os.environ.get("SSE_FLUSH_INTERVAL_MS", "30"))  # Coalescing window, 0 sends every chunk as its own event
+    SSE_FLUSH_BYTES: int = int(os.environ.get("SSE_FLUSH_BYTES", "1024"))  # Send early once this much text is buffered
+    SSE_ENCODING: str = os.environ.get("SSE_ENCODING", "text")  # "text" (one data field per line) or "json" (JSON string per event)
+    STREAM_RESUME_TTL_SECONDS: float = float(os.environ.get("STREAM_RESUME_TTL_SECONDS", "60"))  # How long a finished reply can still be resumed
+    STREAM_RESUME_MAX_EVENTS: int = int(os.environ.get("STREAM_RESUME_MAX_EVENTS", "4096"))  # Events buffered per reply for resuming
+    STREAM_DETACH_GRACE_SECONDS: float = float(os.environ.get("STREAM_DETACH_GRACE_SECONDS", "0"))  # Generation continues this long after a client drops so it can resume, 0 cancels at once
+    
+    # WebSocket settings (see app.routers.websocket)
+    WS_MAX_STREAMS_PER_CONNECTION: int = int(os.environ.get("WS_MAX_STREAMS_PER_CONNECTION", "8"))  # Replies generating at once on one connection
+    WS_SEND_WINDOW: int = int(os.environ.get("WS_SEND_WINDOW", "64"))  # Unsent reply frames per connection before generation pauses
+    
+    # Session settings
+    SESSION_TTL_SECONDS: int = int(os.environ.get("SESSION_TTL_SECONDS", "3600"))  # Idle time before a session expires
+    MAX_SESSIONS: int = int(os.environ.get("MAX_SESSIONS", "1000"))  # Sessions kept in memory
+    SESSION_DB_PATH: str = os.environ.get("SESSION_DB_PATH", "")  # SQLite file to persist sessions in, empty keeps them in memory only
+    
+    # Health settings
+    HEALTH_SAMPLE_INTERVAL_SECONDS: float = float(os.environ.get("HEALTH_SAMPLE_INTERVAL_SECONDS", "5"))  # How often /health/ system stats are refreshed
+    
+    # Logging settings
+    LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.environ.get("LOG_FORMAT", "json")  # "json" (one object per line) or "text"
+    LOG_MAX_MESSAGE_CHARS: int = int(os.environ.get("LOG_MAX_MESSAGE_CHARS", "2000"))  # Longer messages are truncated and hashed, 0 disables
+    LOG_DEBUG_SAMPLE_RATE: float = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))  # Fraction of requests whose DEBUG records are kept
+    
+    # Tracing settings
+    TRACE_ENABLED: bool = os.environ.get("TRACE_ENABLED", "False").lower() == "true"  # Record per-request timelines
+    TRACE_BUFFER_SIZE: int = int(os.environ.get("TRACE_BUFFER_SIZE", "1000"))  # Finished traces kept for /debug/traces
+    TRACE_EXPORT_PATH: str = os.environ.get("TRACE_EXPORT_PATH", "")  # File to append traces to as OTLP JSON lines
     
     # API settings
+    PORT: int = int(os.environ.get("PORT", "8000"))
     API_PREFIX: str = "/api"
     API_VERSION: str = "1.0.0"
     DEBUG: bool = os.environ.get("DEBUG", "False").lower() == "true"
+    ADMIN_API_KEY: str = os.environ.get("ADMIN_API_KEY", "")  # Required in X-Admin-Key for /admin endpoints, empty disables them
     
     # CORS settings
     CORS_ORIGINS: list[str] = ["*"]  # In production, specify exact origins
@@ -0,0 +1,435 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.config import settings
+from app.utils.logging_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Headers that describe a single connection and must not be forwarded
+_HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer", "transfer-encoding", "upgrade"}
+# Replaced with the client's address as resolved here, so workers can't be handed a spoofed one
+_CLIENT_IP_HEADERS = {"x-forwarded-for", "x-real-ip", "forwarded"}
+
+# Resources that live on the worker that created them: route prefix -> (affinity key
+# prefix, id field in the creation response's data)
+_BOUND_RESOURCES = {"sessions": ("session", "session_id"), "batches": ("batch", "job_id")}
+
+
+def forwarded_headers(request: Request) -> List[Tuple[str, str]]:
+    """
+    The headers to pass a request on to a worker with. The client's IP, which uvicorn
+    has already taken from X-Forwarded-For if a trusted proxy sent it, goes in a fresh
+    X-Forwarded-For that workers trust from the dispatcher alone.
+    """
+    headers = [
+        (k, v) for k, v in request.headers.items()
+        if k.lower() not in _HOP_BY_HOP | _CLIENT_IP_HEADERS and k.lower() not in ("host", "content-length")
+    ]
+    headers.append(("x-forwarded-for", request.client.host if request.client else "unknown"))
+    return headers
+
+def affinity_key(path: str, body: bytes) -> Optional[str]:
+    """
+    What identifies the conversation a request belongs to, so every turn of it can be
+    sent to the worker that already holds its prompt state. None if it doesn't matter.
+
+    Session routes are keyed by session id, batch job routes by job id and resumed
+    streams by stream id, since each worker keeps its own. Stateless chat requests
+    resend the whole history every turn, so a conversation is identified by its model
+    and its messages up to the first user message.
+    """
+    parts = [part for part in path.split("/") if part]
+    if len(parts) >= 2 and parts[0] in _BOUND_RESOURCES:
+        return f"{_BOUND_RESOURCES[parts[0]][0]}:{parts[1]}"
+    if len(parts) >= 3 and parts[:2] == ["chat", "streams"]:
+        return f"stream:{parts[2]}"
+    if parts != ["chat"]:
+        return None
+
+    try:
+        request = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(request, dict) or not isinstance(request.get("messages"), list):
+        return None
+
+    opening: List[Any] = []
+    for message in request["messages"]:
+        opening.append(message)
+        if isinstance(message, dict) and message.get("role") == "user":
+            break
+    payload = json.dumps([request.get("model"), opening], sort_keys=True)
+    return f"chat:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class Worker:
+    """
+    One `app.main` server process with its own model context, listening on localhost.
+    """
+
+    def __init__(self, worker_id: int, port: int) -> None:
+        self.id = worker_id
+        self.port = port
+        self.process: Optional[subprocess.Popen] = None
+        # The worker's own /health/ready status, as last polled
+        self.status = "starting"
+        self.in_flight = 0
+        self.routed = 0
+        self.restarts = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def spawn(self, env: Dict[str, str]) -> None:
+        self.status = "starting"
+        self.process = subprocess.Popen(
+            # Workers only take requests from the dispatcher, so only it reports client IPs
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port), "--forwarded-allow-ips", "127.0.0.1"],
+            env={**env, "WORKER_ID": str(self.id)},
+        )
+        logger.info(f"Started worker {self.id} (pid {self.process.pid}) on port {self.port}")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        if not self.alive:
+            return
+        assert self.process is not None
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Worker {self.id} did not exit within {timeout:.0f}s, killing it")
+            self.process.kill()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "port": self.port,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.alive,
+            "status": self.status,
+            "in_flight": self.in_flight,
+            "routed": self.routed,
+            "restarts": self.restarts,
+        }
+
+
+class Dispatcher:
+    """
+    Routes requests across worker processes.
+
+    A request goes to the ready worker with the fewest requests in flight, except
+    that every request of a conversation sticks to the worker that served it first,
+    keeping that worker's prefix cache or batch slot warm. A conversation moves only
+    if its worker stops being ready or has more than `max_imbalance` requests in
+    flight beyond the least loaded worker.
+
+    The workers memory-map the same read-only GGUF file, so the weights sit in the
+    page cache once however many workers there are; each worker only adds its own
+    context and caches.
+    """
+
+    def __init__(self, n_workers: int, base_port: int, max_affinity_entries: int = 100_000, max_imbalance: int = 4) -> None:
+        self.workers = [Worker(i, base_port + i) for i in range(n_workers)]
+        self.max_affinity_entries = max_affinity_entries
+        self.max_imbalance = max_imbalance
+
+        self._env: Dict[str, str] = {}
+        self._affinity: "OrderedDict[str, int]" = OrderedDict()
+        self._sticky_routes = 0
+        self._rebalanced = 0
+
+    def pick(self, key: Optional[str]) -> Worker:
+        """
+        Choose the worker for a request with the given affinity key (see `affinity_key`).
+        """
+        candidates = [w for w in self.workers if w.status == "ready"] or [w for w in self.workers if w.alive] or self.workers
+        least_loaded = min(candidates, key=lambda w: (w.in_flight, w.routed))
+        if key is None:
+            return least_loaded
+
+        worker_id = self._affinity.get(key)
+        if worker_id is not None:
+            worker = self.workers[worker_id]
+            if worker in candidates and worker.in_flight - least_loaded.in_flight <= self.max_imbalance:
+                self._affinity.move_to_end(key)
+                self._sticky_routes += 1
+                return worker
+            self._rebalanced += 1
+
+        self.bind(key, least_loaded)
+        return least_loaded
+
+    def bind(self, key: str, worker: Worker) -> None:
+        self._affinity[key] = worker.id
+        self._affinity.move_to_end(key)
+        while len(self._affinity) > self.max_affinity_entries:
+            self._affinity.popitem(last=False)
+
+    def start(self) -> None:
+        if not settings.USE_MMAP:
+            logger.warning("USE_MMAP is off, so every worker will load its own copy of the weights")
+        env = dict(os.environ)
+        # Split the cores between workers unless told otherwise
+        if "N_THREADS" not in env:
+            env["N_THREADS"] = str(max(1, (os.cpu_count() or 1) // len(self.workers)))
+        self._env = env
+        for worker in self.workers:
+            worker.spawn(env)
+
+    def stop(self) -> None:
+        # Signal every worker first so they shut down in parallel
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()  # type: ignore[union-attr]
+        for worker in self.workers:
+            worker.stop()
+
+    async def monitor(self, client: httpx.AsyncClient, interval: float = 2.0) -> None:
+        """
+        Poll every worker's readiness, restarting any that exited.
+        """
+        while True:
+            for worker in self.workers:
+                if not worker.alive:
+                    logger.error(f"Worker {worker.id} exited, restarting it")
+                    worker.restarts += 1
+                    worker.spawn(self._env)
+                    continue
+                try:
+                    response = await client.get(f"{worker.url}/health/ready", timeout=interval)
+                    worker.status = response.json()["status"]
+                except (httpx.HTTPError, ValueError, KeyError):
+                    # Still binding its port, or too busy to answer
+                    if worker.status == "ready":
+                        worker.status = "unreachable"
+            await asyncio.sleep(interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.workers),
+            "ready_workers": sum(1 for w in self.workers if w.status == "ready"),
+            "affinity_entries": len(self._affinity),
+            "sticky_routes": self._sticky_routes,
+            "rebalanced": self._rebalanced,
+        }
+
+
+dispatcher = Dispatcher(n_workers=settings.WORKERS, base_port=settings.WORKER_BASE_PORT)
+_client: Optional[httpx.AsyncClient] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    global _client
+    # Generations stream for as long as they take, so only connecting is bounded
+    _client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=5.0), limits=httpx.Limits(max_connections=None))
+    dispatcher.start()
+    monitor = asyncio.create_task(dispatcher.monitor(_client))
+    yield
+    monitor.cancel()
+    await _client.aclose()
+    dispatcher.stop()
+
+app = FastAPI(title="Chatbot API dispatcher", lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+
+@app.get("/health/")
+async def health_check() -> Dict[str, Any]:
+    assert _client is not None
+
+    async def worker_health(worker: Worker) -> Optional[Dict[str, Any]]:
+        try:
+            response = await _client.get(f"{worker.url}/health/", timeout=5.0)  # type: ignore[union-attr]
+            return response.json()
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    healths = await asyncio.gather(*(worker_health(w) for w in dispatcher.workers))
+    return {
+        "version": settings.API_VERSION,
+        "dispatcher": dispatcher.get_stats(),
+        "workers": [{**w.get_stats(), "health": health} for w, health in zip(dispatcher.workers, healths)],
+    }
+
+@app.get("/health/live")
+def liveness() -> Dict[str, Any]:
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness() -> JSONResponse:
+    """
+    Ready as soon as any worker can take requests.
+    """
+    ready = sum(1 for w in dispatcher.workers if w.status == "ready")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "loading", "ready_workers": ready, "workers": len(dispatcher.workers)},
+    )
+
+@app.api_route("/admin/{path:path}", methods=["GET", "POST"])
+async def admin(request: Request, path: str) -> JSONResponse:
+    """
+    Send an admin request to every worker, since each holds its own models. Responds
+    with each worker's response by id, and the highest of their status codes.
+    """
+    assert _client is not None
+    body = await request.body()
+    headers = forwarded_headers(request)
+
+    async def send(worker: Worker) -> Tuple[int, Any]:
+        try:
+            response = await _client.request(request.method, f"{worker.url}/admin/{path}", headers=headers, content=body, timeout=30.0)  # type: ignore[union-attr]
+            return response.status_code, response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return 502, {"detail": f"Worker unavailable: {e}"}
+
+    results = await asyncio.gather(*(send(w) for w in dispatcher.workers))
+    return JSONResponse(
+        status_code=max(status for status, _ in results),
+        content={"workers": {str(w.id): content for w, (_, content) in zip(dispatcher.workers, results)}},
+    )
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"])
+async def proxy(request: Request) -> Response:
+    """
+    Forward a request to a worker, streaming the response back as it arrives.
+    """
+    assert _client is not None
+    body = await request.body()
+    worker = dispatcher.pick(affinity_key(request.url.path, body))
+    worker.in_flight += 1
+    worker.routed += 1
+    finished = False
+
+    def finish() -> None:
+        nonlocal finished
+        if not finished:
+            finished = True
+            worker.in_flight -= 1
+
+    url = f"{worker.url}{request.url.path}" + (f"?{request.url.query}" if request.url.query else "")
+    headers = forwarded_headers(request)
+    try:
+        upstream = await _client.send(_client.build_request(request.method, url, headers=headers, content=body), stream=True)
+    except httpx.HTTPError as e:
+        finish()
+        logger.error(f"Worker {worker.id} failed to take a request: {e}")
+        return JSONResponse(status_code=502, content={"detail": "Model worker unavailable"}, headers={"Retry-After": "5"})
+
+    response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_BY_HOP}
+    # A reply can only be resumed on the worker generating it
+    if "x-stream-id" in upstream.headers:
+        dispatcher.bind(f"stream:{upstream.headers['x-stream-id']}", worker)
+
+    # A new session or batch job stays on the worker that created it
+    resource = request.url.path.strip("/")
+    if request.method == "POST" and resource in _BOUND_RESOURCES and upstream.status_code == 201:
+        try:
+            content = await upstream.aread()
+        finally:
+            await upstream.aclose()
+            finish()
+        key_prefix, id_field = _BOUND_RESOURCES[resource]
+        try:
+            dispatcher.bind(f"{key_prefix}:{json.loads(content)['data'][id_field]}", worker)
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Worker {worker.id} returned a new {key_prefix} without an id")
+        return Response(content=content, status_code=upstream.status_code, headers=response_headers)
+
+    async def relay() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await upstream.aclose()
+            finish()
+
+    async def close() -> None:
+        await upstream.aclose()
+        finish()
+
+    return StreamingResponse(relay(), status_code=upstream.status_code, headers=response_headers, background=BackgroundTask(close))
+
+
+@app.websocket("/{path:path}")
+async def proxy_websocket(websocket: WebSocket, path: str) -> None:
+    """
+    Relay a WebSocket connection to the least loaded worker for as long as it stays open.
+    """
+    # Installed with uvicorn[standard], which is what serves WebSockets in the first place
+    import websockets
+
+    worker = dispatcher.pick(None)
+    url = f"ws://127.0.0.1:{worker.port}/{path}" + (f"?{websocket.url.query}" if websocket.url.query else "")
+    headers = [(k, v) for k, v in websocket.headers.items() if k.lower() in (settings.RATE_LIMIT_KEY_HEADER.lower(), "x-request-id")]
+    headers.append(("x-forwarded-for", websocket.client.host if websocket.client else "unknown"))
+    try:
+        upstream = await websockets.connect(url, extra_headers=headers, max_size=None)
+    except (OSError, websockets.WebSocketException) as e:
+        logger.error(f"Worker {worker.id} failed to take a WebSocket connection: {e}")
+        await websocket.close(code=1011)
+        return
+
+    await websocket.accept()
+    worker.in_flight += 1
+    worker.routed += 1
+
+    async def to_worker() -> None:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            await upstream.send(message["bytes"] if message.get("bytes") is not None else message.get("text") or "")
+
+    async def to_client() -> None:
+        async for message in upstream:
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message)
+
+    # Whichever side closes first ends the relay
+    tasks = [asyncio.create_task(to_worker()), asyncio.create_task(to_client())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await upstream.close()
+        worker.in_flight -= 1
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # Already closed by the client
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    configure_logging(
+        level=settings.LOG_LEVEL,
+        log_format=settings.LOG_FORMAT,
+        max_chars=settings.LOG_MAX_MESSAGE_CHARS,
+        debug_sample_rate=settings.LOG_DEBUG_SAMPLE_RATE,
+    )
+    uvicorn.run(app, host="0.0.0.0", port=settings.PORT, proxy_headers=True, forwarded_allow_ips=settings.FORWARDED_ALLOW_IPS)
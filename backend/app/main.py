@@ -1,23 +1,52 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
-from app.routers import chat, health
+from prometheus_fastapi_instrumentator import Instrumentator
+from app.routers import admin, batches, chat, debug, health, sessions, websocket
+from app.services.batch_jobs import batch_jobs
+from app.services.llm_service import llm_service
+from app.services.system_sampler import system_sampler
 from app.config import settings
+from app.utils.logging_utils import RequestIdMiddleware, configure_logging
 
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+configure_logging(
+    level=settings.LOG_LEVEL,
+    log_format=settings.LOG_FORMAT,
+    max_chars=settings.LOG_MAX_MESSAGE_CHARS,
+    debug_sample_rate=settings.LOG_DEBUG_SAMPLE_RATE,
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Load the default model in the background so the server accepts connections
+    # (and reports its progress on /health/ready) while the weights load
+    startup = asyncio.create_task(llm_service.start())
+    # A failure is logged and reported as the "failed" status
+    startup.add_done_callback(lambda t: t.cancelled() or t.exception())
+    sampler = asyncio.create_task(system_sampler.run())
+    # Batch jobs, including ones left unfinished by the last run, use idle capacity
+    batch_runner = asyncio.create_task(batch_jobs.run())
+    yield
+    batch_runner.cancel()
+    sampler.cancel()
+    startup.cancel()
+
 app = FastAPI(
     title="Chatbot API",
     description="API for chatbot interactions",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+app.add_middleware(RequestIdMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -26,8 +55,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(admin.router)
+app.include_router(batches.router)
 app.include_router(chat.router)
+app.include_router(debug.router)
 app.include_router(health.router)
+app.include_router(sessions.router)
+app.include_router(websocket.router)
+
+# HTTP request metrics plus the LLM metrics registered in app.services.metrics
+Instrumentator(excluded_handlers=["/metrics"]).instrument(app).expose(app, include_in_schema=False)
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
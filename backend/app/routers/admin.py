@@ -0,0 +1,65 @@
+import hmac
+import logging
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+from app.config import settings
+from app.services.model_registry import InsufficientMemoryError, ModelNotFoundError, SwapInProgressError, model_registry
+
+
+class SwapRequest(BaseModel):
+    model: Optional[str] = None
+    n_ctx: Optional[int] = Field(default=None, ge=64)
+
+
+def require_admin_key(x_admin_key: Optional[str] = Header(default=None)) -> None:
+    """
+    Admin endpoints can unload the serving model, so they don't exist unless
+    ADMIN_API_KEY is set, and then only for requests that send it.
+    """
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_key or "", settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Key")
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin_key)],
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("/models/swap", status_code=202)
+async def swap_model(request: SwapRequest) -> Dict[str, Any]:
+    """
+    Replace the default model, or reload it with a different context size, without
+    downtime. Returns once the swap has started; poll `GET /admin/models/swap` for
+    its progress.
+
+    Raises:
+        HTTPException: 404 if the model doesn't exist, 409 if a swap is already in
+            progress, 507 if both models wouldn't fit in RAM at once.
+    """
+    try:
+        swap = await model_registry.swap_default(request.model, n_ctx=request.n_ctx)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SwapInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except InsufficientMemoryError as e:
+        logger.warning(f"Refused a model swap: {e}")
+        raise HTTPException(status_code=507, detail=str(e))
+    return {"status": "success", "data": swap.to_dict()}
+
+@router.get("/models/swap")
+async def get_swap() -> Dict[str, Any]:
+    """
+    The progress of the current or last model swap.
+    """
+    if model_registry.swap is None:
+        raise HTTPException(status_code=404, detail="No model swap has been started")
+    return {"status": "success", "data": model_registry.swap.to_dict()}
@@ -0,0 +1,98 @@
+import logging
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.routers.chat import ChatMessage
+from app.services.batch_jobs import BatchJob, BatchJobNotFoundError, batch_jobs
+from app.services.model_registry import model_registry
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    messages: List[ChatMessage]
+
+
+router = APIRouter(
+    prefix="/batches",
+    tags=["batches"],
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("/", status_code=201)
+async def create_batch(
+    request: Request,
+    model: Optional[str] = None,
+    temperature: Optional[float] = Query(default=None, ge=0.0, le=2.0),
+    seed: Optional[int] = None,
+    max_tokens: Optional[int] = Query(default=None, gt=0),
+) -> Dict[str, Any]:
+    """
+    Queue conversations to reply to offline, using capacity interactive requests leave idle.
+
+    The body is JSON lines, one conversation per line as {"id": optional, "messages": [...]}.
+    Poll the returned job and download its results once it has completed.
+    """
+    if model is not None and model not in model_registry.available():
+        raise HTTPException(status_code=404, detail=f"Model {model!r} not found")
+
+    items = []
+    body = (await request.body()).decode("utf-8", errors="replace")
+    for line_number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = BatchItem.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Line {line_number}: {e.errors(include_url=False)}")
+        if not item.messages:
+            raise HTTPException(status_code=422, detail=f"Line {line_number}: no messages")
+        items.append({"id": item.id, "messages": [message.model_dump() for message in item.messages]})
+
+    if not items:
+        raise HTTPException(status_code=422, detail="No conversations given")
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} conversations per job")
+
+    job = batch_jobs.create(items, model=model, temperature=temperature, seed=seed, max_tokens=max_tokens)
+    return {"status": "success", "data": job.to_dict()}
+
+@router.get("/")
+async def list_batches() -> Dict[str, Any]:
+    return {"status": "success", "data": [job.to_dict() for job in batch_jobs.list()]}
+
+@router.get("/{job_id}")
+async def get_batch(job_id: str) -> Dict[str, Any]:
+    return {"status": "success", "data": get_job_or_404(job_id).to_dict()}
+
+@router.get("/{job_id}/results")
+async def get_batch_results(job_id: str) -> FileResponse:
+    """
+    Download a job's results as JSON lines of {"index", "id", "reply", "error"}, in the
+    order the conversations finished. Available while the job runs, too.
+    """
+    job = get_job_or_404(job_id)
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"Batch job {job_id} has no results yet")
+    return FileResponse(job.results_path, media_type="application/x-ndjson", filename=f"{job_id}.jsonl")
+
+@router.delete("/{job_id}")
+async def delete_batch(job_id: str) -> Dict[str, Any]:
+    """
+    Cancel a job and delete it with its results.
+    """
+    try:
+        batch_jobs.delete(job_id)
+    except BatchJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success"}
+
+def get_job_or_404(job_id: str) -> BatchJob:
+    try:
+        return batch_jobs.get(job_id)
+    except BatchJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
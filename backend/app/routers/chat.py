@@ -1,10 +1,24 @@
+import asyncio
+import hashlib
+import json
 import logging
-from fastapi import APIRouter, HTTPException, Request
+import uuid
+from contextlib import aclosing
+from fastapi import APIRouter, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.requests import HTTPConnection
 from llama_cpp import ChatCompletionRequestAssistantMessage, ChatCompletionRequestMessage, ChatCompletionRequestSystemMessage, ChatCompletionRequestUserMessage
-from pydantic import BaseModel
-from typing import Any, Dict, List, Literal
-from app.services.llm_service import llm_service
+from pydantic import BaseModel, Field
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional
+from app.config import settings
+from app.services.model_registry import ModelNotFoundError, ModelNotReadyError, model_registry
+from app.services.rate_limiter import RateLimitExceededError, rate_limiter
+from app.services.scheduler import QueueFullError, Ticket, scheduler
+from app.services.stream_registry import ReplayStream, StreamGapError, StreamNotFoundError, stream_registry
+from app.services.tracing import tracer
+from app.utils.logging_utils import request_id_var
+from app.utils.sse_utils import coalesce_chunks, encode_payload
 
 
 Role = Literal["user", "assistant", "system"]
@@ -15,6 +29,9 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
+    model: Optional[str] = None
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0)
+    seed: Optional[int] = None
 
 
 router = APIRouter(
@@ -31,12 +48,52 @@ async def get_model_info() -> Dict[str, Any]:
     try:
         return {
             "status": "success", 
-            "data": llm_service.get_model_stats()
+            "data": {**model_registry.default.get_model_stats(), "models": model_registry.list_models()},
         }
     except Exception as e:
         logger.error(f"Error getting model info: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to get model info: {str(e)}")
 
+@router.get("/streams/{stream_id}")
+async def resume_stream(
+    stream_id: str,
+    last_event_id: int = Header(default=0, ge=0),
+) -> StreamingResponse:
+    """
+    Reattach to a reply whose connection dropped, streaming every event after the
+    `Last-Event-ID` header's. The reply kept generating while the client was away.
+    
+    Args:
+        stream_id: The stream, from the reply's X-Stream-ID header.
+        last_event_id: The id of the last event the client received.
+        
+    Returns:
+        A streaming response continuing the reply.
+        
+    Raises:
+        HTTPException: 404 if the stream doesn't exist or has expired, 410 if the
+            events after `last_event_id` are no longer buffered.
+    """
+    try:
+        stream = stream_registry.resume(stream_id, last_event_id)
+    except StreamNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except StreamGapError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return stream_response(stream, last_event_id)
+
+@router.delete("/streams/{stream_id}")
+async def cancel_stream(stream_id: str) -> Dict[str, Any]:
+    """
+    Stop generating a reply the client no longer wants. Closing the connection alone
+    leaves it generating for STREAM_DETACH_GRACE_SECONDS (if set) in case the client resumes.
+    """
+    try:
+        stream_registry.get(stream_id).cancel()
+    except StreamNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success"}
+
 @router.post("/")
 async def chat_stream(request: ChatRequest, client_request: Request) -> StreamingResponse:
     """
@@ -54,32 +111,259 @@ async def chat_stream(request: ChatRequest, client_request: Request) -> Streamin
     
     try:
         conversation = [create_conversation_message(msg.role, msg.content) for msg in request.messages]
-        
-        async def stream_generator():
-            try:
-                async for text_chunk in llm_service.get_llm_response_stream(conversation):
-                    yield f"data: {text_chunk}\n\n"
-                yield "data: [DONE]\n\n"
-            except Exception as e:
-                logger.error(f"Error in stream generator: {str(e)}", exc_info=True)
-                yield f"data: [ERROR] {str(e)}\n\n"
-                yield "data: [DONE]\n\n"
-            
-        return StreamingResponse(
-            stream_generator(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache", 
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
-        )
     except ValueError as e:
         logger.warning(f"Validation error in chat request: {str(e)}")
         raise HTTPException(status_code=422, detail=str(e))
-    except Exception as e:
-        logger.error(f"Unexpected error in chat_stream: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+    
+    return await stream_chat_response(
+        conversation,
+        client_request,
+        temperature=request.temperature,
+        seed=request.seed,
+        model=request.model,
+    )
+
+async def stream_chat_response(
+    conversation: List[ChatCompletionRequestMessage],
+    client_request: Request,
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    message_tokens: Optional[List[int]] = None,
+    temperature: Optional[float] = None,
+    seed: Optional[int] = None,
+    model: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Queue a conversation for generation and stream the reply back as server-sent events.
+    Every event has an id, and the response's X-Stream-ID header names the stream, so a
+    client that loses the connection can resume through `/chat/streams/{stream_id}`.
+    If older turns had to be dropped to fit the context window, a `context` event
+    describing the trimming precedes the reply. Deterministic requests with a cached
+    reply skip the queue and replay it, and don't count towards the client's rate limit.
+    With tracing enabled, a `trace` event with the request's timeline precedes `[DONE]`.
+    
+    Args:
+        conversation: The messages to reply to.
+        client_request: The original FastAPI request object.
+        on_complete: Called with the full reply text if generation finishes normally.
+        message_tokens: Content token counts per message, if already known.
+        temperature: Sampling temperature, defaults to the TEMPERATURE setting.
+        seed: Sampling seed, random if not given.
+        model: Name of the model to use, the default model if not given.
+        
+    Returns:
+        A streaming response with the LLM's replies.
+        
+    Raises:
+        HTTPException: See `start_chat_reply`.
+    """
+    stream = stream_registry.create()
+    
+    async def publish(event: str, data: Any) -> None:
+        if event == "text":
+            stream.publish(encode_payload(data, settings.SSE_ENCODING))
+        elif event == "error":
+            stream.publish(encode_payload(f"[ERROR] {data}", settings.SSE_ENCODING))
+        elif event == "done":
+            stream.publish("[DONE]")
+        else:
+            stream.publish(json.dumps(data), event=event)
+    
+    stream.producer = await start_chat_reply(
+        conversation,
+        client_request,
+        publish,
+        on_complete=on_complete,
+        message_tokens=message_tokens,
+        temperature=temperature,
+        seed=seed,
+        model=model,
+    )
+    stream.producer.add_done_callback(lambda _: stream.close())
+    return stream_response(stream, 0, rate_limiter.headers(rate_limit_key(client_request)))
+
+async def start_chat_reply(
+    conversation: List[ChatCompletionRequestMessage],
+    client: HTTPConnection,
+    emit: Callable[[str, Any], Awaitable[None]],
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    message_tokens: Optional[List[int]] = None,
+    temperature: Optional[float] = None,
+    seed: Optional[int] = None,
+    model: Optional[str] = None,
+) -> "asyncio.Task[None]":
+    """
+    Admit a conversation for generation and start generating the reply in a new task,
+    which passes each event of the reply to `emit` as an event name and its data:
+    "context" (a dict describing how the conversation was trimmed, if it was), "queue"
+    (a dict with the request's queue position, if it had to wait), "text" (a piece of
+    the reply), "error" (a message, if generation failed), "trace" (the request's
+    timeline, if tracing is enabled) and finally "done" (None). Generation runs detached
+    from whoever started it, until it finishes or the task is cancelled.
+    
+    Args:
+        conversation: The messages to reply to.
+        client: The HTTP request or WebSocket the conversation came from.
+        emit: Called with each event of the reply. Generation waits for it to return.
+        on_complete: Called with the full reply text if generation finishes normally.
+        message_tokens: Content token counts per message, if already known.
+        temperature: Sampling temperature, defaults to the TEMPERATURE setting.
+        seed: Sampling seed, random if not given.
+        model: Name of the model to use, the default model if not given.
+        
+    Returns:
+        The task generating the reply.
+        
+    Raises:
+        HTTPException: 404 if the model doesn't exist, 422 if the conversation
+            can't fit in the context window, 429 if the client is over its rate
+            limit or the request queue is full, 503 if the model is still loading.
+    """
+    client_host = client.client.host if client.client else "unknown"
+    trace = tracer.start(request_id_var.get() or uuid.uuid4().hex)
+    
+    try:
+        service = await model_registry.acquire(model)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    
+    ticket: Optional[Ticket] = None
+    released = False
+    generating = False
+    limit_key = rate_limit_key(client)
+    usage: Dict[str, int] = {}
+    
+    def release() -> None:
+        nonlocal released
+        if released:
+            return
+        released = True
+        if trace is not None:
+            trace.mark("stream_closed")
+            tracer.finish(trace)
+        if ticket is not None:
+            # The prompt was charged up front as estimated; settle up with what the
+            # model actually used, or refund it if the request never got to run
+            if generating:
+                rate_limiter.charge(limit_key, usage.get("prompt_tokens", window.prompt_tokens) - window.prompt_tokens + usage.get("completion_tokens", 0))
+            else:
+                rate_limiter.charge(limit_key, -window.prompt_tokens)
+            scheduler.release(ticket)
+        model_registry.release(service)
+    
+    try:
+        window = service.fit_context(conversation, message_tokens)
+    except ValueError as e:
+        release()
+        logger.warning(f"Conversation from {client_host} does not fit: {str(e)}")
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    temperature = settings.TEMPERATURE if temperature is None else temperature
+    cached = service.get_cached_response(window.messages, temperature, seed, window.max_tokens)
+    if trace is not None:
+        trace.mark("validated")
+        trace.attributes.update(model=service.model_name, prompt_tokens=window.prompt_tokens, cached=cached is not None)
+    
+    if cached is None:
+        # Checked before queueing, so a client over its limit costs no prompt evaluation
+        try:
+            rate_limiter.acquire(limit_key, window.prompt_tokens)
+        except RateLimitExceededError as e:
+            release()
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after), **rate_limiter.headers(limit_key)},
+            )
+        try:
+            ticket = scheduler.submit(client_host)
+            if trace is not None:
+                trace.mark("queued")
+        except QueueFullError as e:
+            rate_limiter.charge(limit_key, -window.prompt_tokens)
+            release()
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    async def generate() -> None:
+        nonlocal generating
+        reply: List[str] = []
+        try:
+            if window.trimmed:
+                await emit("context", window.to_dict())
+            if ticket is None:
+                logger.info(f"Replaying cached response for {client_host}")
+                chunks = service.replay_response(cached)  # type: ignore[arg-type]
+            else:
+                if not ticket.admitted:
+                    await emit("queue", {"position": ticket.position})
+                    await scheduler.acquire(ticket)
+                if trace is not None:
+                    trace.mark("admitted")
+                logger.info(f"Request {ticket.id} admitted after {ticket.wait_time:.3f}s in queue")
+                generating = True
+                chunks = service.get_llm_response_stream(
+                    window.messages, max_tokens=window.max_tokens, temperature=temperature, seed=seed, usage=usage, trace=trace,
+                )
+            
+            frames = coalesce_chunks(
+                chunks,
+                interval=settings.SSE_FLUSH_INTERVAL_MS / 1000,
+                max_bytes=settings.SSE_FLUSH_BYTES,
+            )
+            # Cancelling this task closes `frames`, which stops generation
+            async with aclosing(frames):
+                async for text in frames:
+                    if on_complete is not None:
+                        reply.append(text)
+                    await emit("text", text)
+            if on_complete is not None:
+                await on_complete("".join(reply))
+            if trace is not None:
+                await emit("trace", trace.to_dict())
+            await emit("done", None)
+        except asyncio.CancelledError:
+            logger.info(f"Cancelled the request of {client_host}")
+        except Exception as e:
+            logger.error(f"Error in stream generator: {str(e)}", exc_info=True)
+            await emit("error", str(e))
+            await emit("done", None)
+        finally:
+            release()
+    
+    task = asyncio.create_task(generate())
+    # A task cancelled before it starts never runs generate(), nor its finally
+    task.add_done_callback(lambda _: release())
+    return task
+
+
+def stream_response(stream: ReplayStream, last_event_id: int, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    return StreamingResponse(
+        stream.read(last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache", 
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Stream-Encoding": settings.SSE_ENCODING,
+            "X-Stream-ID": stream.id,
+            **(headers or {}),
+        },
+        # Starts the grace period if the client disconnects before streaming starts
+        background=BackgroundTask(stream.detach),
+    )
+
+def rate_limit_key(client: HTTPConnection) -> str:
+    """
+    Who a request is charged to: its API key if it is one of RATE_LIMIT_API_KEYS,
+    otherwise its IP address, so clients can't dodge the limit by making keys up.
+    Keys are hashed so they aren't held in memory or written to disk in the clear.
+    """
+    api_key = client.headers.get(settings.RATE_LIMIT_KEY_HEADER)
+    known_keys = {key.strip() for key in settings.RATE_LIMIT_API_KEYS.split(",") if key.strip()}
+    if api_key and api_key in known_keys:
+        return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]}"
+    return f"ip:{client.client.host if client.client else 'unknown'}"
 
 def create_conversation_message(role: Role, content: str) -> ChatCompletionRequestMessage:
     """
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Any, Dict
+from app.services.tracing import tracer
+
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+)
+
+
+@router.get("/traces")
+async def list_traces(limit: int = Query(default=50, ge=1, le=1000)) -> Dict[str, Any]:
+    """
+    The most recent request timelines, newest first. Empty unless TRACE_ENABLED is set.
+    """
+    return {"status": "success", "data": [trace.to_dict() for trace in tracer.recent(limit)]}
+
+@router.get("/traces/{request_id}")
+async def get_trace(request_id: str) -> Dict[str, Any]:
+    """
+    The timeline of one request, by the id returned in its X-Request-ID header.
+    """
+    trace = tracer.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace for request {request_id}")
+    return {"status": "success", "data": trace.to_dict()}
@@ -1,11 +1,16 @@
 import logging
-import platform
-import psutil
 import time
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from typing import Dict, Any
 
-from app.services.llm_service import llm_service
+from app.services.batch_jobs import batch_jobs
+from app.services.model_registry import model_registry
+from app.services.rate_limiter import rate_limiter
+from app.services.scheduler import scheduler
+from app.services.session_store import session_store
+from app.services.stream_registry import stream_registry
+from app.services.system_sampler import system_sampler
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -21,27 +26,21 @@ router = APIRouter(
 def get_system_info() -> Dict[str, Any]:
     uptime = time.time() - SERVER_START_TIME
     
+    # Served from the background sampler's snapshot, so probes never query the OS
     return {
         "system": {
-            "platform": platform.system(),
-            "platform_version": platform.version(),
-            "python_version": platform.python_version(),
-            "cpu_count": psutil.cpu_count(),
-            "cpu_usage_percent": psutil.cpu_percent(),
-            "memory_total": psutil.virtual_memory().total,
-            "memory_available": psutil.virtual_memory().available,
-            "memory_used_percent": psutil.virtual_memory().percent,
+            **system_sampler.get_snapshot(),
             "uptime_seconds": int(uptime),
             "uptime_formatted": f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m {int(uptime % 60)}s",
         }
     }
 
 @router.get("/")
-def health_check() -> Dict[str, Any]:
+async def health_check() -> Dict[str, Any]:
     system_info = get_system_info()
     
     try:
-        model_stats = llm_service.get_model_stats()
+        model_stats = model_registry.default.get_model_stats()
         model_status = "healthy"
     except Exception as e:
         logger.error(f"Error getting model stats: {e}", exc_info=True)
@@ -50,7 +49,39 @@ def health_check() -> Dict[str, Any]:
     
     return {
         "version": settings.API_VERSION,
+        "status": model_registry.default.status,
+        "worker_id": settings.WORKER_ID or None,
         "model_status": model_status,
         "model_info": model_stats,
+        "models": model_registry.get_stats(),
+        "scheduler": scheduler.get_stats(),
+        "sessions": session_store.get_stats(),
+        "streams": stream_registry.get_stats(),
+        "batches": batch_jobs.get_stats(),
+        "rate_limits": rate_limiter.get_stats(),
         "system_info": system_info
     }
+
+@router.get("/live")
+async def liveness() -> Dict[str, Any]:
+    """
+    Whether the process is up and serving requests, regardless of the model. Touches
+    nothing, so probes can call it as often as they like.
+    """
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness() -> JSONResponse:
+    """
+    Whether the default model has loaded and warmed up: 200 once it is "ready",
+    503 while it is "loading" or "warming" or if it "failed".
+    """
+    return JSONResponse(
+        status_code=200 if model_registry.default.status == "ready" else 503,
+        content={
+            "status": model_registry.default.status,
+            "worker_id": settings.WORKER_ID or None,
+            "startup_timings": model_registry.default.startup_timings,
+            "error": model_registry.default.startup_error,
+        },
+    )
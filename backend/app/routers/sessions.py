@@ -0,0 +1,126 @@
+import logging
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+from app.routers.chat import ChatMessage, create_conversation_message, stream_chat_response
+from app.services.model_registry import ModelNotFoundError, ModelNotReadyError, model_registry
+from app.services.session_store import Session, SessionNotFoundError, session_store
+
+
+class CreateSessionRequest(BaseModel):
+    messages: List[ChatMessage] = []
+    model: Optional[str] = None
+
+class ReplyRequest(BaseModel):
+    message: Optional[ChatMessage] = None
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0)
+    seed: Optional[int] = None
+
+
+router = APIRouter(
+    prefix="/sessions",
+    tags=["sessions"],
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("/", status_code=201)
+async def create_session(request: Optional[CreateSessionRequest] = None) -> Dict[str, Any]:
+    """
+    Start a server-side conversation, optionally seeded with messages (e.g. a system prompt)
+    and bound to a model other than the default.
+    """
+    model = request.model if request else None
+    if model is not None and model not in model_registry.available():
+        raise HTTPException(status_code=404, detail=f"Model {model!r} not found")
+    
+    session = session_store.create(model)
+    for message in request.messages if request else []:
+        await append_message(session, message)
+    logger.info(f"Created session {session.id} with {len(session.messages)} messages")
+    return {"status": "success", "data": session.to_dict()}
+
+@router.get("/{session_id}")
+async def get_session(session_id: str) -> Dict[str, Any]:
+    return {"status": "success", "data": get_session_or_404(session_id).to_dict()}
+
+@router.delete("/{session_id}")
+async def delete_session(session_id: str) -> Dict[str, Any]:
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"status": "success"}
+
+@router.post("/{session_id}/messages")
+async def add_message(session_id: str, message: ChatMessage) -> Dict[str, Any]:
+    """
+    Append a message to a session without generating a reply.
+    """
+    session = get_session_or_404(session_id)
+    await append_message(session, message)
+    return {
+        "status": "success",
+        "data": {"n_messages": len(session.messages), "n_tokens": session.n_tokens},
+    }
+
+@router.post("/{session_id}/reply")
+async def reply(session_id: str, client_request: Request, request: Optional[ReplyRequest] = None) -> StreamingResponse:
+    """
+    Stream the assistant's reply to a session, first appending `message` if one is given.
+    The reply is stored in the session once it has been generated in full.
+    
+    Args:
+        session_id: The session to reply to.
+        client_request: The original FastAPI request object.
+        request: Optionally, a message to append before replying.
+        
+    Returns:
+        A streaming response with the LLM's replies, framed as on `/chat/`.
+    """
+    session = get_session_or_404(session_id)
+    if request is not None and request.message is not None:
+        await append_message(session, request.message)
+    
+    async def store_reply(text: str) -> None:
+        await append_message(session, ChatMessage(role="assistant", content=text))
+    
+    # Copy the history so messages appended while this reply streams don't leak into its prompt
+    return await stream_chat_response(
+        list(session.messages),
+        client_request,
+        on_complete=store_reply,
+        message_tokens=[len(tokens) for tokens in session.message_tokens],
+        temperature=request.temperature if request is not None else None,
+        seed=request.seed if request is not None else None,
+        model=session.model,
+    )
+
+def get_session_or_404(session_id: str) -> Session:
+    try:
+        return session_store.get(session_id)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+async def append_message(session: Session, message: ChatMessage) -> None:
+    """
+    Convert and append a message, tokenizing it once with the session's model so its
+    length is known from then on.
+    """
+    try:
+        conversation_message = create_conversation_message(message.role, message.content)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        service = await model_registry.acquire(session.model)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    try:
+        tokens = service.tokenize(message.content)
+    finally:
+        model_registry.release(service)
+    session_store.append(session, conversation_message, tokens)
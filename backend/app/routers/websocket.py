@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import uuid
+from fastapi import APIRouter, HTTPException, WebSocket
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Annotated, Any, Dict, Literal, Optional, Tuple, Union
+from app.config import settings
+from app.routers.chat import ChatRequest, create_conversation_message, start_chat_reply
+from app.utils.logging_utils import request_id_var
+
+
+class ChatFrame(ChatRequest):
+    type: Literal["chat"]
+    id: str = Field(min_length=1, max_length=64)
+
+class CancelFrame(BaseModel):
+    type: Literal["cancel"]
+    id: str
+
+ClientFrame = TypeAdapter(Annotated[Union[ChatFrame, CancelFrame], Field(discriminator="type")])
+
+
+router = APIRouter(
+    prefix="/ws",
+    tags=["websocket"],
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@router.websocket("/chat")
+async def chat_socket(websocket: WebSocket) -> None:
+    """
+    Chat over one long-lived connection, with any number of replies streaming at once.
+
+    Every frame is a compact JSON object with the `id` of the reply it belongs to,
+    chosen by the client. Clients send `{"type": "chat", "id": ..., "messages": [...]}`
+    (plus the optional fields of a POST to /chat/) to start a reply and
+    `{"type": "cancel", "id": ...}` to stop one. The server answers with frames of type
+    "context", "queue", "text", "trace" and "error" carrying `data`, the same events as
+    the SSE endpoint, then "done"; or "cancelled" once a reply is cancelled. Requests
+    that can't start get an "error" frame with the HTTP `status` and `detail` instead.
+    A reply requested in a binary frame is sent in binary frames (UTF-8 JSON).
+    """
+    await websocket.accept()
+    await ChatConnection(websocket).serve()
+
+
+class ChatConnection:
+    """
+    One WebSocket connection and the replies streaming over it.
+
+    Replies queue their frames for a single writer. At most `WS_SEND_WINDOW` reply
+    frames can be waiting to be sent, after which each reply pauses until the client
+    catches up, which in turn pauses its generation. Control frames ("error",
+    "cancelled") skip the window so a slow reader can still cancel.
+    """
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+        self.id = uuid.uuid4().hex[:12]
+        self.streams: Dict[str, "asyncio.Task[None]"] = {}
+        self._outbox: "asyncio.Queue[Tuple[str, bool, bool]]" = asyncio.Queue()
+        self._window = asyncio.Semaphore(settings.WS_SEND_WINDOW)
+
+    async def serve(self) -> None:
+        client_host = self.websocket.client.host if self.websocket.client else "unknown"
+        logger.info(f"WebSocket connection {self.id} opened by {client_host}")
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                binary = message.get("bytes") is not None
+                await self._handle(message["bytes"] if binary else message.get("text") or "", binary)
+        finally:
+            tasks = [*self.streams.values(), writer]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"WebSocket connection {self.id} closed")
+
+    async def _handle(self, raw: Union[str, bytes], binary: bool) -> None:
+        try:
+            frame = ClientFrame.validate_json(raw)
+        except ValidationError as e:
+            self._send_control({"id": _frame_id(raw), "type": "error", "status": 422, "detail": json.loads(e.json())}, binary)
+            return
+
+        if isinstance(frame, CancelFrame):
+            # Replies that already finished are ignored, as the client can't know in time
+            task = self.streams.pop(frame.id, None)
+            if task is not None:
+                task.cancel()
+                self._send_control({"id": frame.id, "type": "cancelled"}, binary)
+            return
+
+        if frame.id in self.streams:
+            self._send_control({"id": frame.id, "type": "error", "status": 409, "detail": f"Reply {frame.id} is already streaming"}, binary)
+        elif len(self.streams) >= settings.WS_MAX_STREAMS_PER_CONNECTION:
+            self._send_control({
+                "id": frame.id,
+                "type": "error",
+                "status": 429,
+                "detail": f"At most {settings.WS_MAX_STREAMS_PER_CONNECTION} replies can stream at once on a connection",
+            }, binary)
+        else:
+            self.streams[frame.id] = asyncio.create_task(self._reply(frame, binary))
+
+    async def _reply(self, frame: ChatFrame, binary: bool) -> None:
+        request_id_var.set(f"{self.id}:{frame.id}")
+
+        async def emit(event: str, data: Any) -> None:
+            await self._send({"id": frame.id, "type": event, "data": data} if data is not None else {"id": frame.id, "type": event}, binary)
+
+        try:
+            conversation = [create_conversation_message(msg.role, msg.content) for msg in frame.messages]
+            producer = await start_chat_reply(
+                conversation,
+                self.websocket,
+                emit,
+                temperature=frame.temperature,
+                seed=frame.seed,
+                model=frame.model,
+            )
+            # Cancelling this task cancels the producer too
+            await producer
+        except ValueError as e:
+            self._send_control({"id": frame.id, "type": "error", "status": 422, "detail": str(e)}, binary)
+        except HTTPException as e:
+            self._send_control({"id": frame.id, "type": "error", "status": e.status_code, "detail": e.detail}, binary)
+        finally:
+            if self.streams.get(frame.id) is asyncio.current_task():
+                del self.streams[frame.id]
+
+    async def _send(self, frame: Dict[str, Any], binary: bool) -> None:
+        await self._window.acquire()
+        self._outbox.put_nowait((_encode(frame), binary, True))
+
+    def _send_control(self, frame: Dict[str, Any], binary: bool) -> None:
+        self._outbox.put_nowait((_encode(frame), binary, False))
+
+    async def _write(self) -> None:
+        while True:
+            payload, binary, windowed = await self._outbox.get()
+            try:
+                if binary:
+                    await self.websocket.send_bytes(payload.encode("utf-8"))
+                else:
+                    await self.websocket.send_text(payload)
+            finally:
+                if windowed:
+                    self._window.release()
+
+
+def _encode(frame: Dict[str, Any]) -> str:
+    return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+def _frame_id(raw: Union[str, bytes]) -> Optional[str]:
+    """
+    The id of a frame that failed validation, if it has a usable one.
+    """
+    try:
+        frame_id = json.loads(raw).get("id")
+    except (ValueError, AttributeError):
+        return None
+    return frame_id if isinstance(frame_id, str) else None
@@ -0,0 +1,308 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import platform
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import llama_cpp
+import psutil
+from llama_cpp import Llama
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Batch sizes tried for prompt evaluation, capped at the calibration prompt's length
+_BATCH_CANDIDATES = (64, 128, 256, 512, 1024, 2048)
+# Each measurement is repeated and the best run kept, to shrug off one-off stalls
+_REPEATS = 2
+# Measurements stop early after this long, so badly oversubscribed candidates don't stall startup
+_MEASURE_SECONDS = 2.0
+
+_CALIBRATION_TEXT = (
+    "The quick brown fox jumps over the lazy dog while the committee reviews the quarterly "
+    "figures, discusses the weather in three different cities and drafts a short letter "
+    "about the history of bridges, trains and the printing press. "
+)
+
+
+class TuningProfile:
+    """
+    The thread counts and batch size a calibration sweep picked for one model on one
+    host, with the speeds it measured (in tokens per second) for every candidate.
+    """
+
+    def __init__(
+        self,
+        n_threads: int,
+        n_threads_batch: int,
+        n_batch: int,
+        measurements: Dict[str, Dict[str, float]],
+        calibration_seconds: float,
+        created_at: Optional[float] = None,
+    ) -> None:
+        self.n_threads = n_threads
+        self.n_threads_batch = n_threads_batch
+        self.n_batch = n_batch
+        self.measurements = measurements
+        self.calibration_seconds = calibration_seconds
+        self.created_at = created_at or time.time()
+        self.reused = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "n_threads": self.n_threads,
+            "n_threads_batch": self.n_threads_batch,
+            "n_batch": self.n_batch,
+            "measurements": self.measurements,
+            "calibration_seconds": self.calibration_seconds,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TuningProfile":
+        return cls(
+            n_threads=data["n_threads"],
+            n_threads_batch=data["n_threads_batch"],
+            n_batch=data["n_batch"],
+            measurements=data["measurements"],
+            calibration_seconds=data["calibration_seconds"],
+            created_at=data["created_at"],
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "source": "profile" if self.reused else "calibrated",
+            **self.to_dict(),
+            "prompt_tokens_per_second": self.measurements["batch_size"][str(self.n_batch)],
+            "decode_tokens_per_second": self.measurements["decode_threads"][str(self.n_threads)],
+        }
+
+
+def usable_cpus() -> int:
+    """
+    CPUs this process can run on: its affinity mask, further capped by a cgroup CPU
+    quota such as the one `docker run --cpus` sets.
+    """
+    try:
+        n = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            n = min(n, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return n
+
+def cpu_signature(max_threads: int) -> Dict[str, Any]:
+    """
+    What calibration results depend on about the host. Includes the thread limit, so
+    workers given different shares of the CPUs get their own profiles.
+    """
+    cpu_model = platform.processor()
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            cpu_model = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu_model)
+    except OSError:
+        pass
+    return {
+        "machine": platform.machine(),
+        "cpu_model": cpu_model,
+        "physical_cores": psutil.cpu_count(logical=False) or 0,
+        "logical_cores": psutil.cpu_count() or 0,
+        "max_threads": max_threads,
+    }
+
+def model_fingerprint(model_path: str) -> str:
+    """
+    A hash of a model file's size and its first and last MiB, which tells models apart
+    without reading gigabytes of weights.
+    """
+    digest = hashlib.sha256()
+    size = os.path.getsize(model_path)
+    digest.update(str(size).encode("utf-8"))
+    with open(model_path, "rb") as f:
+        digest.update(f.read(1 << 20))
+        f.seek(max(0, size - (1 << 20)))
+        digest.update(f.read(1 << 20))
+    return digest.hexdigest()[:32]
+
+def thread_candidates(max_threads: int, physical_cores: int) -> List[int]:
+    """
+    Thread counts worth trying: powers of two, the physical core count (often fastest
+    with SMT, whose sibling threads share execution units) and the limit itself.
+    """
+    candidates = {max_threads, min(physical_cores, max_threads) if physical_cores else max_threads}
+    n = 1
+    while n < max_threads:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+class AutoTuner:
+    """
+    Picks thread counts and a batch size for a model by measuring them on this host.
+
+    The first start with a given model file and host runs a short calibration sweep:
+    thread counts for prompt evaluation (`n_threads_batch`), then batch sizes with the
+    fastest of those, then thread counts for decoding one token at a time
+    (`n_threads`). The result is saved in `profile_path`, keyed by the model's
+    fingerprint and the CPU signature, and reused by later starts. Workers starting
+    together calibrate one at a time, so they don't skew each other's measurements,
+    and the rest reuse the first one's profile.
+    """
+
+    def __init__(self, profile_path: str, prompt_tokens: int, decode_tokens: int) -> None:
+        self.profile_path = profile_path
+        self.prompt_tokens = prompt_tokens
+        self.decode_tokens = decode_tokens
+
+    def get_profile(self, model_path: str, max_threads: int, n_gpu_layers: int, use_mmap: bool = True) -> TuningProfile:
+        """
+        The saved profile for this model and host, calibrating one first if there is none.
+        Blocks for as long as calibration takes.
+
+        Args:
+            model_path: The model file to tune for.
+            max_threads: The most threads to try, further capped at the CPUs this process can use.
+            n_gpu_layers: Layers offloaded to the GPU, which change what is fastest.
+            use_mmap: Whether to memory-map the model while calibrating.
+        """
+        signature = cpu_signature(min(max_threads, usable_cpus()))
+        key_data = json.dumps({"model": model_fingerprint(model_path), "cpu": signature, "gpu_layers": n_gpu_layers}, sort_keys=True)
+        key = hashlib.sha256(key_data.encode("utf-8")).hexdigest()[:32]
+
+        with self._lock():
+            saved = self._read().get(key)
+            if saved is not None:
+                profile = TuningProfile.from_dict(saved)
+                profile.reused = True
+                logger.info(f"Using saved tuning profile for {model_path}: {profile.n_threads} decode threads, "
+                            f"{profile.n_threads_batch} prompt threads, batch size {profile.n_batch}")
+                return profile
+
+            profile = self.calibrate(model_path, thread_candidates(signature["max_threads"], signature["physical_cores"]), n_gpu_layers, use_mmap)
+            profiles = self._read()
+            profiles[key] = {**profile.to_dict(), "model_path": model_path, "cpu": signature}
+            self._write(profiles)
+        return profile
+
+    def calibrate(self, model_path: str, threads: Sequence[int], n_gpu_layers: int, use_mmap: bool = True) -> TuningProfile:
+        """
+        Measure prompt evaluation and decoding speeds for each candidate and keep the fastest.
+        """
+        started = time.perf_counter()
+        batch_sizes = [b for b in _BATCH_CANDIDATES if b < self.prompt_tokens] + [self.prompt_tokens]
+        logger.info(f"Calibrating {model_path} over threads {list(threads)} and batch sizes {batch_sizes}")
+
+        llm = Llama(
+            model_path=model_path,
+            n_ctx=self.prompt_tokens + self.decode_tokens + 1,
+            n_batch=max(batch_sizes),
+            n_gpu_layers=n_gpu_layers,
+            use_mmap=use_mmap,
+            verbose=False,
+        )
+        ctx = llm._ctx.ctx
+        tokens = llm.tokenize(_CALIBRATION_TEXT.encode("utf-8"))
+        prompt = (tokens * (self.prompt_tokens // len(tokens) + 1))[:self.prompt_tokens]
+        # Page in the weights and allocate compute buffers before timing anything
+        self._measure_prompt(llm, prompt, max(batch_sizes))
+
+        prompt_rates: Dict[int, float] = {}
+        for n in threads:
+            llama_cpp.llama_set_n_threads(ctx, n, n)
+            prompt_rates[n] = self._best(lambda: self._measure_prompt(llm, prompt, max(batch_sizes)))
+        n_threads_batch = max(prompt_rates, key=lambda n: prompt_rates[n])
+
+        llama_cpp.llama_set_n_threads(ctx, n_threads_batch, n_threads_batch)
+        batch_rates = {b: self._best(lambda: self._measure_prompt(llm, prompt, b)) for b in batch_sizes}
+        n_batch = max(batch_rates, key=lambda b: batch_rates[b])
+
+        decode_rates: Dict[int, float] = {}
+        for n in threads:
+            llama_cpp.llama_set_n_threads(ctx, n, n_threads_batch)
+            decode_rates[n] = self._best(lambda: self._measure_decode(llm, prompt))
+        n_threads = max(decode_rates, key=lambda n: decode_rates[n])
+        del llm
+
+        profile = TuningProfile(
+            n_threads=n_threads,
+            n_threads_batch=n_threads_batch,
+            n_batch=n_batch,
+            measurements={
+                "prompt_threads": {str(n): rate for n, rate in prompt_rates.items()},
+                "batch_size": {str(b): rate for b, rate in batch_rates.items()},
+                "decode_threads": {str(n): rate for n, rate in decode_rates.items()},
+            },
+            calibration_seconds=round(time.perf_counter() - started, 3),
+        )
+        logger.info(f"Calibrated {model_path} in {profile.calibration_seconds:.1f}s: {n_threads} decode threads "
+                    f"({decode_rates[n_threads]} tok/s), {n_threads_batch} prompt threads and batch size {n_batch} "
+                    f"({batch_rates[n_batch]} tok/s)")
+        return profile
+
+    def _best(self, measure: Any) -> float:
+        return round(max(measure() for _ in range(_REPEATS)), 2)
+
+    def _measure_prompt(self, llm: Llama, prompt: List[int], n_batch: int) -> float:
+        llm.reset()
+        started = time.perf_counter()
+        for i in range(0, len(prompt), n_batch):
+            llm.eval(prompt[i:i + n_batch])
+            if time.perf_counter() - started > _MEASURE_SECONDS:
+                break
+        return llm.n_tokens / (time.perf_counter() - started)
+
+    def _measure_decode(self, llm: Llama, prompt: List[int]) -> float:
+        # A short context to decode after; the tokens' values don't matter for timing
+        llm.reset()
+        llm.eval(prompt[:8])
+        started = time.perf_counter()
+        for token in prompt[8:8 + self.decode_tokens]:
+            llm.eval([token])
+            if time.perf_counter() - started > _MEASURE_SECONDS:
+                break
+        return (llm.n_tokens - 8) / (time.perf_counter() - started)
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(os.path.abspath(self.profile_path)), exist_ok=True)
+        with open(f"{self.profile_path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.profile_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable tuning profiles in {self.profile_path}: {e}")
+            return {}
+
+    def _write(self, profiles: Dict[str, Any]) -> None:
+        temporary = f"{self.profile_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(temporary, self.profile_path)
+
+
+autotuner = AutoTuner(
+    profile_path=settings.AUTOTUNE_PROFILE_PATH,
+    prompt_tokens=settings.AUTOTUNE_PROMPT_TOKENS,
+    decode_tokens=settings.AUTOTUNE_DECODE_TOKENS,
+)
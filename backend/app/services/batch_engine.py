@@ -0,0 +1,505 @@
+import asyncio
+import codecs
+import ctypes
+import logging
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import llama_cpp
+import numpy as np
+from llama_cpp import ChatCompletionRequestMessage
+
+from app.services.sampling import Sampler, find_stop, partial_stop_length
+from app.services.speculative import Drafter
+from app.services.token_stream import TokenStream
+from app.services.tracing import Trace
+from app.utils.prompt_utils import common_prefix_length, format_prompt, verify_chat_format
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationRequest:
+    """
+    A single conversation waiting for, or occupying, a decode slot.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        stops: List[str],
+        max_tokens: int,
+        sampler: Sampler,
+        output: TokenStream,
+        usage: Optional[Dict[str, int]] = None,
+        trace: Optional[Trace] = None,
+    ) -> None:
+        self.prompt = prompt
+        self.stops = stops
+        self.max_tokens = max_tokens
+        self.sampler = sampler
+        # Unbounded: one slow client must never stall the step shared by every slot
+        self.output = output
+        self.usage = usage if usage is not None else {}
+        self.trace = trace
+
+
+class Slot:
+    """
+    One llama.cpp sequence id and the per-sequence decode state attached to it.
+    """
+
+    def __init__(self, seq_id: int) -> None:
+        self.seq_id = seq_id
+        self.request: Optional[GenerationRequest] = None
+        self.tokens: List[int] = []
+        self.n_past = 0
+        self.n_prompt = 0
+        self.n_generated = 0
+        self.next_token: Optional[int] = None
+        self.text = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def free(self) -> bool:
+        return self.request is None
+
+    @property
+    def prefilling(self) -> bool:
+        return self.n_past < len(self.tokens) and self.next_token is None
+
+    def assign(self, request: GenerationRequest, tokens: List[int], n_reused: int) -> None:
+        self.request = request
+        self.tokens = tokens
+        self.n_past = n_reused
+        self.n_prompt = len(tokens)
+        self.n_generated = 0
+        self.next_token = None
+        self.text = ""
+        self.decoder.reset()
+
+    def clear(self) -> None:
+        # The evaluated tokens stay in the KV cache for the next request to reuse
+        self.request = None
+        self.next_token = None
+
+    def reset(self) -> None:
+        self.clear()
+        self.tokens = []
+        self.n_past = 0
+
+
+class BatchEngine:
+    """
+    Continuous batching over a single llama.cpp context.
+
+    The context is split into `n_slots` sequences of `slot_ctx` tokens each. A
+    dedicated thread repeatedly builds one batch containing the next token of
+    every decoding slot plus as much pending prompt as fits in `n_batch`, runs
+    `llama_decode` once, and samples every slot that produced logits. New requests
+    are admitted as soon as a slot frees up, so short replies never wait for long
+    ones to finish.
+
+    Finished slots keep their KV cache. A new request goes to the free slot that
+    already holds the longest prefix of its prompt, so the next turn of a
+    conversation only evaluates the newly appended messages.
+
+    With a `drafter`, each decoding slot also puts up to `n_draft` guessed tokens
+    in the batch after its next token. The slot's sampler then runs over each
+    position in turn; every guess it agrees with is kept and saves a whole step,
+    and the first disagreement ends the run. Since the sampler draws exactly once
+    per emitted token, the output is identical to decoding without drafts.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        n_slots: int,
+        slot_ctx: int,
+        n_batch: int,
+        n_threads: Optional[int],
+        n_gpu_layers: int,
+        chat_format: str,
+        n_threads_batch: Optional[int] = None,
+        use_mmap: bool = True,
+        use_mlock: bool = False,
+        drafter: Optional[Drafter] = None,
+        n_draft: int = 4,
+    ) -> None:
+        self.n_slots = n_slots
+        self.slot_ctx = slot_ctx
+        self.n_batch = n_batch
+        verify_chat_format(chat_format)
+        self.chat_format = chat_format
+
+        step = time.perf_counter()
+        model_params = llama_cpp.llama_model_default_params()
+        model_params.n_gpu_layers = 0x7FFFFFFF if n_gpu_layers == -1 else n_gpu_layers
+        model_params.use_mmap = use_mmap
+        model_params.use_mlock = use_mlock
+        self.model = llama_cpp.llama_load_model_from_file(model_path.encode("utf-8"), model_params)
+        if not self.model:
+            raise RuntimeError(f"Failed to load model from {model_path}")
+        self.load_timings = {"model_load": round(time.perf_counter() - step, 3)}
+
+        step = time.perf_counter()
+        ctx_params = llama_cpp.llama_context_default_params()
+        ctx_params.n_ctx = n_slots * slot_ctx
+        ctx_params.n_batch = n_batch
+        if n_threads:
+            ctx_params.n_threads = n_threads
+            ctx_params.n_threads_batch = n_threads
+        if n_threads_batch:
+            ctx_params.n_threads_batch = n_threads_batch
+        self.ctx = llama_cpp.llama_new_context_with_model(self.model, ctx_params)
+        if not self.ctx:
+            llama_cpp.llama_free_model(self.model)
+            raise RuntimeError("Failed to create llama.cpp context")
+        self.load_timings["context_alloc"] = round(time.perf_counter() - step, 3)
+
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+        self.n_vocab = llama_cpp.llama_n_vocab(self.model)
+        if drafter is not None and drafter.n_vocab not in (None, self.n_vocab):
+            llama_cpp.llama_batch_free(self.batch)
+            llama_cpp.llama_free(self.ctx)
+            llama_cpp.llama_free_model(self.model)
+            raise ValueError(f"The draft model's vocabulary has {drafter.n_vocab} tokens but the model's has {self.n_vocab}")
+        self.token_eos = llama_cpp.llama_token_eos(self.model)
+        self._piece_buffer = ctypes.create_string_buffer(64)
+
+        self.slots = [Slot(seq_id) for seq_id in range(n_slots)]
+        self._pending: "queue.Queue[Optional[GenerationRequest]]" = queue.Queue()
+        self._running = True
+
+        self._steps = 0
+        self._tokens_decoded = 0
+        self._tokens_generated = 0
+        self._decode_time = 0.0
+        self._prefix_hits = 0
+        self._prefix_misses = 0
+        self._prefix_tokens_reused = 0
+
+        self.drafter = drafter
+        self.n_draft = n_draft
+        self._drafted = 0
+        self._accepted = 0
+
+        self._thread = threading.Thread(target=self._run, name="llm-batch-engine", daemon=True)
+        self._thread.start()
+        logger.info(f"Batch engine started with {n_slots} slots of {slot_ctx} tokens")
+
+    def close(self) -> None:
+        """
+        Stop the engine thread and free the llama.cpp context and model.
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._pending.put(None)
+        self._thread.join()
+        llama_cpp.llama_batch_free(self.batch)
+        llama_cpp.llama_free(self.ctx)
+        llama_cpp.llama_free_model(self.model)
+        if self.drafter is not None:
+            self.drafter.close()
+
+    async def generate(
+        self,
+        conversation: List[ChatCompletionRequestMessage],
+        temperature: float,
+        max_tokens: int,
+        seed: Optional[int] = None,
+        usage: Optional[Dict[str, int]] = None,
+        trace: Optional[Trace] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Queue a conversation for generation and stream back its text as it is produced.
+        If given, `usage` receives the prompt and completion token counts once the
+        request finishes, and `trace` when its prompt evaluation starts and ends.
+
+        Raises:
+            ValueError: If the prompt does not fit in a slot.
+            RuntimeError: If decoding fails.
+        """
+        prompt, stops = format_prompt(conversation, self.chat_format)
+
+        output = TokenStream(asyncio.get_running_loop())
+        self._pending.put(GenerationRequest(
+            prompt=prompt,
+            stops=stops,
+            max_tokens=max_tokens,
+            sampler=Sampler(temperature=temperature, seed=seed),
+            output=output,
+            usage=usage,
+            trace=trace,
+        ))
+
+        try:
+            async for text in output:
+                yield text
+        finally:
+            output.cancel()
+
+    def tokenize(self, text: str, add_bos: bool = True) -> List[int]:
+        data = text.encode("utf-8")
+        buffer = (llama_cpp.llama_token * (len(data) + 2))()
+        n_tokens = llama_cpp.llama_tokenize(self.model, data, len(data), buffer, len(buffer), add_bos, True)
+        if n_tokens < 0:
+            raise RuntimeError(f"Failed to tokenize prompt ({n_tokens})")
+        return list(buffer[:n_tokens])
+
+    def _token_to_bytes(self, token: int) -> bytes:
+        n = llama_cpp.llama_token_to_piece(self.model, token, self._piece_buffer, len(self._piece_buffer))
+        return self._piece_buffer.raw[:n]
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                self._admit_pending()
+                if all(slot.free for slot in self.slots):
+                    continue
+                self._step()
+            except Exception as e:
+                logger.error(f"Batch engine step failed: {e}", exc_info=True)
+                for slot in self.slots:
+                    if not slot.free:
+                        self._finish(slot, error=RuntimeError(f"Batch decode failed: {e}"))
+
+    def _admit_pending(self) -> None:
+        while any(slot.free for slot in self.slots):
+            # Block for new work only when the engine has nothing else to do
+            idle = all(slot.free for slot in self.slots)
+            try:
+                request = self._pending.get(block=idle)
+            except queue.Empty:
+                return
+            if request is None:
+                return
+            if request.output.cancelled.is_set():
+                continue
+
+            try:
+                tokens = self.tokenize(request.prompt)
+                if len(tokens) + 1 >= self.slot_ctx:
+                    raise ValueError(f"Prompt of {len(tokens)} tokens does not fit in a {self.slot_ctx} token slot")
+            except Exception as e:
+                request.output.close(e)
+                continue
+
+            slot, reused = self._pick_slot(tokens)
+            llama_cpp.llama_kv_cache_seq_rm(self.ctx, slot.seq_id, reused, -1)
+            slot.assign(request, tokens, reused)
+            if request.trace is not None:
+                request.trace.mark("prompt_eval_start")
+
+            if reused:
+                self._prefix_hits += 1
+                self._prefix_tokens_reused += reused
+            else:
+                self._prefix_misses += 1
+
+    def _pick_slot(self, tokens: List[int]) -> Tuple[Slot, int]:
+        """
+        Choose the free slot whose KV cache already holds the longest prefix of `tokens`,
+        so a follow-up turn of a conversation only has to evaluate the new messages.
+
+        Returns:
+            The slot and the number of prompt tokens that can be reused from it.
+        """
+        best: Optional[Slot] = None
+        best_reused = -1
+        for slot in self.slots:
+            if not slot.free:
+                continue
+            # At least one prompt token must be evaluated to get logits for sampling
+            reused = min(common_prefix_length(slot.tokens[:slot.n_past], tokens), len(tokens) - 1)
+            if reused > best_reused or (reused == best_reused and best is not None and slot.n_past < best.n_past):
+                best, best_reused = slot, reused
+        assert best is not None
+        return best, best_reused
+
+    def _step(self) -> None:
+        batch = self.batch
+        n = 0
+        logits_index: Dict[int, List[int]] = {}
+        drafts: Dict[int, List[int]] = {}
+
+        for slot in self.slots:
+            if slot.request is not None and slot.request.output.cancelled.is_set():
+                self._finish(slot)
+
+        # One token for every slot that is already decoding, plus any drafts after it
+        decoding = [slot for slot in self.slots if not slot.free and slot.next_token is not None]
+        for i, slot in enumerate(decoding):
+            assert slot.next_token is not None and slot.request is not None
+            slot.tokens.append(slot.next_token)
+            slot.next_token = None
+            # Leave room for the next token of every slot still to be added
+            drafted = self._draft(slot, self.n_batch - n - (len(decoding) - i))
+
+            logits_index[slot.seq_id] = []
+            for j, token in enumerate(slot.tokens[-1:] + drafted):
+                self._add(n, token, slot.n_past + j, slot.seq_id, True)
+                logits_index[slot.seq_id].append(n)
+                n += 1
+            slot.n_past += 1
+            if drafted:
+                drafts[slot.seq_id] = drafted
+
+        # Fill the rest of the batch with prompt tokens
+        for slot in self.slots:
+            if slot.free or not slot.prefilling or n >= self.n_batch:
+                continue
+            chunk = slot.tokens[slot.n_past:slot.n_past + (self.n_batch - n)]
+            for i, token in enumerate(chunk):
+                last = slot.n_past + i == len(slot.tokens) - 1
+                self._add(n, token, slot.n_past + i, slot.seq_id, last)
+                if last:
+                    logits_index[slot.seq_id] = [n]
+                n += 1
+            slot.n_past += len(chunk)
+
+        if n == 0:
+            return
+
+        batch.n_tokens = n
+        start = time.perf_counter()
+        result = llama_cpp.llama_decode(self.ctx, batch)
+        self._decode_time += time.perf_counter() - start
+        if result != 0:
+            raise RuntimeError(f"llama_decode returned {result}")
+        self._steps += 1
+        self._tokens_decoded += n
+
+        for slot in self.slots:
+            if slot.free or slot.seq_id not in logits_index:
+                continue
+            drafted = drafts.get(slot.seq_id, [])
+            for j, index in enumerate(logits_index[slot.seq_id]):
+                if j > 0:
+                    # The previous draft was accepted, and is already in the KV cache
+                    slot.tokens.append(drafted[j - 1])
+                    slot.next_token = None
+                    slot.n_past += 1
+                    self._accepted += 1
+                if slot.n_generated == 0 and slot.request.trace is not None:  # type: ignore[union-attr]
+                    slot.request.trace.mark("prompt_eval_end")  # type: ignore[union-attr]
+                logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(self.ctx, index), shape=(self.n_vocab,))
+                token = slot.request.sampler.sample(logits, slot.tokens)  # type: ignore[union-attr]
+                self._emit(slot, token)
+                if slot.free or j == len(drafted) or token != drafted[j]:
+                    break
+            if drafted:
+                # Drop the rejected drafts from the cache
+                llama_cpp.llama_kv_cache_seq_rm(self.ctx, slot.seq_id, slot.n_past, -1)
+
+    def _draft(self, slot: Slot, room: int) -> List[int]:
+        """
+        Guess the tokens following a decoding slot's sequence, limited to what fits in
+        `room` batch positions, the slot's context and the reply's remaining length.
+        """
+        if self.drafter is None or slot.request is None:
+            return []
+        n = min(
+            self.n_draft,
+            room,
+            self.slot_ctx - slot.n_past - 2,
+            slot.request.max_tokens - slot.n_generated - 1,
+        )
+        if n <= 0:
+            return []
+        try:
+            drafted = self.drafter.draft(slot.seq_id, slot.tokens, n)[:n]
+        except Exception as e:
+            logger.warning(f"Drafting failed, decoding without drafts: {e}")
+            return []
+        self._drafted += len(drafted)
+        return drafted
+
+    def _add(self, i: int, token: int, pos: int, seq_id: int, logits: bool) -> None:
+        self.batch.token[i] = token
+        self.batch.pos[i] = pos
+        self.batch.n_seq_id[i] = 1
+        self.batch.seq_id[i][0] = seq_id
+        self.batch.logits[i] = logits
+
+    def _emit(self, slot: Slot, token: int) -> None:
+        request = slot.request
+        assert request is not None
+
+        if token == self.token_eos:
+            self._finish(slot)
+            return
+
+        slot.n_generated += 1
+        self._tokens_generated += 1
+        slot.text += slot.decoder.decode(self._token_to_bytes(token))
+
+        stop_at = find_stop(slot.text, request.stops)
+        if stop_at >= 0:
+            slot.text = slot.text[:stop_at]
+            self._finish(slot)
+            return
+
+        held = partial_stop_length(slot.text, request.stops)
+        ready, slot.text = slot.text[:len(slot.text) - held], slot.text[len(slot.text) - held:]
+        if ready:
+            request.output.put(ready)
+
+        if slot.n_generated >= request.max_tokens or slot.n_past + 1 >= self.slot_ctx:
+            self._finish(slot)
+        else:
+            slot.next_token = token
+
+    def _finish(self, slot: Slot, error: Optional[Exception] = None) -> None:
+        request = slot.request
+        assert request is not None
+
+        if error is None and slot.text:
+            request.output.put(slot.text)
+        request.usage["prompt_tokens"] = slot.n_prompt
+        request.usage["completion_tokens"] = slot.n_generated
+        request.output.close(error)
+
+        if error is None:
+            slot.clear()
+        else:
+            llama_cpp.llama_kv_cache_seq_rm(self.ctx, slot.seq_id, -1, -1)
+            slot.reset()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "batched",
+            "slots": self.n_slots,
+            "slot_context": self.slot_ctx,
+            "batch_size": self.n_batch,
+            "active_slots": sum(1 for slot in self.slots if not slot.free),
+            "pending_requests": self._pending.qsize(),
+            "decode_steps": self._steps,
+            "tokens_decoded": self._tokens_decoded,
+            "tokens_generated": self._tokens_generated,
+            "decode_tokens_per_second": round(self._tokens_decoded / self._decode_time, 2) if self._decode_time else 0.0,
+            "speculative": self.get_speculative_stats(),
+        }
+
+    def get_speculative_stats(self) -> Dict[str, Any]:
+        if self.drafter is None:
+            return {"mode": "disabled"}
+        return {
+            "mode": self.drafter.mode,
+            "max_draft_tokens": self.n_draft,
+            "drafted_tokens": self._drafted,
+            "accepted_tokens": self._accepted,
+            "acceptance_rate": round(self._accepted / self._drafted, 3) if self._drafted else 0.0,
+            "tokens_per_step": round(self._tokens_generated / self._steps, 3) if self._steps else 0.0,
+        }
+
+    def get_prefix_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "slot-affinity",
+            "hits": self._prefix_hits,
+            "misses": self._prefix_misses,
+            "tokens_reused": self._prefix_tokens_reused,
+            "cached_tokens": sum(slot.n_past for slot in self.slots if slot.free),
+        }
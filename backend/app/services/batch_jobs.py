@@ -0,0 +1,384 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import suppress
+from typing import Any, Dict, List, Optional, Set
+
+from llama_cpp import ChatCompletionRequestMessage
+
+from app.config import settings
+from app.services.llm_service import LLMService
+from app.services.model_registry import ModelNotReadyError, ModelRegistry, model_registry
+from app.services.scheduler import RequestScheduler, scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJobNotFoundError(Exception):
+    """
+    Raised when a batch job does not exist.
+    """
+
+    def __init__(self, job_id: str) -> None:
+        super().__init__(f"Batch job {job_id} not found")
+        self.job_id = job_id
+
+
+class _Preempted(Exception):
+    pass
+
+
+class BatchJob:
+    """
+    A set of conversations to reply to offline, stored in its own directory:
+    `input.jsonl` holds the conversations, `results.jsonl` one line per finished
+    conversation (in completion order) and `job.json` the job's settings and status.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        directory: str,
+        n_items: int,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        seed: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        created_at: Optional[float] = None,
+    ) -> None:
+        self.id = job_id
+        self.directory = directory
+        self.n_items = n_items
+        self.model = model
+        self.temperature = temperature
+        self.seed = seed
+        self.max_tokens = max_tokens
+        self.created_at = created_at or time.time()
+        self.finished_at: Optional[float] = None
+        self.status = "queued"
+        self.error: Optional[str] = None
+
+        self.done: Set[int] = set()
+        self.failed = 0
+        self.preemptions = 0
+        # Conversations being replied to, cancelled if the job is deleted
+        self.running: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.directory, "input.jsonl")
+
+    @property
+    def results_path(self) -> str:
+        return os.path.join(self.directory, "results.jsonl")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "job.json")
+
+    def save(self) -> None:
+        temp_path = f"{self.meta_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "id": self.id,
+                "n_items": self.n_items,
+                "model": self.model,
+                "temperature": self.temperature,
+                "seed": self.seed,
+                "max_tokens": self.max_tokens,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "status": self.status,
+                "error": self.error,
+            }, f)
+        os.replace(temp_path, self.meta_path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "model": self.model,
+            "total": self.n_items,
+            "completed": len(self.done) - self.failed,
+            "failed": self.failed,
+            "preemptions": self.preemptions,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+def prefix_order(items: List[Dict[str, Any]]) -> List[int]:
+    """
+    Order conversations so that those sharing leading messages (typically the system
+    prompt) run back to back, keeping the shared prefix in the model's cache.
+    Conversations with the same prefix keep their input order.
+    """
+    def key(index: int) -> List[List[str]]:
+        return [[m["role"], m["content"]] for m in items[index]["messages"][:-1]]
+
+    return sorted(range(len(items)), key=key)
+
+
+def _truncate_partial_line(path: str) -> None:
+    """
+    Cut off an unfinished last line, so the next append starts on a line of its own.
+    """
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class BatchJobStore:
+    """
+    Batch jobs and the background runner that works through them, one job at a time
+    in submission order.
+
+    Conversations run as background tickets in `scheduler`, so they only use
+    capacity interactive requests leave idle. A preempted conversation is abandoned
+    and retried later. Every finished conversation is appended to the job's results
+    straight away, so after a restart a job resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        concurrency: int,
+        scheduler: RequestScheduler,
+        registry: ModelRegistry,
+    ) -> None:
+        self.directory = directory
+        self.concurrency = concurrency
+        self.scheduler = scheduler
+        self.registry = registry
+
+        self._jobs: Dict[str, BatchJob] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def create(
+        self,
+        items: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        seed: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+    ) -> BatchJob:
+        """
+        Store a new job and queue it.
+
+        Args:
+            items: Conversations as {"id": optional caller id, "messages": [...]}.
+        """
+        job_id = uuid.uuid4().hex
+        job = BatchJob(job_id, os.path.join(self.directory, job_id), len(items), model, temperature, seed, max_tokens)
+        os.makedirs(job.directory)
+        with open(job.input_path, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+        job.save()
+
+        self._jobs[job_id] = job
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Created batch job {job_id} with {len(items)} conversations")
+        return job
+
+    def get(self, job_id: str) -> BatchJob:
+        """
+        Raises:
+            BatchJobNotFoundError: If there is no job with that id.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise BatchJobNotFoundError(job_id)
+        return job
+
+    def list(self) -> List[BatchJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def delete(self, job_id: str) -> None:
+        """
+        Cancel a job if it is still running and remove it with its results.
+
+        Raises:
+            BatchJobNotFoundError: If there is no job with that id.
+        """
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            raise BatchJobNotFoundError(job_id)
+        job.status = "cancelled"
+        # Gives their scheduler tickets and model leases back straight away
+        for task in job.running:
+            task.cancel()
+        shutil.rmtree(job.directory, ignore_errors=True)
+        logger.info(f"Deleted batch job {job_id}")
+
+    def _load(self) -> None:
+        for job_id in sorted(os.listdir(self.directory)):
+            meta_path = os.path.join(self.directory, job_id, "job.json")
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            job = BatchJob(
+                job_id, os.path.join(self.directory, job_id), meta["n_items"], meta["model"],
+                meta["temperature"], meta["seed"], meta["max_tokens"], meta["created_at"],
+            )
+            job.status = meta["status"]
+            job.finished_at = meta["finished_at"]
+            job.error = meta["error"]
+            if os.path.exists(job.results_path):
+                # A line cut short by a crash is dropped, and that conversation runs again
+                _truncate_partial_line(job.results_path)
+                with open(job.results_path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            result = json.loads(line)
+                        except ValueError:
+                            continue
+                        job.done.add(result["index"])
+                        job.failed += result["error"] is not None
+            if job.status == "running":
+                job.status = "queued"
+            self._jobs[job_id] = job
+
+        resumed = sum(1 for job in self._jobs.values() if job.status == "queued")
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished batch jobs from {self.directory}")
+
+    async def run(self) -> None:
+        """
+        Process queued jobs until cancelled.
+        """
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            await self.process_pending()
+            await self._wakeup.wait()
+
+    async def process_pending(self) -> None:
+        """
+        Process every queued job, including ones submitted meanwhile.
+        """
+        while True:
+            job = next((job for job in self.list() if job.status == "queued"), None)
+            if job is None:
+                return
+            await self._process(job)
+
+    async def _process(self, job: BatchJob) -> None:
+        job.status = "running"
+        job.save()
+        try:
+            with open(job.input_path, encoding="utf-8") as f:
+                items = [json.loads(line) for line in f]
+            remaining = [i for i in prefix_order(items) if i not in job.done]
+            logger.info(f"Running batch job {job.id}: {len(remaining)} of {job.n_items} conversations left")
+
+            async def worker() -> None:
+                while remaining and job.status == "running":
+                    index = remaining.pop(0)
+                    task = asyncio.create_task(self._run_item(job, index, items[index]))
+                    job.running.add(task)
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        if job.status != "cancelled":
+                            raise
+                    finally:
+                        job.running.discard(task)
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        except Exception as e:
+            logger.error(f"Batch job {job.id} failed: {e}", exc_info=True)
+            job.status = "failed"
+            job.error = str(e)
+
+        if job.status == "running":
+            job.status = "completed"
+        if job.status != "cancelled":
+            job.finished_at = time.time()
+            job.save()
+            logger.info(f"Batch job {job.id} {job.status}: {len(job.done)} of {job.n_items} conversations done")
+
+    async def _run_item(self, job: BatchJob, index: int, item: Dict[str, Any]) -> None:
+        while True:
+            try:
+                reply: Optional[str] = await self._generate(job, item["messages"])
+                error = None
+                break
+            except _Preempted:
+                job.preemptions += 1
+            except ModelNotReadyError:
+                await asyncio.sleep(5)
+            except (ValueError, RuntimeError) as e:
+                reply, error = None, str(e)
+                break
+
+        # The job may have been deleted while this conversation was running
+        if job.status != "running":
+            return
+        with open(job.results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"index": index, "id": item.get("id"), "reply": reply, "error": error}) + "\n")
+        job.done.add(index)
+        job.failed += error is not None
+
+    async def _generate(self, job: BatchJob, messages: List[ChatCompletionRequestMessage]) -> str:
+        """
+        Reply to one conversation in a background slot.
+
+        Raises:
+            _Preempted: If an interactive request needed the slot first.
+        """
+        # The model is only leased once the slot is ours, so queued items don't hold
+        # it and block swaps and evictions while they wait
+        ticket = self.scheduler.submit(f"batch:{job.id}", background=True)
+        service: Optional[LLMService] = None
+        try:
+            await self.scheduler.acquire(ticket)
+            service = await self.registry.acquire(job.model)
+            window = service.fit_context(messages)
+            max_tokens = min(window.max_tokens, job.max_tokens) if job.max_tokens else window.max_tokens
+
+            async def collect() -> str:
+                stream = service.get_llm_response_stream(window.messages, max_tokens=max_tokens, temperature=job.temperature, seed=job.seed)
+                return "".join([part async for part in stream])
+
+            generation = asyncio.create_task(collect())
+            preempted = asyncio.create_task(ticket.preempted.wait())
+            await asyncio.wait({generation, preempted}, return_when=asyncio.FIRST_COMPLETED)
+            preempted.cancel()
+            if not generation.done():
+                generation.cancel()
+                with suppress(asyncio.CancelledError):
+                    await generation
+                raise _Preempted()
+            return generation.result()
+        finally:
+            self.scheduler.release(ticket)
+            if service is not None:
+                self.registry.release(service)
+
+    def get_stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"jobs": statuses}
+
+
+batch_jobs = BatchJobStore(
+    # Each worker process keeps its own jobs
+    directory=os.path.join(settings.BATCH_JOBS_DIR, settings.WORKER_ID),
+    concurrency=settings.BATCH_JOB_CONCURRENCY,
+    scheduler=scheduler,
+    registry=model_registry,
+)
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from llama_cpp import ChatCompletionRequestMessage, ChatCompletionRequestSystemMessage
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[Optional[str], List[ChatCompletionRequestMessage]], Awaitable[str]]
+
+
+class ContextWindow:
+    """
+    A conversation fitted to the model's context, and what had to go to make it fit.
+    """
+
+    def __init__(
+        self,
+        messages: List[ChatCompletionRequestMessage],
+        prompt_tokens: int,
+        max_tokens: int,
+        dropped_messages: int,
+        summarized: bool,
+    ) -> None:
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.dropped_messages = dropped_messages
+        self.summarized = summarized
+
+    @property
+    def trimmed(self) -> bool:
+        return self.dropped_messages > 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "max_tokens": self.max_tokens,
+            "dropped_messages": self.dropped_messages,
+            "summarized": self.summarized,
+        }
+
+
+class ContextManager:
+    """
+    Fits conversations into a fixed token budget before they reach the model.
+
+    Prompts are kept to `context_tokens - reserve_tokens`, leaving at least
+    `reserve_tokens` for the reply. When a conversation is too long the oldest
+    turns are dropped, always keeping system messages and the latest message.
+    With the "summary" policy the dropped turns are summarized in the background
+    and the most recent summary covering them is sent in their place, so the
+    model keeps the gist of the whole conversation.
+
+    Message lengths are tokenized once and cached by content, since the stateless
+    API resends the same history on every turn.
+    """
+
+    def __init__(
+        self,
+        context_tokens: int,
+        reserve_tokens: int,
+        max_tokens: int,
+        tokenize: Callable[[str], List[int]],
+        message_overhead: int,
+        policy: str = "truncate",
+        summarize: Optional[Summarizer] = None,
+        cache_size: int = 4096,
+    ) -> None:
+        if policy not in ("truncate", "summary"):
+            raise ValueError(f"Unknown context policy {policy!r} (supported: ['truncate', 'summary'])")
+        if policy == "summary" and summarize is None:
+            raise ValueError("The summary policy needs a summarizer")
+
+        self.context_tokens = context_tokens
+        self.reserve_tokens = reserve_tokens
+        self.max_tokens = max_tokens
+        self.message_overhead = message_overhead
+        self.policy = policy
+
+        self._tokenize = tokenize
+        self._summarize = summarize
+        self._cache_size = cache_size
+        self._token_counts: "OrderedDict[str, int]" = OrderedDict()
+        self._summaries: "OrderedDict[int, str]" = OrderedDict()
+        self._summarizing: Set[int] = set()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+        self._trimmed_requests = 0
+        self._dropped_messages = 0
+        self._summaries_used = 0
+
+    @property
+    def prompt_budget(self) -> int:
+        return self.context_tokens - self.reserve_tokens
+
+    def count_tokens(self, content: str) -> int:
+        """
+        Number of tokens in a message's content, tokenizing it only the first time it is seen.
+        """
+        count = self._token_counts.get(content)
+        if count is None:
+            count = len(self._tokenize(content))
+            self._token_counts[content] = count
+            if len(self._token_counts) > self._cache_size:
+                self._token_counts.popitem(last=False)
+        else:
+            self._token_counts.move_to_end(content)
+        return count
+
+    def fit(
+        self,
+        conversation: List[ChatCompletionRequestMessage],
+        message_tokens: Optional[List[int]] = None,
+    ) -> ContextWindow:
+        """
+        Trim a conversation to the prompt budget.
+
+        Args:
+            conversation: The full conversation, oldest message first.
+            message_tokens: Known content token counts for each message, if the caller
+                already has them (e.g. from a session); otherwise they are counted here.
+
+        Returns:
+            The messages to send and the completion length they leave room for.
+
+        Raises:
+            ValueError: If the system messages and latest message alone don't fit.
+        """
+        if message_tokens is None:
+            message_tokens = [self.count_tokens(m["content"] or "") for m in conversation]  # type: ignore[typeddict-item]
+        costs = [n + self.message_overhead for n in message_tokens]
+
+        total = sum(costs)
+        droppable = [i for i, m in enumerate(conversation[:-1]) if m["role"] != "system"]
+        dropped: List[int] = []
+        for i in droppable:
+            # Once trimming has started, start the kept history on a user turn
+            # rather than a dangling reply
+            if total <= self.prompt_budget and not (dropped and conversation[i]["role"] == "assistant"):
+                break
+            dropped.append(i)
+            total -= costs[i]
+
+        if total > self.prompt_budget:
+            raise ValueError(
+                f"Conversation needs at least {total} prompt tokens but only {self.prompt_budget} are available"
+            )
+
+        dropped_set = set(dropped)
+        kept = [m for i, m in enumerate(conversation) if i not in dropped_set]
+        summarized = False
+
+        if dropped and self.policy == "summary":
+            dropped_messages = [conversation[i] for i in dropped]
+            summary = self._use_summary(dropped_messages, self.prompt_budget - total)
+            if summary is not None:
+                total += self.count_tokens(summary) + self.message_overhead
+                position = 0
+                while position < len(kept) and kept[position]["role"] == "system":
+                    position += 1
+                kept.insert(position, ChatCompletionRequestSystemMessage(
+                    role="system",
+                    content=f"Summary of the earlier conversation: {summary}",
+                ))
+                summarized = True
+
+        if dropped:
+            self._trimmed_requests += 1
+            self._dropped_messages += len(dropped)
+            logger.info(f"Dropped {len(dropped)} of {len(conversation)} messages to fit {total} prompt tokens")
+
+        return ContextWindow(
+            messages=kept,
+            prompt_tokens=total,
+            max_tokens=max(1, min(self.max_tokens, self.context_tokens - total)),
+            dropped_messages=len(dropped),
+            summarized=summarized,
+        )
+
+    def _use_summary(self, dropped: List[ChatCompletionRequestMessage], room: int) -> Optional[str]:
+        """
+        Find the summary covering the longest run of the dropped messages, and start
+        summarizing all of them in the background if no summary covers them yet.
+        """
+        keys = []
+        key = 0
+        for message in dropped:
+            key = hash((key, message["role"], message["content"]))
+            keys.append(key)
+
+        best: Optional[str] = None
+        covered = 0
+        for i in range(len(keys) - 1, -1, -1):
+            if keys[i] in self._summaries:
+                best, covered = self._summaries[keys[i]], i + 1
+                self._summaries.move_to_end(keys[i])
+                break
+
+        if covered < len(dropped) and keys[-1] not in self._summarizing:
+            self._start_summary(keys[-1], best, dropped[covered:])
+
+        if best is not None and self.count_tokens(best) + self.message_overhead <= room:
+            self._summaries_used += 1
+            return best
+        return None
+
+    def _start_summary(self, key: int, previous: Optional[str], messages: List[ChatCompletionRequestMessage]) -> None:
+        assert self._summarize is not None
+        self._summarizing.add(key)
+
+        async def run() -> None:
+            try:
+                self._summaries[key] = await self._summarize(previous, messages)  # type: ignore[misc]
+                if len(self._summaries) > self._cache_size:
+                    self._summaries.popitem(last=False)
+            except Exception as e:
+                logger.warning(f"Failed to summarize conversation history: {e}")
+            finally:
+                self._summarizing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "context_tokens": self.context_tokens,
+            "prompt_budget": self.prompt_budget,
+            "trimmed_requests": self._trimmed_requests,
+            "dropped_messages": self._dropped_messages,
+            "summaries_cached": len(self._summaries),
+            "summaries_used": self._summaries_used,
+        }
@@ -1,66 +1,404 @@
 import asyncio
+import ctypes
+import json
 import logging
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, suppress
 from typing import AsyncIterator, Iterator, List, Optional, Dict, Any
+import llama_cpp
 from llama_cpp import ChatCompletionRequestMessage, CreateChatCompletionStreamResponse, Llama
-from app.utils.model_utils import get_model_path, verify_model_exists, get_model_info
+from app.services.autotune import TuningProfile, autotuner
+from app.services.batch_engine import BatchEngine
+from app.services.context_manager import ContextManager, ContextWindow
+from app.services.metrics import GenerationTimer, model_metrics
+from app.services.model_catalog import model_catalog
+from app.services.prefix_cache import PrefixCache
+from app.services.response_cache import ResponseCache, is_deterministic, response_cache_key
+from app.services.scheduler import scheduler
+from app.services.speculative import DraftModel, Drafter, PromptLookupDrafter
+from app.services.token_stream import TokenStream
+from app.services.tracing import Trace
+from app.utils.model_utils import get_chat_format, get_model_path, model_name_from_path, verify_model_exists, get_model_info
+from app.utils.prompt_utils import common_prefix_length, format_prompt
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 class LLMService:
-    _instance: Optional['LLMService'] = None
+    """
+    One model with its context, caches and counters. The default model is created
+    at import as `llm_service` and loaded in the background when the app starts;
+    `app.services.model_registry` loads any others on demand, and replaces the
+    default when it is swapped.
+    
+    `n_ctx` is the context per sequence: N_CTX in single mode, SLOT_CTX in batched
+    mode unless given. Instances of the same model running side by side during a
+    swap need distinct `generation`s, which keep their prefix caches apart.
+    """
 
     model_path: str
+    model_name: str
     model_info: Dict[str, Any]
+    chat_format: str
     start_time: float
-    llm: Llama
-    
-    def __new__(cls):
-        if cls._instance is None:
-            logger.info("Initializing LLM service")
-            cls._instance = super(LLMService, cls).__new__(cls)
-            cls._instance._initialize()
-        return cls._instance
+    llm: Optional[Llama]
+    engine: Optional[BatchEngine]
+    prefix_cache: Optional[PrefixCache]
+    context_manager: Optional[ContextManager]
+    response_cache: Optional[ResponseCache]
+    tuning: Optional[TuningProfile]
+    metadata: Optional[Dict[str, Any]]
     
-    def _initialize(self) -> None:
-        self.model_path = get_model_path()
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        response_cache: Optional[ResponseCache] = None,
+        n_ctx: Optional[int] = None,
+        generation: int = 0,
+    ) -> None:
+        self.model_path = model_path or get_model_path()
         self.model_info = get_model_info(self.model_path)
+        self.model_name = model_name_from_path(self.model_path)
+        self.chat_format = get_chat_format(self.model_name)
         self.start_time = time.time()
+        self.n_ctx = n_ctx or (settings.SLOT_CTX if settings.ENGINE_MODE == "batched" else settings.N_CTX)
+        self.generation = generation
         
-        verify_model_exists(self.model_path)
+        # Nothing is loaded until `start` (or `load`) runs, so creating a service is cheap
+        self.status = "loading"
+        self.startup_timings: Dict[str, float] = {}
+        self.startup_error: Optional[str] = None
+        # Replaced by the calibrated values when AUTOTUNE is on
+        self.n_threads = settings.N_THREADS
+        self.n_threads_batch = settings.N_THREADS
+        self.n_batch = settings.N_BATCH
+        self.tuning = None
+        self.metadata = None
+        
+        self.llm = None
+        self.engine = None
+        self.prefix_cache = None
+        self.context_manager = None
+        # Shared between models; entries are keyed by model name
+        self.response_cache = response_cache
+        self._state_buffer: Optional[ctypes.Array] = None
+        # One long-lived thread owns the single context, so generations never interleave
+        # on it and never compete with other users of the default executor
+        self._decode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-decode")
+        
+        self._requests_completed = 0
+        self._requests_failed = 0
+        self._requests_cancelled = 0
+        self._cancelled_tokens_wasted = 0
+    
+    async def start(self, warmup: bool = True) -> None:
+        """
+        Load the model off the event loop, optionally run the warmup prompt, then mark
+        the service ready. `status` moves from "loading" through "warming" to "ready",
+        or to "failed" if anything goes wrong.
+        
+        Args:
+            warmup: Whether to run the WARMUP_PROMPT setting before reporting ready.
+            
+        Raises:
+            Exception: Whatever made loading or warmup fail.
+        """
+        started = time.perf_counter()
+        try:
+            self.status = "loading"
+            await asyncio.to_thread(self.load)
+            
+            if warmup and settings.WARMUP_PROMPT:
+                self.status = "warming"
+                warmup_started = time.perf_counter()
+                await self.warmup()
+                self.startup_timings["warmup"] = round(time.perf_counter() - warmup_started, 3)
+            
+            self.startup_timings["total"] = round(time.perf_counter() - started, 3)
+            self.status = "ready"
+            logger.info(f"Model {self.model_name} ready in {self.startup_timings['total']:.2f}s: {self.startup_timings}")
+        except Exception as e:
+            self.status = "failed"
+            self.startup_error = str(e)
+            logger.error(f"Failed to start model {self.model_name}: {e}", exc_info=True)
+            raise
+    
+    def load(self) -> None:
+        """
+        Load the weights and create the context and caches, recording how long each step
+        took in `startup_timings`. Blocks for as long as loading takes.
         
+        With memory mapping, "model_load" mostly covers mapping the file; the weights
+        are paged in by the first evaluation, which is what the warmup prompt is for.
+        The single-context mode creates its context inside Llama(), so "model_load"
+        includes the context allocation there.
+        
+        Raises:
+            FileNotFoundError: If the model file doesn't exist.
+            ValueError: If the model's metadata rules out the configured context size.
+            RuntimeError: If llama.cpp fails to load the model or create a context.
+        """
         logger.info(f"Loading model from {self.model_path}")
         logger.info(f"Model size: {self.model_info.get('size_mb', 'unknown')} MB")
         
-        try:
+        step = time.perf_counter()
+        verify_model_exists(self.model_path)
+        self.startup_timings["file_open"] = round(time.perf_counter() - step, 3)
+        
+        # Checked from the file's header, before spending seconds on the weights
+        step = time.perf_counter()
+        self.metadata = model_catalog.get(self.model_path)
+        self._validate_metadata()
+        self.startup_timings["metadata"] = round(time.perf_counter() - step, 3)
+        
+        if settings.AUTOTUNE:
+            step = time.perf_counter()
+            self.tuning = autotuner.get_profile(
+                self.model_path,
+                max_threads=settings.N_THREADS or os.cpu_count() or 1,
+                n_gpu_layers=settings.N_GPU_LAYERS,
+                use_mmap=settings.USE_MMAP,
+            )
+            self.n_threads = self.tuning.n_threads
+            self.n_threads_batch = self.tuning.n_threads_batch
+            self.n_batch = self.tuning.n_batch
+            self.startup_timings["autotune"] = round(time.perf_counter() - step, 3)
+        
+        step = time.perf_counter()
+        if settings.ENGINE_MODE == "batched":
+            drafter: Optional[Drafter] = None
+            if settings.SPECULATIVE_MODE:
+                drafter = self._create_drafter()
+                self.startup_timings["drafter_load"] = round(time.perf_counter() - step, 3)
+                step = time.perf_counter()
+            self.engine = BatchEngine(
+                model_path=self.model_path,
+                n_slots=settings.N_SLOTS,
+                slot_ctx=self.n_ctx,
+                n_batch=self.n_batch,
+                n_threads=self.n_threads,
+                n_threads_batch=self.n_threads_batch,
+                n_gpu_layers=settings.N_GPU_LAYERS,
+                chat_format=self.chat_format,
+                use_mmap=settings.USE_MMAP,
+                use_mlock=settings.USE_MLOCK,
+                drafter=drafter,
+                n_draft=settings.N_DRAFT,
+            )
+            self.startup_timings.update(self.engine.load_timings)
+        else:
             self.llm = Llama(
                 model_path=self.model_path,
-                n_ctx=settings.N_CTX,
-                n_threads=settings.N_THREADS,
+                n_ctx=self.n_ctx,
+                n_batch=self.n_batch,
+                n_threads=self.n_threads,
+                n_threads_batch=self.n_threads_batch,
                 n_gpu_layers=settings.N_GPU_LAYERS,
+                chat_format=self.chat_format,
+                use_mmap=settings.USE_MMAP,
+                use_mlock=settings.USE_MLOCK,
             )
-            logger.info("LLM model loaded successfully")
-        except Exception as e:
-            logger.error(f"Failed to load LLM model: {e}")
-            raise
+            self.startup_timings["model_load"] = round(time.perf_counter() - step, 3)
+            if settings.SPECULATIVE_MODE:
+                logger.warning("Speculative decoding needs ENGINE_MODE=batched; decoding without it")
+            if settings.PREFIX_CACHE_RAM_MB > 0:
+                self.prefix_cache = PrefixCache(
+                    ram_budget_bytes=settings.PREFIX_CACHE_RAM_MB * 1024 * 1024,
+                    disk_budget_bytes=settings.PREFIX_CACHE_DISK_MB * 1024 * 1024,
+                    min_reuse_tokens=settings.PREFIX_CACHE_MIN_TOKENS,
+                    # Each worker and model clears its own spill directory on startup
+                    disk_dir=os.path.join(
+                        settings.PREFIX_CACHE_DIR,
+                        settings.WORKER_ID,
+                        self.model_name if self.generation == 0 else f"{self.model_name}.{self.generation}",
+                    ),
+                )
+        self.context_manager = self._create_context_manager()
+        logger.info("LLM model loaded successfully")
     
-    @staticmethod
-    def _next_or_none(it: Iterator[CreateChatCompletionStreamResponse]) -> Optional[CreateChatCompletionStreamResponse]:
+    def _validate_metadata(self) -> None:
         """
-        Get the next item from an iterator or None if StopIteration is raised.
+        Raises:
+            ValueError: If a sequence's context is longer than the model was trained on.
         """
+        if self.metadata is None:
+            logger.warning(f"No metadata for {self.model_path}, leaving it to llama.cpp to validate the model")
+            return
+        trained = self.metadata.get("context_length")
+        if trained and self.n_ctx > trained:
+            setting = "SLOT_CTX" if settings.ENGINE_MODE == "batched" else "N_CTX"
+            raise ValueError(f"{setting}={self.n_ctx} is longer than the {trained} tokens {self.model_name} was trained on")
+        logger.info(
+            f"Model {self.model_name}: {self.metadata.get('architecture')}, {self.metadata.get('parameter_count')} parameters, "
+            f"{self.metadata.get('quantization')}, trained on {trained} tokens of context"
+        )
+    
+    def _create_drafter(self) -> Drafter:
+        if settings.SPECULATIVE_MODE == "prompt_lookup":
+            return PromptLookupDrafter(max_ngram=settings.PROMPT_LOOKUP_NGRAM)
+        if settings.SPECULATIVE_MODE == "draft_model":
+            if not settings.DRAFT_MODEL_PATH:
+                raise ValueError("SPECULATIVE_MODE=draft_model needs DRAFT_MODEL_PATH")
+            return DraftModel(
+                model_path=settings.DRAFT_MODEL_PATH,
+                n_seq=settings.N_SLOTS,
+                seq_ctx=self.n_ctx,
+                n_batch=self.n_batch,
+                n_threads=self.n_threads,
+                use_mmap=settings.USE_MMAP,
+            )
+        raise ValueError(f"Unknown speculative mode {settings.SPECULATIVE_MODE!r} (supported: ['prompt_lookup', 'draft_model'])")
+    
+    async def warmup(self) -> None:
+        """
+        Generate a few tokens for the WARMUP_PROMPT setting, so the first real request
+        doesn't pay for paging in the weights, allocating compute buffers or (with the
+        prefix cache) pinning the logits buffer. Bypasses the metrics and response cache.
+        """
+        conversation: List[ChatCompletionRequestMessage] = [{"role": "user", "content": settings.WARMUP_PROMPT}]
+        usage: Dict[str, int] = {}
+        if self.engine is not None:
+            chunks = self.engine.generate(conversation, temperature=0.0, max_tokens=settings.WARMUP_MAX_TOKENS, usage=usage)
+        else:
+            chunks = self._stream_single(conversation, temperature=0.0, max_tokens=settings.WARMUP_MAX_TOKENS, seed=None, usage=usage)
+        async with aclosing(chunks):
+            async for _ in chunks:
+                pass
+        logger.info(f"Warmup evaluated {usage.get('prompt_tokens', 0)} prompt tokens")
+    
+    def _create_context_manager(self) -> ContextManager:
+        # Measure what the chat template adds around each message, so per-message token
+        # counts can be summed without rendering and tokenizing the whole prompt
+        prompt, _ = format_prompt([{"role": "user", "content": "x"}], self.chat_format)
+        overhead = len(self.tokenize(prompt)) - len(self.tokenize("x"))
+        
+        return ContextManager(
+            context_tokens=self.n_ctx,
+            reserve_tokens=settings.CONTEXT_RESERVE_TOKENS,
+            max_tokens=settings.MAX_TOKENS,
+            tokenize=self.tokenize,
+            message_overhead=max(overhead, 0),
+            policy=settings.CONTEXT_POLICY,
+            summarize=self._summarize_history,
+        )
+    
+    def fit_context(self, conversation: List[ChatCompletionRequestMessage], message_tokens: Optional[List[int]] = None) -> ContextWindow:
+        """
+        Trim a conversation so that it and its reply fit in the model's context.
+        
+        Args:
+            conversation: List of messages representing the conversation history.
+            message_tokens: Content token counts per message, if already known.
+            
+        Returns:
+            The messages to send, the reply length they leave room for and what was trimmed.
+            
+        Raises:
+            ValueError: If the conversation can't be made to fit.
+        """
+        assert self.context_manager is not None
+        return self.context_manager.fit(conversation, message_tokens)
+    
+    async def _summarize_history(self, previous: Optional[str], messages: List[ChatCompletionRequestMessage]) -> str:
+        """
+        Condense dropped conversation turns (and the summary of the turns before them)
+        into a short summary.
+        
+        Runs in a background scheduler slot, so it never shares the context with a
+        reply, and under one more lease on this model, taken before the request that
+        started it can give its own back.
+        
+        Raises:
+            RuntimeError: If an interactive request needed the slot first.
+        """
+        # Imported here, as the registry imports this module
+        from app.services.model_registry import model_registry
+        
+        model_registry.retain(self)
+        ticket = scheduler.submit("summary", background=True)
         try:
-            return next(it)
-        except StopIteration:
+            await scheduler.acquire(ticket)
+            summary = asyncio.create_task(self._generate_summary(previous, messages))
+            preempted = asyncio.create_task(ticket.preempted.wait())
+            await asyncio.wait({summary, preempted}, return_when=asyncio.FIRST_COMPLETED)
+            preempted.cancel()
+            if not summary.done():
+                summary.cancel()
+                with suppress(asyncio.CancelledError):
+                    await summary
+                raise RuntimeError("Preempted by an interactive request")
+            return summary.result()
+        finally:
+            scheduler.release(ticket)
+            model_registry.release(self)
+    
+    async def _generate_summary(self, previous: Optional[str], messages: List[ChatCompletionRequestMessage]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        if previous:
+            transcript = f"Earlier summary: {previous}\n{transcript}"
+        
+        request: List[ChatCompletionRequestMessage] = [
+            {"role": "system", "content": "Summarize the following conversation in a few sentences, keeping names, facts and decisions."},
+            {"role": "user", "content": transcript},
+        ]
+        window = self.fit_context(request)
+        max_tokens = min(window.max_tokens, settings.SUMMARY_MAX_TOKENS)
+        parts = [part async for part in self.get_llm_response_stream(window.messages, max_tokens=max_tokens)]
+        return "".join(parts).strip()
+    
+    def get_cached_response(
+        self,
+        conversation: List[ChatCompletionRequestMessage],
+        temperature: float,
+        seed: Optional[int],
+        max_tokens: int,
+    ) -> Optional[List[str]]:
+        """
+        Look up the stored reply to a deterministic request.
+        
+        Returns:
+            The reply's chunks, or None if the request isn't deterministic, the cache is
+            disabled or nothing is stored for it.
+        """
+        if self.response_cache is None or not is_deterministic(temperature, seed):
             return None
+        return self.response_cache.get(response_cache_key(self.model_name, conversation, temperature, seed, max_tokens))
+    
+    async def replay_response(self, chunks: List[str]) -> AsyncIterator[str]:
+        """
+        Stream a cached reply, optionally paced like a live generation.
+        """
+        delay = settings.RESPONSE_CACHE_REPLAY_DELAY_MS / 1000
+        model_metrics(self.model_name).cached.inc()
+        for i, chunk in enumerate(chunks):
+            if delay and i:
+                await asyncio.sleep(delay)
+            yield chunk
     
-    async def get_llm_response_stream(self, conversation: List[ChatCompletionRequestMessage]) -> AsyncIterator[str]:
+    async def get_llm_response_stream(
+        self,
+        conversation: List[ChatCompletionRequestMessage],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        seed: Optional[int] = None,
+        usage: Optional[Dict[str, int]] = None,
+        trace: Optional[Trace] = None,
+    ) -> AsyncIterator[str]:
         """
         Stream responses from the LLM model based on the conversation history.
+        Replies to deterministic requests are stored in the response cache, if enabled.
         
         Args:
             conversation: List of messages representing the conversation history.
+            max_tokens: Longest reply to generate, defaults to the MAX_TOKENS setting.
+            temperature: Sampling temperature, defaults to the TEMPERATURE setting.
+            seed: Sampling seed, random if not given.
+            usage: If given, receives the prompt and completion token counts, also
+                for replies that are cancelled part way.
+            trace: If given, records when prompt evaluation starts and ends and
+                when the first and last tokens arrive.
             
         Yields:
             Chunks of the LLM response.
@@ -74,49 +412,273 @@ class LLMService:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
+        max_tokens = max_tokens or settings.MAX_TOKENS
+        temperature = settings.TEMPERATURE if temperature is None else temperature
+        cache_key: Optional[str] = None
+        if self.response_cache is not None and is_deterministic(temperature, seed):
+            cache_key = response_cache_key(self.model_name, conversation, temperature, seed, max_tokens)
+        recorded: List[str] = []
+        tokens_generated = 0
+        usage = usage if usage is not None else {}
+        metrics = model_metrics(self.model_name)
+        timer = GenerationTimer()
+        metrics.active_streams.inc()
+        
         try:
-            logger.info(f"Generating LLM response for the following conversation: {conversation}")
-
-            response_iter = self.llm.create_chat_completion(
-                messages=conversation,
-                stream=True,
-                temperature=0.7,
-                max_tokens=1024,
-            )
+            logger.info(f"Generating LLM response to {len(conversation)} messages")
+            # Formatting a long conversation is costly, so only do it if it will be logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Conversation: {json.dumps(conversation, ensure_ascii=False)}")
             
-            tokens_generated = 0
-            start_time = time.time()
+            if self.engine is not None:
+                chunks = self.engine.generate(conversation, temperature=temperature, max_tokens=max_tokens, seed=seed, usage=usage, trace=trace)
+            else:
+                chunks = self._stream_single(conversation, temperature=temperature, max_tokens=max_tokens, seed=seed, usage=usage, trace=trace)
             
-            while True:
-                # This blocks only the helper thread, not the event loop
-                chunk = await asyncio.to_thread(self._next_or_none, response_iter) # type: ignore
-                if chunk is None:
-                    break
-                
-                delta = chunk["choices"][0]["delta"]
-                if "content" in delta and delta["content"]:
-                    content = delta["content"]
+            async with aclosing(chunks):
+                async for content in chunks:
+                    timer.tick()
+                    if trace is not None and tokens_generated == 0:
+                        trace.mark("first_token")
                     tokens_generated += 1
+                    if cache_key is not None:
+                        recorded.append(content)
                     yield content
+            if trace is not None:
+                trace.mark("last_token")
             
-            generation_time = time.time() - start_time
-            logger.info(f"Generated response with {tokens_generated} chunks in {generation_time:.2f}s")
+            if cache_key is not None and self.response_cache is not None:
+                self.response_cache.put(cache_key, recorded)
+            self._requests_completed += 1
+            metrics.completed.inc()
+            metrics.observe(timer, usage.get("prompt_tokens", 0), usage.get("completion_tokens", tokens_generated))
+            logger.info(f"Generated response with {tokens_generated} chunks in {timer.last - timer.start:.2f}s")
             
+        except (asyncio.CancelledError, GeneratorExit):
+            # The consumer went away (e.g. the client disconnected); closing `chunks`
+            # stops generation within one token
+            self._requests_cancelled += 1
+            self._cancelled_tokens_wasted += tokens_generated
+            metrics.cancelled.inc()
+            logger.info(f"Generation cancelled after {tokens_generated} chunks")
+            raise
         except Exception as e:
+            self._requests_failed += 1
+            metrics.failed.inc()
             error_msg = f"Error streaming response from LLM: {str(e)}"
             logger.error(error_msg, exc_info=True)
             raise RuntimeError(error_msg)
+        finally:
+            metrics.active_streams.dec()
+            # The engine reports usage when the request finishes, which a cancelled
+            # request may not have reached yet
+            usage.setdefault("completion_tokens", tokens_generated)
+    
+    async def _stream_single(
+        self,
+        conversation: List[ChatCompletionRequestMessage],
+        temperature: float,
+        max_tokens: int,
+        seed: Optional[int],
+        usage: Dict[str, int],
+        trace: Optional[Trace] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion from the single shared Llama context. Generation runs as one
+        job on the dedicated decode thread, which hands text back through a bounded stream
+        and fills in `usage` with token counts when it finishes.
+        """
+        loop = asyncio.get_running_loop()
+        stream = TokenStream(loop, maxsize=settings.STREAM_BUFFER_SIZE)
+        job = loop.run_in_executor(self._decode_executor, self._generate_single, conversation, temperature, max_tokens, seed, usage, stream, trace)
+        
+        try:
+            async for content in stream:
+                yield content
+        finally:
+            stream.cancel()
+            # Don't leave a failed job's exception unretrieved if the consumer stopped early
+            job.add_done_callback(lambda f: f.cancelled() or f.exception())
+    
+    def _generate_single(
+        self,
+        conversation: List[ChatCompletionRequestMessage],
+        temperature: float,
+        max_tokens: int,
+        seed: Optional[int],
+        usage: Dict[str, int],
+        stream: TokenStream,
+        trace: Optional[Trace] = None,
+    ) -> None:
+        """
+        Run a whole completion on the decode thread, pushing text into `stream` until it
+        finishes or the consumer goes away.
+        """
+        assert self.llm is not None
+        if stream.cancelled.is_set():
+            stream.close()
+            return
+        
+        try:
+            prompt, _ = format_prompt(conversation, self.chat_format)
+            tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+            usage["prompt_tokens"] = len(tokens)
+            usage["completion_tokens"] = 0
+            if self.prefix_cache is not None:
+                self._restore_prefix(tokens)
+            if trace is not None:
+                trace.mark("prompt_eval_start")
+            
+            response_iter: Iterator[CreateChatCompletionStreamResponse] = self.llm.create_chat_completion(  # type: ignore[assignment]
+                messages=conversation,
+                stream=True,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                seed=seed,
+            )
+            
+            for chunk in response_iter:
+                # The prompt is evaluated when the first chunk is requested
+                if trace is not None and usage["completion_tokens"] == 0:
+                    trace.mark("prompt_eval_end")
+                delta = chunk["choices"][0]["delta"]
+                if "content" in delta and delta["content"]:
+                    # Streaming yields about one chunk per sampled token
+                    usage["completion_tokens"] += 1
+                    if not stream.put(delta["content"]):
+                        break
+            else:
+                if self.prefix_cache is not None:
+                    self._save_prefix()
+            
+            stream.close()
+        except Exception as e:
+            stream.close(e)
+    
+    def _restore_prefix(self, tokens: List[int]) -> None:
+        """
+        Load the cached context snapshot sharing the longest prefix with this prompt,
+        if it covers more of the prompt than what is already in the context.
+        """
+        assert self.llm is not None and self.prefix_cache is not None
+        if self._state_buffer is None:
+            self._pin_logits_capacity()
+        
+        # Llama.generate always re-evaluates the last prompt token to get fresh logits
+        reused = common_prefix_length(self.llm._input_ids.tolist(), tokens[:-1])
+        found = self.prefix_cache.lookup(tokens[:-1])
+        if found is not None and found[0] > reused:
+            reused, snapshot_tokens, state = found
+            data = ctypes.cast(ctypes.c_char_p(state), ctypes.POINTER(ctypes.c_uint8))
+            if llama_cpp.llama_set_state_data(self.llm.ctx, data) != len(state):
+                raise RuntimeError("Failed to restore cached context state")
+            self.llm.input_ids[:len(snapshot_tokens)] = snapshot_tokens
+            self.llm.n_tokens = len(snapshot_tokens)
+            logger.info(f"Restored {reused} of {len(tokens)} prompt tokens from the prefix cache")
+        
+        self.prefix_cache.record(reused)
+    
+    def _pin_logits_capacity(self) -> None:
+        """
+        llama.cpp only restores a snapshot into a context whose logits buffer has the same
+        capacity, and that buffer grows with the largest batch decoded so far. Decoding one
+        full batch up front pins it at its maximum size so every snapshot stays restorable.
+        """
+        assert self.llm is not None
+        self.llm.eval([self.llm.token_bos()] * self.llm.n_batch)
+        self.llm.reset()
+        self._state_buffer = (ctypes.c_uint8 * llama_cpp.llama_get_state_size(self.llm.ctx))()
+    
+    def _save_prefix(self) -> None:
+        """
+        Snapshot the context after a response so the conversation's next turn can resume from it.
+        Skipped for contexts too short to ever count as a hit, as the copy covers the whole state.
+        """
+        assert self.llm is not None and self.prefix_cache is not None and self._state_buffer is not None
+        if self.llm.n_tokens < self.prefix_cache.min_reuse_tokens:
+            return
+        n_bytes = llama_cpp.llama_copy_state_data(self.llm.ctx, self._state_buffer)
+        self.prefix_cache.store(self.llm._input_ids.tolist(), ctypes.string_at(self._state_buffer, n_bytes))
+    
+    def tokenize(self, text: str) -> List[int]:
+        """
+        Tokenize a piece of message text on its own (no BOS token), e.g. to measure its length.
+        Only reads the vocabulary, so it is safe to call while a generation is running.
+        """
+        if self.engine is not None:
+            return self.engine.tokenize(text, add_bos=False)
+        assert self.llm is not None
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+    
+    def memory_bytes(self) -> int:
+        """
+        Approximate resident memory: the model weights plus the context's KV cache and logits.
+        """
+        ctx = self.engine.ctx if self.engine is not None else getattr(self.llm, "ctx", None)
+        context_bytes = llama_cpp.llama_get_state_size(ctx) if ctx else 0
+        return self.model_info.get("size_bytes", 0) + context_bytes
+    
+    def close(self) -> None:
+        """
+        Free the model and its context. The service must not be used afterwards.
+        """
+        logger.info(f"Unloading model {self.model_name}")
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+        self._decode_executor.shutdown(wait=True)
+        if self.prefix_cache is not None:
+            self.prefix_cache.clear()
+        self.llm = None
+        self.prefix_cache = None
+        self._state_buffer = None
     
     def get_model_stats(self) -> Dict[str, Any]:
         uptime = time.time() - self.start_time
         return {
+            "model_name": self.model_name,
+            "status": self.status,
+            "startup": {"timings": self.startup_timings, "error": self.startup_error},
             "model_info": self.model_info,
-            "context_window": settings.N_CTX,
-            "threads": settings.N_THREADS,
+            "metadata": self.metadata,
+            "chat_format": self.chat_format,
+            "context_window": self.n_ctx,
+            "threads": self.n_threads,
+            "threads_batch": self.n_threads_batch,
+            "batch_size": self.n_batch,
+            "autotune": self.tuning.get_stats() if self.tuning is not None else {"enabled": False},
             "gpu_layers": settings.N_GPU_LAYERS,
+            "engine": self.engine.get_stats() if self.engine is not None else {"mode": "single"},
+            "prefix_cache": self._get_prefix_stats(),
+            "context": self.context_manager.get_stats() if self.context_manager is not None else {},
+            "response_cache": self.response_cache.get_stats() if self.response_cache is not None else {"enabled": False},
+            "requests": {
+                "completed": self._requests_completed,
+                "failed": self._requests_failed,
+                "cancelled": self._requests_cancelled,
+                "cancelled_tokens_wasted": self._cancelled_tokens_wasted,
+            },
             "uptime_seconds": int(uptime),
             "uptime_formatted": f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m {int(uptime % 60)}s",
         }
+    
+    def _get_prefix_stats(self) -> Dict[str, Any]:
+        if self.engine is not None:
+            return self.engine.get_prefix_stats()
+        if self.prefix_cache is not None:
+            return self.prefix_cache.get_stats()
+        return {"mode": "disabled"}
+
+
+def _create_response_cache() -> Optional[ResponseCache]:
+    if settings.RESPONSE_CACHE_ENTRIES <= 0:
+        return None
+    return ResponseCache(
+        max_entries=settings.RESPONSE_CACHE_ENTRIES,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        # Workers each keep their own file, since loading one rewrites it
+        path=f"{settings.RESPONSE_CACHE_PATH}{'.' + settings.WORKER_ID if settings.WORKER_ID else ''}" if settings.RESPONSE_CACHE_PATH else None,
+    )
 
 
-llm_service = LLMService()
\ No newline at end of file
+llm_service = LLMService(response_cache=_create_response_cache())
\ No newline at end of file
@@ -0,0 +1,108 @@
+import time
+from functools import lru_cache
+from typing import List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.services.scheduler import scheduler
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+_TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+_RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200, 500)
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Time from the start of generation to the first streamed text",
+    ["model"], buckets=_LATENCY_BUCKETS,
+)
+INTER_TOKEN_LATENCY = Histogram(
+    "llm_inter_token_latency_seconds", "Time between consecutive pieces of streamed text",
+    ["model"], buckets=_LATENCY_BUCKETS,
+)
+GENERATION_DURATION = Histogram(
+    "llm_generation_duration_seconds", "Total time spent generating a response",
+    ["model"], buckets=_DURATION_BUCKETS,
+)
+PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Prompt length in tokens",
+    ["model"], buckets=_TOKEN_BUCKETS,
+)
+COMPLETION_TOKENS = Histogram(
+    "llm_completion_tokens", "Response length in tokens",
+    ["model"], buckets=_TOKEN_BUCKETS,
+)
+TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "Completion tokens per second after the first token",
+    ["model"], buckets=_RATE_BUCKETS,
+)
+ACTIVE_STREAMS = Gauge("llm_active_streams", "Responses currently being generated", ["model"])
+REQUESTS = Counter("llm_requests_total", "Generation requests by outcome, including replies replayed from the cache", ["model", "outcome"])
+
+QUEUE_DEPTH = Gauge("llm_queue_depth", "Requests waiting for admission")
+QUEUE_DEPTH.set_function(lambda: scheduler.queue_depth)
+ADMITTED_REQUESTS = Gauge("llm_admitted_requests", "Requests currently admitted by the scheduler")
+ADMITTED_REQUESTS.set_function(lambda: scheduler.active)
+
+
+class GenerationTimer:
+    """
+    Timing for one streamed response.
+
+    `tick` only appends to a local list, so the per-token path never touches a
+    shared metric; everything is observed in one go when the response ends.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.last = self.start
+        self.gaps: List[float] = []
+
+    def tick(self) -> None:
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+
+
+class ModelMetrics:
+    """
+    The labelled series for one model, resolved once so request paths skip label lookups.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.time_to_first_token = TIME_TO_FIRST_TOKEN.labels(model=model)
+        self.inter_token_latency = INTER_TOKEN_LATENCY.labels(model=model)
+        self.generation_duration = GENERATION_DURATION.labels(model=model)
+        self.prompt_tokens = PROMPT_TOKENS.labels(model=model)
+        self.completion_tokens = COMPLETION_TOKENS.labels(model=model)
+        self.tokens_per_second = TOKENS_PER_SECOND.labels(model=model)
+        self.active_streams = ACTIVE_STREAMS.labels(model=model)
+        self.completed = REQUESTS.labels(model=model, outcome="completed")
+        self.failed = REQUESTS.labels(model=model, outcome="failed")
+        self.cancelled = REQUESTS.labels(model=model, outcome="cancelled")
+        self.cached = REQUESTS.labels(model=model, outcome="cached")
+
+    def observe(self, timer: GenerationTimer, prompt_tokens: int, completion_tokens: int) -> None:
+        """
+        Record the latency and size of a response that ran to completion.
+        """
+        self.generation_duration.observe(timer.last - timer.start)
+        self.prompt_tokens.observe(prompt_tokens)
+        self.completion_tokens.observe(completion_tokens)
+
+        if timer.first is None:
+            return
+        self.time_to_first_token.observe(timer.first - timer.start)
+        for gap in timer.gaps:
+            self.inter_token_latency.observe(gap)
+        if timer.last > timer.first:
+            self.tokens_per_second.observe(max(completion_tokens - 1, 0) / (timer.last - timer.first))
+
+
+@lru_cache(maxsize=None)
+def model_metrics(model: str) -> ModelMetrics:
+    return ModelMetrics(model)
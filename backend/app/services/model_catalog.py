@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.gguf_utils import GGUFFormatError, read_gguf_metadata
+from app.utils.model_utils import list_model_files
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """
+    What each GGUF model on disk is, read from its header rather than by loading it.
+
+    Entries are kept in memory and in `cache_path`, keyed by the file's path and
+    checked against its modification time and size, so a file is only read again
+    once it changes. Files that can't be read are cached with their error.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None) -> None:
+        self.cache_path = cache_path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._reads = 0
+        if cache_path:
+            try:
+                with open(cache_path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable model catalog {cache_path}: {e}")
+
+    def get(self, model_path: str) -> Optional[Dict[str, Any]]:
+        """
+        The metadata of a model file, or None if it doesn't exist or can't be read.
+        """
+        metadata, changed = self._lookup(model_path)
+        if changed:
+            self._save()
+        return metadata
+
+    def scan(self, model_dir: str) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        The metadata of every GGUF file in `model_dir`, by model name.
+        """
+        catalog = {}
+        changed = False
+        for name, path in list_model_files(model_dir).items():
+            catalog[name], read = self._lookup(path)
+            changed = changed or read
+        if changed:
+            self._save()
+        return catalog
+
+    def _lookup(self, model_path: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        try:
+            stat = os.stat(model_path)
+        except OSError:
+            return None, False
+        key = os.path.abspath(model_path)
+        entry = self._entries.get(key)
+        if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            self._reads += 1
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "metadata": None, "error": None}
+            try:
+                entry["metadata"] = read_gguf_metadata(model_path)
+            except (OSError, GGUFFormatError) as e:
+                logger.warning(f"Failed to read the metadata of {model_path}: {e}")
+                entry["error"] = str(e)
+            self._entries[key] = entry
+            return entry["metadata"], True
+        return entry["metadata"], False
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            # Workers share the file, so each writes its own copy and swaps it in
+            temporary = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(temporary, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to save the model catalog to {self.cache_path}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "headers_read": self._reads,
+            "cache_path": self.cache_path,
+        }
+
+
+model_catalog = ModelCatalog(cache_path=settings.MODEL_CATALOG_PATH or None)
@@ -0,0 +1,396 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+
+from app.config import settings
+from app.services.llm_service import LLMService, llm_service
+from app.services.model_catalog import model_catalog
+from app.utils.model_utils import list_model_files
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotFoundError(Exception):
+    """
+    Raised when a request names a model that isn't available.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"Model {name!r} not found")
+        self.name = name
+
+
+class ModelNotReadyError(Exception):
+    """
+    Raised when a request needs a model that is still loading or failed to load.
+    """
+
+    def __init__(self, name: str, status: str) -> None:
+        super().__init__(f"Model {name!r} is not ready ({status})")
+        self.name = name
+        self.status = status
+
+
+class SwapInProgressError(Exception):
+    """
+    Raised when a swap is requested while another is still underway.
+    """
+
+    def __init__(self, status: str) -> None:
+        super().__init__(f"A model swap is already in progress ({status})")
+        self.status = status
+
+
+class InsufficientMemoryError(Exception):
+    """
+    Raised when a second model can't be loaded without exceeding the host's RAM or the RAM budget.
+    """
+
+    def __init__(self, needed_bytes: int, available_bytes: int) -> None:
+        super().__init__(
+            f"Loading the model needs {needed_bytes // (1024 * 1024)} MB, "
+            f"but only {available_bytes // (1024 * 1024)} MB is available"
+        )
+        self.needed_bytes = needed_bytes
+        self.available_bytes = available_bytes
+
+
+class ModelSwap:
+    """
+    The progress of replacing the default model: "loading" (and warming up) the new
+    instance while the old one serves, "draining" the old one's requests after new
+    requests move over, then "done"; or "failed", leaving the old one in place.
+    """
+
+    def __init__(self, old: LLMService, new: LLMService) -> None:
+        self.old = old
+        self.new = new
+        self.status = "loading"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.switched_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def on_done(self, task: "asyncio.Task[None]") -> None:
+        """
+        Record a swap that ended other than by finishing or failing to load.
+        """
+        if task.cancelled():
+            error = "cancelled"
+        elif task.exception() is not None:
+            error = str(task.exception())
+            logger.error(f"Model swap to {self.new.model_name} failed", exc_info=task.exception())
+        else:
+            return
+        self.status = "failed"
+        self.error = self.error or error
+        self.finished_at = self.finished_at or time.time()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("loading", "draining")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "old": {"model": self.old.model_name, "path": self.old.model_path, "context_window": self.old.n_ctx},
+            "new": {"model": self.new.model_name, "path": self.new.model_path, "context_window": self.new.n_ctx, "status": self.new.status},
+            "started_at": self.started_at,
+            "switched_at": self.switched_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ModelRegistry:
+    """
+    The models that can serve requests: the default model, always loaded, plus
+    every GGUF file in `model_dir`, loaded the first time a request names it.
+
+    When the loaded models' approximate resident memory exceeds `ram_budget_bytes`,
+    the least recently used models are unloaded, skipping any that still have
+    requests in flight. Callers hold a model between `acquire` and `release`.
+
+    The default model can be replaced while serving with `swap_default`.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        ram_budget_bytes: int,
+        default: LLMService,
+        loader: Callable[..., LLMService],
+    ) -> None:
+        self.model_dir = model_dir
+        self.ram_budget_bytes = ram_budget_bytes
+        self.default = default
+
+        self._loader = loader
+        self._loaded: "OrderedDict[str, LLMService]" = OrderedDict([(default.model_name, default)])
+        # By instance, as the old and new default can share a name during a swap
+        self._leases: Dict[LLMService, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._drained: Dict[LLMService, asyncio.Event] = {}
+        self.swap: Optional[ModelSwap] = None
+
+        self._loads = 0
+        self._evictions = 0
+        self._swaps = 0
+
+    def available(self) -> Dict[str, str]:
+        """
+        Map every selectable model name to its file.
+        """
+        models = list_model_files(self.model_dir)
+        models.setdefault(self.default.model_name, self.default.model_path)
+        return models
+
+    async def acquire(self, name: Optional[str] = None) -> LLMService:
+        """
+        Get a model by name (the default if None), loading it first if necessary.
+        The model can't be unloaded until the caller releases it.
+
+        Raises:
+            ModelNotFoundError: If there is no model with that name.
+            ModelNotReadyError: If the model is still starting up or failed to.
+        """
+        name = name or self.default.model_name
+        service = self._loaded.get(name)
+        if service is None:
+            lock = self._load_locks.setdefault(name, asyncio.Lock())
+            async with lock:
+                service = self._loaded.get(name)
+                if service is None:
+                    service = await self._load(name)
+        if service.status != "ready":
+            raise ModelNotReadyError(name, service.status)
+
+        self._loaded.move_to_end(name)
+        self._leases[service] = self._leases.get(service, 0) + 1
+        self._last_used[name] = time.time()
+        return service
+
+    def retain(self, service: LLMService) -> None:
+        """
+        Take one more lease on a model the caller already holds, for work that may
+        outlive the caller's own.
+        """
+        self._leases[service] = self._leases.get(service, 0) + 1
+
+    def release(self, service: LLMService) -> None:
+        self._leases[service] = max(0, self._leases.get(service, 0) - 1)
+        if self._leases[service] == 0:
+            del self._leases[service]
+            if service in self._drained:
+                self._drained[service].set()
+
+    async def swap_default(self, name: Optional[str] = None, n_ctx: Optional[int] = None) -> ModelSwap:
+        """
+        Start replacing the default model with another (or the same one with a different
+        context size) without downtime. The new instance loads and warms up in the
+        background while the old one keeps serving; then new requests go to the new one,
+        requests already holding the old one finish on it, and it is unloaded once
+        they have. Progress is tracked in the returned (and `swap`) object.
+
+        Args:
+            name: The model to switch to, the current default if None.
+            n_ctx: Context tokens per sequence for the new instance, the setting's if None.
+
+        Raises:
+            ModelNotFoundError: If there is no model with that name.
+            SwapInProgressError: If another swap hasn't finished yet.
+            InsufficientMemoryError: If both models wouldn't fit in RAM at once, even
+                after unloading idle models.
+        """
+        if self.swap is not None and self.swap.active:
+            raise SwapInProgressError(self.swap.status)
+        name = name or self.default.model_name
+        path = self.available().get(name)
+        if path is None:
+            raise ModelNotFoundError(name)
+
+        await self._reserve_memory(path)
+        # Another swap may have started while idle models were unloading
+        if self.swap is not None and self.swap.active:
+            raise SwapInProgressError(self.swap.status)
+        self._swaps += 1
+        new = self._loader(path, n_ctx=n_ctx, generation=self._swaps)
+        self.swap = ModelSwap(self.default, new)
+        # Held on the swap, as the loop only keeps a weak reference to running tasks
+        self.swap.task = asyncio.create_task(self._run_swap(self.swap))
+        self.swap.task.add_done_callback(self.swap.on_done)
+        logger.info(f"Swapping the default model {self.default.model_name} for {name} (context {new.n_ctx})")
+        return self.swap
+
+    async def _run_swap(self, swap: ModelSwap) -> None:
+        old, new = swap.old, swap.new
+        try:
+            # Warmed up too, so the first request routed to it doesn't pay for paging in weights
+            await new.start(warmup=True)
+        except Exception as e:
+            swap.status = "failed"
+            swap.error = str(e)
+            swap.finished_at = time.time()
+            await asyncio.to_thread(new.close)
+            return
+
+        # Requests look models up by name, so this switches new requests over at once
+        retired = [old]
+        if self._loaded.get(old.model_name) is old:
+            del self._loaded[old.model_name]
+        # The model may already be loaded as a non-default one, which the new instance replaces
+        replaced = self._loaded.get(new.model_name)
+        if replaced is not None:
+            retired.append(replaced)
+        self._loaded[new.model_name] = new
+        self.default = new
+        swap.status = "draining"
+        swap.switched_at = time.time()
+        logger.info(f"Default model is now {new.model_name}; draining {sum(self._leases.get(s, 0) for s in retired)} requests from the old instances")
+
+        for service in retired:
+            await self._drain(service)
+            await asyncio.to_thread(service.close)
+        swap.status = "done"
+        swap.finished_at = time.time()
+        logger.info(f"Model swap to {new.model_name} finished in {swap.finished_at - swap.started_at:.2f}s")
+
+    async def _drain(self, service: LLMService) -> None:
+        """
+        Wait until no request holds a model.
+        """
+        if self._leases.get(service, 0) > 0:
+            self._drained[service] = asyncio.Event()
+            try:
+                await self._drained[service].wait()
+            finally:
+                del self._drained[service]
+
+    async def _reserve_memory(self, path: str) -> None:
+        """
+        Make sure a model can load alongside the current default, unloading idle
+        models other than the default if that makes the difference.
+
+        Raises:
+            InsufficientMemoryError: If it can't.
+        """
+        # The same file's weights are mapped once and shared, so only a new context is added
+        same_file = os.path.abspath(path) == os.path.abspath(self.default.model_path)
+        needed = (0 if same_file else os.path.getsize(path)) + settings.SWAP_MEMORY_HEADROOM_MB * 1024 * 1024
+
+        def available() -> int:
+            free = psutil.virtual_memory().available
+            if self.ram_budget_bytes > 0:
+                free = min(free, self.ram_budget_bytes - self.resident_bytes())
+            return free
+
+        for name in list(self._loaded):
+            if available() >= needed:
+                return
+            service = self._loaded[name]
+            if service is self.default or self._leases.get(service, 0) > 0:
+                continue
+            del self._loaded[name]
+            self._evictions += 1
+            logger.info(f"Unloading model {name} to make room for a model swap")
+            # Closing joins the engine thread, which can take a whole decode step
+            await asyncio.to_thread(service.close)
+        if available() < needed:
+            raise InsufficientMemoryError(needed, available())
+
+    async def _load(self, name: str) -> LLMService:
+        path = self.available().get(name)
+        if path is None:
+            raise ModelNotFoundError(name)
+
+        # Make room for the weights up front so two large models are never resident at once
+        await self._evict(self.ram_budget_bytes - os.path.getsize(path))
+        start = time.time()
+        service = self._loader(path)
+        # The request that triggered the load is waiting, so warming up would only delay it
+        try:
+            await service.start(warmup=False)
+        except Exception:
+            await asyncio.to_thread(service.close)
+            raise
+        self._loaded[name] = service
+        self._loads += 1
+        logger.info(f"Loaded model {name} in {time.time() - start:.2f}s")
+
+        await self._evict(self.ram_budget_bytes, keep=name)
+        return service
+
+    async def _evict(self, budget: int, keep: Optional[str] = None) -> None:
+        if self.ram_budget_bytes <= 0:
+            return
+
+        for name in list(self._loaded):
+            if self.resident_bytes() <= budget:
+                return
+            service = self._loaded[name]
+            if service is self.default or name == keep or self._leases.get(service, 0) > 0:
+                continue
+            del self._loaded[name]
+            self._evictions += 1
+            logger.info(f"Unloading model {name} to stay within the {self.ram_budget_bytes // (1024 * 1024)} MB budget")
+            await asyncio.to_thread(service.close)
+
+        if self.resident_bytes() > budget:
+            logger.warning("Loaded models exceed the RAM budget, but the remaining ones are in use or the default model")
+
+    def resident_bytes(self) -> int:
+        return sum(service.memory_bytes() for service in self._loaded.values())
+
+    def loaded_paths(self) -> Dict[str, str]:
+        """
+        Map every loaded model name to its file. Only call this on the event loop.
+        """
+        return {name: service.model_path for name, service in self._loaded.items()}
+
+    def list_models(self) -> List[Dict[str, Any]]:
+        models = []
+        # Reads the headers of new or changed files only, and saves the catalog once
+        model_catalog.scan(self.model_dir)
+        for name, path in self.available().items():
+            service = self._loaded.get(name)
+            metadata = model_catalog.get(path)
+            models.append({
+                "name": name,
+                "path": path,
+                "size_mb": round(os.path.getsize(path) / (1024 * 1024), 2) if os.path.exists(path) else None,
+                "default": name == self.default.model_name,
+                "loaded": service is not None,
+                "resident_mb": round(service.memory_bytes() / (1024 * 1024), 2) if service is not None else 0,
+                "active_requests": self._leases.get(service, 0) if service is not None else 0,
+                "last_used": self._last_used.get(name),
+                # The chat template is only reported for loaded models, in their stats
+                "metadata": {k: v for k, v in metadata.items() if k != "chat_template"} if metadata is not None else None,
+            })
+        return models
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": list(self._loaded),
+            "resident_mb": round(self.resident_bytes() / (1024 * 1024), 2),
+            "ram_budget_mb": self.ram_budget_bytes // (1024 * 1024),
+            "loads": self._loads,
+            "evictions": self._evictions,
+            "swaps": self._swaps,
+            "swap": self.swap.to_dict() if self.swap is not None else None,
+            "catalog": model_catalog.get_stats(),
+        }
+
+
+model_registry = ModelRegistry(
+    model_dir=settings.MODEL_DIR or os.path.dirname(llm_service.model_path),
+    ram_budget_bytes=settings.MODEL_RAM_BUDGET_MB * 1024 * 1024,
+    default=llm_service,
+    loader=lambda path, **kwargs: LLMService(path, response_cache=llm_service.response_cache, **kwargs),
+)
@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.prompt_utils import common_prefix_length
+
+logger = logging.getLogger(__name__)
+
+TokenKey = Tuple[int, ...]
+
+
+class PrefixCache:
+    """
+    LRU cache of llama.cpp context snapshots keyed by the tokens they contain.
+
+    After a response finishes, the KV state covering prompt + reply is stored under
+    that token sequence. The next turn of the same conversation starts with exactly
+    those tokens, so restoring the snapshot leaves only the newly appended messages
+    to evaluate. Entries live in RAM up to `ram_budget_bytes`; least recently used
+    entries spill to `disk_dir` (up to `disk_budget_bytes`) before being dropped.
+
+    Every prompt shares the chat template's opening tokens, so only reuse of at
+    least `min_reuse_tokens` counts as a hit.
+    """
+
+    def __init__(
+        self,
+        ram_budget_bytes: int,
+        disk_budget_bytes: int = 0,
+        disk_dir: Optional[str] = None,
+        min_reuse_tokens: int = 32,
+    ) -> None:
+        self.ram_budget_bytes = ram_budget_bytes
+        self.min_reuse_tokens = min_reuse_tokens
+        self.disk_budget_bytes = disk_budget_bytes if disk_dir else 0
+        self.disk_dir = disk_dir
+
+        self._ram: "OrderedDict[TokenKey, bytes]" = OrderedDict()
+        self._disk: "OrderedDict[TokenKey, Tuple[str, int]]" = OrderedDict()
+        self._ram_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._tokens_reused = 0
+        self._evictions = 0
+
+        if self.disk_dir and self.disk_budget_bytes:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Snapshots are only valid for the context that produced them
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".kv"):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def lookup(self, tokens: List[int]) -> Optional[Tuple[int, TokenKey, bytes]]:
+        """
+        Find the snapshot sharing the longest prefix with `tokens`.
+
+        Returns:
+            The length of the shared prefix, the tokens held by the snapshot and the
+            snapshot data, or None if no entry shares a prefix.
+        """
+        with self._lock:
+            best_key: Optional[TokenKey] = None
+            best_length = 0
+            for key in list(self._ram) + list(self._disk):
+                length = common_prefix_length(list(key), tokens)
+                # Snapshots longer than the shared prefix are still usable: the
+                # diverging tail is dropped from the KV cache after restoring
+                if length > best_length:
+                    best_key, best_length = key, length
+
+            if best_key is None or best_length < self.min_reuse_tokens:
+                return None
+
+            if best_key in self._ram:
+                self._ram.move_to_end(best_key)
+                return best_length, best_key, self._ram[best_key]
+
+            path, size = self._disk.pop(best_key)
+            self._disk_bytes -= size
+            with open(path, "rb") as f:
+                state = f.read()
+            os.remove(path)
+            self._put_ram(best_key, state)
+            return best_length, best_key, state
+
+    def record(self, reused_tokens: int) -> None:
+        """
+        Count a lookup outcome: a hit if enough prompt tokens were reused, a miss otherwise.
+        """
+        with self._lock:
+            if reused_tokens >= self.min_reuse_tokens:
+                self._hits += 1
+                self._tokens_reused += reused_tokens
+            else:
+                self._misses += 1
+
+    def store(self, tokens: List[int], state: bytes) -> None:
+        """
+        Save a snapshot of a context containing exactly `tokens`.
+        """
+        key = tuple(tokens)
+        if not key or len(state) > max(self.ram_budget_bytes, self.disk_budget_bytes):
+            return
+
+        with self._lock:
+            # A longer snapshot serves every request a shorter prefix of it could
+            for existing in [k for k in self._ram if key[:len(k)] == k]:
+                self._ram_bytes -= len(self._ram.pop(existing))
+            for existing in [k for k in self._disk if key[:len(k)] == k]:
+                path, size = self._disk.pop(existing)
+                self._disk_bytes -= size
+                os.remove(path)
+
+            self._put_ram(key, state)
+
+    def _put_ram(self, key: TokenKey, state: bytes) -> None:
+        if key in self._ram:
+            self._ram_bytes -= len(self._ram.pop(key))
+        self._ram[key] = state
+        self._ram_bytes += len(state)
+
+        while self._ram_bytes > self.ram_budget_bytes and self._ram:
+            evicted_key, evicted = self._ram.popitem(last=False)
+            self._ram_bytes -= len(evicted)
+            self._spill(evicted_key, evicted)
+
+    def _spill(self, key: TokenKey, state: bytes) -> None:
+        if len(state) > self.disk_budget_bytes:
+            self._evictions += 1
+            return
+
+        while self._disk_bytes + len(state) > self.disk_budget_bytes and self._disk:
+            _, (path, size) = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            os.remove(path)
+            self._evictions += 1
+
+        path = os.path.join(self.disk_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".kv")  # type: ignore[arg-type]
+        try:
+            with open(path, "wb") as f:
+                f.write(state)
+        except OSError as e:
+            logger.warning(f"Failed to spill prefix cache entry to disk: {e}")
+            self._evictions += 1
+            return
+        self._disk[key] = (path, len(state))
+        self._disk_bytes += len(state)
+
+    def clear(self) -> None:
+        """
+        Drop every snapshot, deleting the spilled ones.
+        """
+        with self._lock:
+            for path, _ in self._disk.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._ram.clear()
+            self._disk.clear()
+            self._ram_bytes = 0
+            self._disk_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "mode": "snapshot",
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "tokens_reused": self._tokens_reused,
+                "evictions": self._evictions,
+                "ram_entries": len(self._ram),
+                "ram_bytes": self._ram_bytes,
+                "ram_budget_bytes": self.ram_budget_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget_bytes": self.disk_budget_bytes,
+            }
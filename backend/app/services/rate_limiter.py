@@ -0,0 +1,223 @@
+import logging
+import math
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceededError(Exception):
+    """
+    Raised when a client has used up its token budget.
+    """
+
+    def __init__(self, key: str, retry_after: int, reason: str) -> None:
+        super().__init__(f"Rate limit exceeded: {reason}. Retry in {retry_after}s")
+        self.key = key
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    A client's token balance and its usage on the current UTC day.
+    """
+
+    def __init__(self, tokens: float, updated_at: float, day: str, used_today: int = 0) -> None:
+        self.tokens = tokens
+        self.updated_at = updated_at
+        self.day = day
+        self.used_today = used_today
+
+
+def _utc_day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).date().isoformat()
+
+
+def _seconds_until_next_day(timestamp: float) -> int:
+    now = datetime.fromtimestamp(timestamp, timezone.utc)
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return max(1, math.ceil((tomorrow - now).total_seconds()))
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limits per client, charged in model tokens rather than requests.
+
+    Each client's bucket holds up to `burst_tokens` and refills at `tokens_per_minute`.
+    A request is let through if its client's bucket covers its prompt (or is full,
+    for prompts larger than the burst) and is charged the prompt straight away, then
+    its reply once generated. A long reply can leave the bucket in debt, which holds
+    back the client's next request until it is paid off. `daily_tokens` additionally
+    caps each client's usage per UTC day. Either limit is disabled by setting it to 0.
+
+    With `db_path` set, balances are also written to a local SQLite database so they
+    survive a restart.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int,
+        burst_tokens: int,
+        daily_tokens: int = 0,
+        db_path: Optional[str] = None,
+    ) -> None:
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_tokens = burst_tokens
+        self.daily_tokens = daily_tokens
+        self.db_path = db_path
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_sweep = time.time()
+        self._rejected_total = 0
+        self._db: Optional[sqlite3.Connection] = None
+
+        if db_path and self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    day TEXT NOT NULL,
+                    used_today INTEGER NOT NULL
+                );
+            """)
+
+    @property
+    def enabled(self) -> bool:
+        return self.tokens_per_minute > 0 or self.daily_tokens > 0
+
+    def acquire(self, key: str, prompt_tokens: int) -> None:
+        """
+        Let a request through and charge its prompt, or reject it.
+
+        Raises:
+            RateLimitExceededError: If the client's bucket or daily quota can't cover it.
+        """
+        if not self.enabled:
+            return
+        self._sweep()
+        now = time.time()
+        bucket = self._get(key, now)
+
+        if self.daily_tokens > 0 and bucket.used_today + prompt_tokens > self.daily_tokens:
+            self._reject(key, _seconds_until_next_day(now), f"daily quota of {self.daily_tokens} tokens used")
+        if self.tokens_per_minute > 0:
+            needed = min(prompt_tokens, self.burst_tokens)
+            if bucket.tokens < needed:
+                retry_after = max(1, math.ceil(60 * (needed - bucket.tokens) / self.tokens_per_minute))
+                self._reject(key, retry_after, f"{self.tokens_per_minute} tokens per minute")
+
+        self._charge(key, bucket, prompt_tokens)
+
+    def charge(self, key: str, tokens: int) -> None:
+        """
+        Charge tokens used after a request was let through, or refund them if negative.
+        """
+        if not self.enabled or tokens == 0:
+            return
+        self._charge(key, self._get(key, time.time()), tokens)
+
+    def headers(self, key: str) -> Dict[str, str]:
+        """
+        Response headers describing what the client has left.
+        """
+        if not self.enabled:
+            return {}
+        bucket = self._get(key, time.time())
+        headers = {}
+        if self.tokens_per_minute > 0:
+            headers["X-RateLimit-Limit-Tokens"] = str(self.burst_tokens)
+            headers["X-RateLimit-Remaining-Tokens"] = str(max(0, int(bucket.tokens)))
+        if self.daily_tokens > 0:
+            headers["X-RateLimit-Limit-Daily-Tokens"] = str(self.daily_tokens)
+            headers["X-RateLimit-Remaining-Daily-Tokens"] = str(max(0, self.daily_tokens - bucket.used_today))
+        return headers
+
+    def _get(self, key: str, now: float) -> TokenBucket:
+        """
+        A client's bucket, refilled up to the current time.
+        """
+        bucket = self._buckets.get(key) or self._load(key)
+        if bucket is None:
+            bucket = TokenBucket(float(self.burst_tokens), now, _utc_day(now))
+            self._buckets[key] = bucket
+
+        elapsed = max(0.0, now - bucket.updated_at)
+        bucket.tokens = min(float(self.burst_tokens), bucket.tokens + elapsed * self.tokens_per_minute / 60)
+        bucket.updated_at = now
+        today = _utc_day(now)
+        if bucket.day != today:
+            bucket.day = today
+            bucket.used_today = 0
+        return bucket
+
+    def _charge(self, key: str, bucket: TokenBucket, tokens: int) -> None:
+        bucket.tokens -= tokens
+        bucket.used_today = max(0, bucket.used_today + tokens)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                (key, bucket.tokens, bucket.updated_at, bucket.day, bucket.used_today),
+            )
+
+    def _reject(self, key: str, retry_after: int, reason: str) -> None:
+        self._rejected_total += 1
+        logger.info(f"Rate limited {key}: {reason}")
+        raise RateLimitExceededError(key, retry_after, reason)
+
+    def _load(self, key: str) -> Optional[TokenBucket]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT tokens, updated_at, day, used_today FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        bucket = TokenBucket(*row)
+        self._buckets[key] = bucket
+        return bucket
+
+    def _sweep(self) -> None:
+        # A full bucket with nothing used today is the same as no bucket, so idle
+        # clients can be forgotten; once a minute is plenty
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+
+        for key in list(self._buckets):
+            bucket = self._get(key, now)
+            refilled = self.tokens_per_minute == 0 or bucket.tokens >= self.burst_tokens
+            if refilled and bucket.used_today == 0:
+                del self._buckets[key]
+        if self._db is not None:
+            # Rows last charged before today and long enough ago to have refilled
+            refill_seconds = 60 * self.burst_tokens / self.tokens_per_minute if self.tokens_per_minute > 0 else 0
+            self._db.execute("DELETE FROM buckets WHERE day < ? AND updated_at < ?", (_utc_day(now), now - refill_seconds))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "backend": "sqlite" if self._db is not None else "memory",
+            "tokens_per_minute": self.tokens_per_minute,
+            "burst_tokens": self.burst_tokens,
+            "daily_tokens": self.daily_tokens,
+            "clients_tracked": len(self._buckets),
+            "rejected_total": self._rejected_total,
+        }
+
+
+rate_limiter = RateLimiter(
+    tokens_per_minute=settings.RATE_LIMIT_TOKENS_PER_MINUTE,
+    burst_tokens=settings.RATE_LIMIT_BURST_TOKENS,
+    daily_tokens=settings.RATE_LIMIT_DAILY_TOKENS,
+    db_path=settings.RATE_LIMIT_DB_PATH or None,
+)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_cpp import ChatCompletionRequestMessage
+
+logger = logging.getLogger(__name__)
+
+
+def is_deterministic(temperature: float, seed: Optional[int]) -> bool:
+    """
+    Whether a request's sampling settings always produce the same reply.
+    """
+    return temperature <= 0 or seed is not None
+
+def response_cache_key(
+    model: str,
+    conversation: List[ChatCompletionRequestMessage],
+    temperature: float,
+    seed: Optional[int],
+    max_tokens: int,
+) -> str:
+    """
+    Hash everything that determines a deterministic reply. Message text is normalized
+    (line endings, surrounding whitespace) so trivially different copies of the same
+    prompt share an entry.
+    """
+    messages = [
+        [m["role"], (m["content"] or "").replace("\r\n", "\n").strip()]  # type: ignore[typeddict-item]
+        for m in conversation
+    ]
+    payload = {
+        "model": model,
+        "messages": messages,
+        # Any temperature <= 0 is greedy, and greedy decoding ignores the seed
+        "temperature": max(temperature, 0.0),
+        "seed": seed if temperature > 0 else None,
+        "max_tokens": max_tokens,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU cache of complete replies to deterministic requests, stored as the chunks
+    they were streamed in so a hit can be replayed through the same stream.
+
+    Entries expire `ttl_seconds` after they were stored. With `path` set, entries
+    are appended to a JSON-lines file and reloaded on startup; the file is
+    rewritten without stale lines when it is loaded, and again whenever it has
+    grown to twice as many lines as there are live entries.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, path: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        # Lines in the file, live or not
+        self._lines = 0
+        self._hits = 0
+        self._misses = 0
+        self._bytes_served = 0
+
+        if path:
+            self._load()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """
+        The cached reply chunks for `key`, or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        self._bytes_served += sum(len(chunk.encode("utf-8")) for chunk in entry[1])
+        return entry[1]
+
+    def put(self, key: str, chunks: List[str]) -> None:
+        created_at = time.time()
+        self._insert(key, created_at, chunks)
+        if self.path:
+            try:
+                if self._lines + 1 > 2 * len(self._entries):
+                    self._compact()
+                else:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"key": key, "created_at": created_at, "chunks": chunks}) + "\n")
+                    self._lines += 1
+            except OSError as e:
+                logger.warning(f"Failed to persist response cache entry: {e}")
+
+    def _insert(self, key: str, created_at: float, chunks: List[str]) -> None:
+        self._entries[key] = (created_at, chunks)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self) -> None:
+        assert self.path is not None
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            return
+
+        now = time.time()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if now - entry["created_at"] <= self.ttl_seconds:
+                        self._insert(entry["key"], entry["created_at"], entry["chunks"])
+
+            self._compact()
+            logger.info(f"Loaded {len(self._entries)} cached responses from {self.path}")
+        except OSError as e:
+            logger.warning(f"Failed to load response cache from {self.path}: {e}")
+
+    def _compact(self) -> None:
+        """
+        Rewrite the file with only the live entries, replacing it atomically.
+        """
+        assert self.path is not None
+        now = time.time()
+        for key in [key for key, (created_at, _) in self._entries.items() if now - created_at > self.ttl_seconds]:
+            del self._entries[key]
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for key, (created_at, chunks) in self._entries.items():
+                f.write(json.dumps({"key": key, "created_at": created_at, "chunks": chunks}) + "\n")
+        os.replace(temp_path, self.path)
+        self._lines = len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "enabled": True,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "bytes_served": self._bytes_served,
+        }
@@ -0,0 +1,111 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+
+class Sampler:
+    """
+    Token sampler for the low-level decode loops, mirroring the llama.cpp defaults
+    used by `Llama.create_chat_completion` (repeat penalty, top-k, top-p, min-p,
+    temperature).
+
+    Each request owns its own sampler so that a fixed seed always produces the same
+    sequence of draws, independent of what other requests are doing.
+    """
+
+    def __init__(
+        self,
+        temperature: float = 0.7,
+        top_k: int = 40,
+        top_p: float = 0.95,
+        min_p: float = 0.05,
+        repeat_penalty: float = 1.1,
+        repeat_last_n: int = 64,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.min_p = min_p
+        self.repeat_penalty = repeat_penalty
+        self.repeat_last_n = repeat_last_n
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def greedy(self) -> bool:
+        return self.temperature <= 0
+
+    def sample(self, logits: npt.NDArray[np.float32], history: Sequence[int]) -> int:
+        """
+        Pick the next token.
+
+        Args:
+            logits: Raw logits for the next position (not modified).
+            history: Tokens seen so far in the sequence, used for the repeat penalty.
+
+        Returns:
+            The sampled token id.
+        """
+        logits = self._apply_repeat_penalty(logits, history)
+
+        if self.greedy:
+            return int(np.argmax(logits))
+
+        k = min(self.top_k, logits.shape[0]) if self.top_k > 0 else logits.shape[0]
+        candidates = np.argpartition(logits, -k)[-k:]
+        candidate_logits = logits[candidates].astype(np.float64)
+
+        order = np.argsort(-candidate_logits)
+        candidates = candidates[order]
+        candidate_logits = candidate_logits[order]
+
+        probs = np.exp(candidate_logits - candidate_logits[0])
+        probs /= probs.sum()
+
+        keep = len(probs)
+        if self.top_p < 1.0:
+            keep = min(keep, int(np.searchsorted(np.cumsum(probs), self.top_p)) + 1)
+        if self.min_p > 0.0:
+            keep = min(keep, max(1, int(np.count_nonzero(probs >= self.min_p * probs[0]))))
+
+        scaled = candidate_logits[:keep] / self.temperature
+        probs = np.exp(scaled - scaled[0])
+        probs /= probs.sum()
+
+        return int(candidates[self.rng.choice(keep, p=probs)])
+
+    def _apply_repeat_penalty(self, logits: npt.NDArray[np.float32], history: Sequence[int]) -> npt.NDArray[np.float32]:
+        if self.repeat_penalty == 1.0 or not history:
+            return logits
+
+        recent = np.unique(np.asarray(history[-self.repeat_last_n:], dtype=np.intc))
+        penalized = logits.copy()
+        values = penalized[recent]
+        penalized[recent] = np.where(values > 0, values / self.repeat_penalty, values * self.repeat_penalty)
+        return penalized
+
+
+def find_stop(text: str, stops: List[str]) -> int:
+    """
+    Find the earliest stop sequence in `text`.
+
+    Returns:
+        The index where the stop sequence starts, or -1 if none is present.
+    """
+    positions = [i for i in (text.find(stop) for stop in stops if stop) if i >= 0]
+    return min(positions) if positions else -1
+
+
+def partial_stop_length(text: str, stops: List[str]) -> int:
+    """
+    Length of the longest suffix of `text` that could be the start of a stop sequence.
+    That many characters must be held back until more text arrives.
+    """
+    longest = 0
+    for stop in stops:
+        for length in range(min(len(stop) - 1, len(text)), longest, -1):
+            if text.endswith(stop[:length]):
+                longest = length
+                break
+    return longest
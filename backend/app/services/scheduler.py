@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a request cannot be queued because the scheduler is at capacity.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Server is busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    A single request's place in the scheduler, from submission until release.
+    """
+
+    def __init__(self, ticket_id: int, client: str, future: "asyncio.Future[None]", background: bool = False) -> None:
+        self.id = ticket_id
+        self.client = client
+        self.background = background
+        # Set when an interactive request needs this background ticket's slot
+        self.preempted = asyncio.Event()
+        self.position = 0
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._future = future
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    @property
+    def wait_time(self) -> float:
+        """
+        Seconds spent waiting in the queue (so far, if not yet admitted).
+        """
+        end = self.admitted_at if self.admitted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class RequestScheduler:
+    """
+    Bounded FIFO admission control in front of the model.
+
+    At most `max_concurrency` requests hold the model at once; up to `max_queue_depth`
+    more wait in arrival order. Anything beyond that is rejected with a retry hint
+    instead of piling up in memory.
+
+    Background tickets (batch jobs) wait in a separate, unbounded queue and are only
+    admitted when no interactive request is waiting. An interactive request that has
+    to queue preempts a running background ticket, whose holder is expected to stop
+    and release it.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_depth: int) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+
+        self._active = 0
+        self._waiting: Deque[Ticket] = deque()
+        self._background: Deque[Ticket] = deque()
+        self._running_background: List[Ticket] = []
+        self._next_id = 0
+
+        self._avg_service_time = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+        self._admitted_total = 0
+        self._rejected_total = 0
+        self._preempted_total = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    def submit(self, client: str = "unknown", background: bool = False) -> Ticket:
+        """
+        Reserve a place for a request, admitting it immediately if a slot is free.
+
+        Args:
+            client: Identifier of the requesting client, used for logging.
+            background: Whether this is low-priority work that any interactive
+                request may preempt. Background tickets are never rejected.
+
+        Returns:
+            The request's ticket. `ticket.position` is 0 if it was admitted straight
+            away, otherwise its 1-based position in the queue.
+
+        Raises:
+            QueueFullError: If the queue is already at its maximum depth.
+        """
+        self._next_id += 1
+        ticket = Ticket(self._next_id, client, asyncio.get_running_loop().create_future(), background)
+
+        if self._active < self.max_concurrency and not self._waiting and not (background and self._background):
+            self._admit(ticket)
+            return ticket
+
+        if background:
+            self._background.append(ticket)
+            ticket.position = len(self._background)
+            return ticket
+
+        if len(self._waiting) >= self.max_queue_depth:
+            self._rejected_total += 1
+            retry_after = self.estimate_retry_after()
+            logger.warning(f"Rejecting request from {client}: queue full ({len(self._waiting)} waiting)")
+            raise QueueFullError(retry_after)
+
+        self._waiting.append(ticket)
+        ticket.position = len(self._waiting)
+        logger.info(f"Queued request {ticket.id} from {client} at position {ticket.position}")
+        self._preempt_background()
+        return ticket
+
+    async def acquire(self, ticket: Ticket) -> None:
+        """
+        Wait until the ticket is admitted. If the caller is cancelled while waiting,
+        the ticket leaves the queue.
+        """
+        try:
+            await ticket._future
+        except asyncio.CancelledError:
+            self.release(ticket)
+            raise
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Give up the ticket's slot (or queue position) and admit the next waiter.
+        Safe to call more than once.
+        """
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if not ticket.admitted:
+            try:
+                (self._background if ticket.background else self._waiting).remove(ticket)
+            except ValueError:
+                pass
+            if not ticket._future.done():
+                ticket._future.cancel()
+            return
+
+        self._active -= 1
+        if ticket.background:
+            self._running_background.remove(ticket)
+        else:
+            service_time = time.monotonic() - ticket.admitted_at  # type: ignore[operator]
+            self._avg_service_time = (
+                service_time if self._avg_service_time == 0.0
+                else 0.8 * self._avg_service_time + 0.2 * service_time
+            )
+
+        while self._waiting and self._active < self.max_concurrency:
+            self._admit(self._waiting.popleft())
+        while self._background and not self._waiting and self._active < self.max_concurrency:
+            self._admit(self._background.popleft())
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        Current 1-based queue position of the ticket, or 0 once it has been admitted.
+        """
+        if ticket.admitted:
+            return 0
+        try:
+            return (self._background if ticket.background else self._waiting).index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def estimate_retry_after(self) -> int:
+        """
+        Rough number of seconds until a newly submitted request would be admitted.
+        """
+        per_request = self._avg_service_time or 1.0
+        return max(1, math.ceil(per_request * (len(self._waiting) + 1) / self.max_concurrency))
+
+    def _preempt_background(self) -> None:
+        """
+        Ask enough running background tickets to stop that every waiting interactive
+        request will get a slot, most recently admitted first.
+        """
+        pending = sum(1 for t in self._running_background if t.preempted.is_set())
+        for ticket in reversed(self._running_background):
+            if pending >= len(self._waiting):
+                return
+            if not ticket.preempted.is_set():
+                ticket.preempted.set()
+                pending += 1
+                self._preempted_total += 1
+                logger.info(f"Preempting background request {ticket.id} from {ticket.client}")
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted_at = time.monotonic()
+        ticket.position = 0
+        self._active += 1
+        if ticket.background:
+            self._running_background.append(ticket)
+            if not ticket._future.done():
+                ticket._future.set_result(None)
+            return
+        self._admitted_total += 1
+        self._recent_waits.append(ticket.wait_time)
+        if not ticket._future.done():
+            ticket._future.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = sorted(self._recent_waits)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "active": self._active,
+            "queue_depth": len(self._waiting),
+            "admitted_total": self._admitted_total,
+            "rejected_total": self._rejected_total,
+            "background_active": len(self._running_background),
+            "background_queue_depth": len(self._background),
+            "background_preempted_total": self._preempted_total,
+            "avg_service_time_seconds": round(self._avg_service_time, 3),
+            "queue_wait_avg_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "queue_wait_p95_seconds": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+        }
+
+
+def _default_concurrency() -> int:
+    if settings.MAX_CONCURRENT_REQUESTS is not None:
+        return settings.MAX_CONCURRENT_REQUESTS
+    # A single context can only serve one stream; the batched engine serves one per slot
+    return settings.N_SLOTS if settings.ENGINE_MODE == "batched" else 1
+
+
+scheduler = RequestScheduler(
+    max_concurrency=_default_concurrency(),
+    max_queue_depth=settings.MAX_QUEUE_DEPTH,
+)
@@ -0,0 +1,210 @@
+import array
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from llama_cpp import ChatCompletionRequestMessage
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SessionNotFoundError(Exception):
+    """
+    Raised when a session does not exist or has expired.
+    """
+
+    def __init__(self, session_id: str) -> None:
+        super().__init__(f"Session {session_id} not found")
+        self.session_id = session_id
+
+
+class Session:
+    """
+    A conversation kept on the server, with the tokens of each message cached
+    alongside it so they never need to be computed twice.
+    """
+
+    def __init__(self, session_id: str, created_at: float, model: Optional[str] = None) -> None:
+        self.id = session_id
+        self.model = model
+        self.created_at = created_at
+        self.last_access = created_at
+        self.messages: List[ChatCompletionRequestMessage] = []
+        self.message_tokens: List[List[int]] = []
+
+    @property
+    def n_tokens(self) -> int:
+        return sum(len(tokens) for tokens in self.message_tokens)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "model": self.model,
+            "created_at": self.created_at,
+            "last_access": self.last_access,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in self.messages],
+            "n_tokens": self.n_tokens,
+        }
+
+
+class SessionStore:
+    """
+    Conversation sessions held in memory, evicted after `ttl_seconds` without use
+    or, least recently used first, once there are more than `max_sessions`.
+
+    With `db_path` set, every change is also written to a local SQLite database.
+    Sessions evicted from memory for space are then reloaded from disk on their
+    next use, and sessions survive a restart until their TTL runs out.
+    """
+
+    def __init__(self, ttl_seconds: int, max_sessions: int, db_path: Optional[str] = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.db_path = db_path
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._last_sweep = time.time()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    model TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    message TEXT NOT NULL,
+                    tokens BLOB NOT NULL,
+                    PRIMARY KEY (session_id, position)
+                );
+            """)
+
+    def create(self, model: Optional[str] = None) -> Session:
+        """
+        Start an empty session, optionally bound to a model other than the default.
+        """
+        self._sweep()
+        now = time.time()
+        session = Session(uuid.uuid4().hex, now, model)
+        self._put(session)
+        if self._db is not None:
+            self._db.execute("INSERT INTO sessions VALUES (?, ?, ?, ?)", (session.id, model, now, now))
+        return session
+
+    def get(self, session_id: str) -> Session:
+        """
+        Look up a live session and mark it as used.
+
+        Raises:
+            SessionNotFoundError: If the session does not exist or has expired.
+        """
+        self._sweep()
+        now = time.time()
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id)
+        if session is None or now - session.last_access > self.ttl_seconds:
+            self.delete(session_id)
+            raise SessionNotFoundError(session_id)
+
+        session.last_access = now
+        self._put(session)
+        if self._db is not None:
+            self._db.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+        return session
+
+    def append(self, session: Session, message: ChatCompletionRequestMessage, tokens: List[int]) -> None:
+        """
+        Add a message and its tokens to the end of a session.
+        """
+        session.messages.append(message)
+        session.message_tokens.append(tokens)
+        session.last_access = time.time()
+        if self._db is not None:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT INTO messages VALUES (?, ?, ?, ?)",
+                (session.id, len(session.messages) - 1, json.dumps(message), array.array("i", tokens).tobytes()),
+            )
+            self._db.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (session.last_access, session.id))
+            self._db.execute("COMMIT")
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Remove a session. Returns whether it existed.
+        """
+        existed = self._sessions.pop(session_id, None) is not None
+        if self._db is not None:
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            existed = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0 or existed
+        return existed
+
+    def _put(self, session: Session) -> None:
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            if self._db is None:
+                logger.info(f"Evicting session {evicted_id}: over the limit of {self.max_sessions} sessions")
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT model, created_at, last_access FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+
+        session = Session(session_id, row[1], row[0])
+        session.last_access = row[2]
+        for message, tokens in self._db.execute(
+            "SELECT message, tokens FROM messages WHERE session_id = ? ORDER BY position", (session_id,)
+        ):
+            session.messages.append(json.loads(message))
+            session.message_tokens.append(array.array("i", tokens).tolist())
+        return session
+
+    def _sweep(self) -> None:
+        # Expiry is checked on access anyway; the sweep just bounds memory held by
+        # abandoned sessions, so once a minute is plenty
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+
+        cutoff = now - self.ttl_seconds
+        for session_id in [s.id for s in self._sessions.values() if s.last_access < cutoff]:
+            del self._sessions[session_id]
+        if self._db is not None:
+            self._db.execute("DELETE FROM messages WHERE session_id IN (SELECT id FROM sessions WHERE last_access < ?)", (cutoff,))
+            self._db.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite" if self._db is not None else "memory",
+            "sessions_in_memory": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+session_store = SessionStore(
+    ttl_seconds=settings.SESSION_TTL_SECONDS,
+    max_sessions=settings.MAX_SESSIONS,
+    db_path=settings.SESSION_DB_PATH or None,
+)
@@ -0,0 +1,142 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import llama_cpp
+import numpy as np
+
+from app.utils.prompt_utils import common_prefix_length
+
+logger = logging.getLogger(__name__)
+
+
+class Drafter(ABC):
+    """
+    Proposes the tokens a sequence is likely to continue with, for the batch engine
+    to verify in a single decode. Sequences are identified by their engine slot.
+    """
+
+    mode = "none"
+    # Drafters that run a model must share the main model's vocabulary
+    n_vocab: Optional[int] = None
+
+    @abstractmethod
+    def draft(self, seq_id: int, tokens: List[int], n: int) -> List[int]:
+        """
+        Guess up to `n` tokens following `tokens`, the whole sequence so far.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class PromptLookupDrafter(Drafter):
+    """
+    Drafts by finding the latest earlier occurrence of the sequence's last few tokens
+    and proposing whatever followed it. Costs no model evaluation, and works well
+    whenever replies quote the prompt or earlier turns (code, names, summaries).
+    """
+
+    mode = "prompt_lookup"
+
+    def __init__(self, max_ngram: int = 3, min_ngram: int = 2) -> None:
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+
+    def draft(self, seq_id: int, tokens: List[int], n: int) -> List[int]:
+        for size in range(self.max_ngram, self.min_ngram - 1, -1):
+            if len(tokens) <= size:
+                continue
+            pattern = tokens[-size:]
+            for start in range(len(tokens) - size - 1, -1, -1):
+                if tokens[start:start + size] == pattern:
+                    return tokens[start + size:start + size + n]
+        return []
+
+
+class DraftModel(Drafter):
+    """
+    Drafts greedily with a small model sharing the main model's vocabulary.
+
+    The draft context mirrors the engine's slot layout: one sequence of `seq_ctx`
+    tokens per slot. Each sequence keeps what it has already evaluated, so drafting
+    only evaluates the tokens accepted since the last call.
+    """
+
+    mode = "draft_model"
+
+    def __init__(
+        self,
+        model_path: str,
+        n_seq: int,
+        seq_ctx: int,
+        n_batch: int,
+        n_threads: Optional[int],
+        use_mmap: bool = True,
+    ) -> None:
+        self.n_batch = n_batch
+
+        model_params = llama_cpp.llama_model_default_params()
+        model_params.use_mmap = use_mmap
+        self.model = llama_cpp.llama_load_model_from_file(model_path.encode("utf-8"), model_params)
+        if not self.model:
+            raise RuntimeError(f"Failed to load draft model from {model_path}")
+        self.n_vocab = llama_cpp.llama_n_vocab(self.model)
+
+        ctx_params = llama_cpp.llama_context_default_params()
+        ctx_params.n_ctx = n_seq * seq_ctx
+        ctx_params.n_batch = n_batch
+        if n_threads:
+            ctx_params.n_threads = n_threads
+            ctx_params.n_threads_batch = n_threads
+        self.ctx = llama_cpp.llama_new_context_with_model(self.model, ctx_params)
+        if not self.ctx:
+            llama_cpp.llama_free_model(self.model)
+            raise RuntimeError("Failed to create the draft model's context")
+
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+        self._evaluated: Dict[int, List[int]] = {}
+        logger.info(f"Loaded draft model from {model_path}")
+
+    def draft(self, seq_id: int, tokens: List[int], n: int) -> List[int]:
+        evaluated = self._evaluated.get(seq_id, [])
+        # Re-evaluate at least the last token to get logits for the first draft
+        keep = min(common_prefix_length(evaluated, tokens), len(tokens) - 1)
+        llama_cpp.llama_kv_cache_seq_rm(self.ctx, seq_id, keep, -1)
+
+        for start in range(keep, len(tokens), self.n_batch):
+            self._decode(seq_id, tokens[start:start + self.n_batch], start)
+
+        drafts: List[int] = []
+        while True:
+            logits = np.ctypeslib.as_array(
+                llama_cpp.llama_get_logits_ith(self.ctx, self.batch.n_tokens - 1),
+                shape=(self.n_vocab,),
+            )
+            drafts.append(int(np.argmax(logits)))
+            if len(drafts) >= n:
+                break
+            self._decode(seq_id, drafts[-1:], len(tokens) + len(drafts) - 1)
+
+        self._evaluated[seq_id] = tokens + drafts[:-1]
+        return drafts
+
+    def _decode(self, seq_id: int, tokens: List[int], pos: int) -> None:
+        for i, token in enumerate(tokens):
+            self.batch.token[i] = token
+            self.batch.pos[i] = pos + i
+            self.batch.n_seq_id[i] = 1
+            self.batch.seq_id[i][0] = seq_id
+            self.batch.logits[i] = i == len(tokens) - 1
+        self.batch.n_tokens = len(tokens)
+        result = llama_cpp.llama_decode(self.ctx, self.batch)
+        if result != 0:
+            # The sequence's cache no longer matches what was recorded as evaluated
+            llama_cpp.llama_kv_cache_seq_rm(self.ctx, seq_id, -1, -1)
+            self._evaluated.pop(seq_id, None)
+            raise RuntimeError(f"Draft model llama_decode returned {result}")
+
+    def close(self) -> None:
+        llama_cpp.llama_batch_free(self.batch)
+        llama_cpp.llama_free(self.ctx)
+        llama_cpp.llama_free_model(self.model)
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.sse_utils import format_sse_event
+
+logger = logging.getLogger(__name__)
+
+
+class StreamNotFoundError(Exception):
+    """
+    Raised when a stream does not exist or has expired.
+    """
+
+    def __init__(self, stream_id: str) -> None:
+        super().__init__(f"Stream {stream_id} not found")
+        self.stream_id = stream_id
+
+
+class StreamGapError(Exception):
+    """
+    Raised when events a client asks to resume from have already left the buffer.
+    """
+
+    def __init__(self, stream_id: str, last_event_id: int) -> None:
+        super().__init__(f"Events after {last_event_id} of stream {stream_id} are no longer buffered")
+        self.stream_id = stream_id
+        self.last_event_id = last_event_id
+
+
+class ReplayStream:
+    """
+    The server-sent events of one reply, kept so that a client whose connection
+    dropped can reconnect and pick up after the last event it received.
+
+    Generation publishes events here from its own task rather than writing them to
+    the connection, so it carries on while no client is attached. Once the last
+    reader goes away, generation is cancelled unless a client reattaches within
+    `detach_grace_seconds`.
+    """
+
+    def __init__(self, stream_id: str, max_events: int, detach_grace_seconds: float) -> None:
+        self.id = stream_id
+        self.detach_grace_seconds = detach_grace_seconds
+        self.producer: Optional["asyncio.Task[None]"] = None
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.readers = 0
+
+        self._events: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        self._last_id = 0
+        self._changed = asyncio.Event()
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def last_event_id(self) -> int:
+        return self._last_id
+
+    def publish(self, data: str, event: Optional[str] = None) -> None:
+        """
+        Add an event, numbered after the previous one.
+        """
+        self._last_id += 1
+        self._events.append((self._last_id, format_sse_event(data, event=event, event_id=self._last_id)))
+        self._changed.set()
+
+    def close(self) -> None:
+        """
+        Mark the stream as complete; readers finish once they have every event.
+        """
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._cancel_abandon_timer()
+        self._changed.set()
+
+    def cancel(self) -> None:
+        """
+        Stop generation, e.g. because the client no longer wants the reply.
+        """
+        if not self.done and self.producer is not None:
+            self.producer.cancel()
+
+    def check_resumable(self, last_event_id: int) -> None:
+        """
+        Raises:
+            StreamGapError: If events after `last_event_id` have been dropped.
+        """
+        if self._events and last_event_id < self._events[0][0] - 1:
+            raise StreamGapError(self.id, last_event_id)
+
+    async def read(self, last_event_id: int = 0) -> AsyncIterator[str]:
+        """
+        Yield the formatted events after `last_event_id`, waiting for new ones until
+        the stream is complete.
+        """
+        self.readers += 1
+        self._cancel_abandon_timer()
+        try:
+            sent = last_event_id
+            while True:
+                for event_id, frame in list(self._events):
+                    if event_id > sent:
+                        sent = event_id
+                        yield frame
+                if self.done:
+                    return
+                # Nothing can be published between the loop above and this wait
+                self._changed.clear()
+                await self._changed.wait()
+        finally:
+            self.readers -= 1
+            self.detach()
+
+    def detach(self) -> None:
+        """
+        Start the grace period for cancelling generation if nobody is reading.
+        """
+        if self.readers > 0 or self.done or self._abandon_timer is not None:
+            return
+        self._abandon_timer = asyncio.get_running_loop().call_later(self.detach_grace_seconds, self._abandon)
+
+    def _abandon(self) -> None:
+        self._abandon_timer = None
+        if self.readers == 0 and not self.done:
+            logger.info(f"No client reattached to stream {self.id}, cancelling its generation")
+            self.cancel()
+
+    def _cancel_abandon_timer(self) -> None:
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+
+class StreamRegistry:
+    """
+    Replayable streams by id, each kept for `ttl_seconds` after it completes.
+    """
+
+    def __init__(self, ttl_seconds: float, max_events: int, detach_grace_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self.detach_grace_seconds = detach_grace_seconds
+        self._streams: Dict[str, ReplayStream] = {}
+        self._resumed_total = 0
+
+    def create(self) -> ReplayStream:
+        self._sweep()
+        stream = ReplayStream(uuid.uuid4().hex, self.max_events, self.detach_grace_seconds)
+        self._streams[stream.id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> ReplayStream:
+        """
+        Raises:
+            StreamNotFoundError: If there is no stream with that id, or it has expired.
+        """
+        self._sweep()
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            raise StreamNotFoundError(stream_id)
+        return stream
+
+    def resume(self, stream_id: str, last_event_id: int) -> ReplayStream:
+        """
+        Look up a stream for a client reconnecting after `last_event_id`.
+
+        Raises:
+            StreamNotFoundError: If there is no stream with that id, or it has expired.
+            StreamGapError: If events after `last_event_id` have been dropped.
+        """
+        stream = self.get(stream_id)
+        stream.check_resumable(last_event_id)
+        self._resumed_total += 1
+        logger.info(f"Resuming stream {stream_id} after event {last_event_id} of {stream.last_event_id}")
+        return stream
+
+    def _sweep(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [s.id for s in self._streams.values() if s.finished_at is not None and s.finished_at < cutoff]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self._streams),
+            "streams_generating": sum(1 for s in self._streams.values() if not s.done),
+            "streams_detached": sum(1 for s in self._streams.values() if not s.done and s.readers == 0),
+            "resumed_total": self._resumed_total,
+        }
+
+
+stream_registry = StreamRegistry(
+    ttl_seconds=settings.STREAM_RESUME_TTL_SECONDS,
+    max_events=settings.STREAM_RESUME_MAX_EVENTS,
+    detach_grace_seconds=settings.STREAM_DETACH_GRACE_SECONDS,
+)
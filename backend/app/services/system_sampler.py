@@ -0,0 +1,137 @@
+import asyncio
+import ctypes
+import logging
+import mmap
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+import psutil
+
+from app.config import settings
+from app.services.metrics import ACTIVE_STREAMS
+from app.services.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+_libc: Optional[ctypes.CDLL] = None
+if sys.platform.startswith("linux"):
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _libc.mmap.restype = ctypes.c_void_p
+    _libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    _libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    _libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+
+_MAP_FAILED = ctypes.c_void_p(-1).value
+
+
+def page_cache_residency(path: str) -> Optional[float]:
+    """
+    Fraction of a file's pages currently in the page cache, or None where that can't
+    be measured. Maps the file without touching it, so nothing is read from disk.
+    """
+    if _libc is None:
+        return None
+    try:
+        size = os.path.getsize(path)
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    if size == 0:
+        os.close(fd)
+        return None
+
+    try:
+        addr = _libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, _MAP_FAILED):
+            return None
+        try:
+            n_pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+            pages = (ctypes.c_ubyte * n_pages)()
+            if _libc.mincore(addr, size, pages) != 0:
+                return None
+            # Only the lowest bit is defined, and it is set for resident pages
+            return round((n_pages - bytes(pages).count(0)) / n_pages, 4)
+        finally:
+            _libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+
+class SystemSampler:
+    """
+    Keeps a snapshot of system and process resource usage, refreshed in the
+    background every `interval_seconds`, so health checks serve the latest
+    snapshot instead of querying the OS on every request.
+    """
+
+    def __init__(self, interval_seconds: float, model_paths: Callable[[], Dict[str, str]]) -> None:
+        self.interval_seconds = interval_seconds
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.sampled_at: Optional[float] = None
+
+        self._model_paths = model_paths
+        self._process = psutil.Process()
+        self._static = {
+            "platform": platform.system(),
+            "platform_version": platform.version(),
+            "python_version": platform.python_version(),
+            "cpu_count": psutil.cpu_count(),
+        }
+        # The first call only starts the measurement window for the next one
+        psutil.cpu_percent(interval=None)
+
+    def sample(self, model_paths: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Take a new snapshot and make it the current one.
+
+        Args:
+            model_paths: The loaded models' files, looked up here if not given. Pass
+                them in when sampling off the event loop, as the lookup isn't thread-safe.
+        """
+        if model_paths is None:
+            model_paths = self._model_paths()
+        memory = psutil.virtual_memory()
+        active_streams = sum(sample.value for metric in ACTIVE_STREAMS.collect() for sample in metric.samples)
+        self.snapshot = {
+            **self._static,
+            # CPU usage since the previous sample, without blocking
+            "cpu_usage_percent": psutil.cpu_percent(interval=None),
+            "memory_total": memory.total,
+            "memory_available": memory.available,
+            "memory_used_percent": memory.percent,
+            "process_rss": self._process.memory_info().rss,
+            "model_page_cache_residency": {
+                name: page_cache_residency(path) for name, path in model_paths.items()
+            },
+            "active_streams": int(active_streams),
+        }
+        self.sampled_at = time.time()
+        return self.snapshot
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """
+        The latest snapshot with its age in seconds, sampling once if there is none yet.
+        """
+        snapshot = self.snapshot if self.snapshot is not None else self.sample()
+        assert self.sampled_at is not None
+        return {**snapshot, "sampled_at": self.sampled_at, "age_seconds": round(time.time() - self.sampled_at, 3)}
+
+    async def run(self) -> None:
+        """
+        Refresh the snapshot until cancelled.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.sample, self._model_paths())
+            except Exception as e:
+                logger.warning(f"Failed to sample system stats: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+system_sampler = SystemSampler(
+    interval_seconds=settings.HEALTH_SAMPLE_INTERVAL_SECONDS,
+    model_paths=model_registry.loaded_paths,
+)
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncIterator, Deque, Optional
+
+
+class TokenStream:
+    """
+    Hands generated text from a decode thread to a coroutine on the event loop.
+
+    The producer appends to a deque under a lock and only schedules a wakeup
+    (`call_soon_threadsafe`) when the consumer is actually waiting, so a burst of
+    tokens costs one loop wakeup instead of one per token. With `maxsize > 0` the
+    producer blocks while that many items are unread, which throttles generation
+    to the speed of a slow client. Once the consumer goes away the stream is
+    cancelled and `put` returns False so the producer can stop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 0) -> None:
+        self.maxsize = maxsize
+        self.cancelled = threading.Event()
+        self.error: Optional[Exception] = None
+
+        self._loop = loop
+        self._items: Deque[str] = deque()
+        self._closed = False
+        self._consumer_waiting = False
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._ready = asyncio.Event()
+
+    def put(self, text: str) -> bool:
+        """
+        Queue a piece of text for the consumer. Called from the producer thread.
+
+        Returns:
+            False if the consumer has gone away and generation should stop.
+        """
+        with self._not_full:
+            while self.maxsize > 0 and len(self._items) >= self.maxsize and not self.cancelled.is_set():
+                self._not_full.wait(timeout=0.1)
+            if self.cancelled.is_set():
+                return False
+            self._items.append(text)
+            wake = self._consumer_waiting
+            self._consumer_waiting = False
+
+        if wake:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        return True
+
+    def close(self, error: Optional[Exception] = None) -> None:
+        """
+        Mark the end of the stream, optionally with an error for the consumer to raise.
+        """
+        with self._lock:
+            self.error = error
+            self._closed = True
+            wake = self._consumer_waiting
+            self._consumer_waiting = False
+
+        if wake:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    def cancel(self) -> None:
+        """
+        Stop accepting items and release a producer blocked on a full stream.
+        """
+        with self._not_full:
+            self.cancelled.set()
+            self._not_full.notify_all()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        try:
+            while True:
+                with self._not_full:
+                    if self._items:
+                        item: Optional[str] = self._items.popleft()
+                        self._not_full.notify()
+                    elif self._closed:
+                        break
+                    else:
+                        item = None
+                        self._consumer_waiting = True
+                        self._ready.clear()
+
+                if item is None:
+                    await self._ready.wait()
+                    continue
+                yield item
+
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.cancel()
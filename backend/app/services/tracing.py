@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Spans derived from a trace's events: name, start event, end event
+_SPANS = (
+    ("queue", "queued", "admitted"),
+    # Template rendering, tokenization and the handoff to the decode thread
+    ("prepare", "admitted", "prompt_eval_start"),
+    ("prompt_eval", "prompt_eval_start", "prompt_eval_end"),
+    ("time_to_first_token", "received", "first_token"),
+    ("decode", "first_token", "last_token"),
+    ("total", "received", "stream_closed"),
+)
+
+
+class Trace:
+    """
+    The timeline of one request through the generation pipeline.
+
+    Events are named points in time on the monotonic clock, recorded with `mark`
+    from the event loop or the decode thread. Only the first event of each name counts.
+    """
+
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.started_at = time.time()
+        self.start = time.monotonic()
+        self.events: List[Tuple[str, float]] = []
+        self.attributes: Dict[str, Any] = {}
+
+    def mark(self, name: str) -> None:
+        self.events.append((name, time.monotonic()))
+
+    def offsets(self) -> Dict[str, float]:
+        """
+        Seconds from the start of the trace to each event.
+        """
+        offsets: Dict[str, float] = {}
+        for name, timestamp in list(self.events):
+            offsets.setdefault(name, timestamp - self.start)
+        return offsets
+
+    def to_dict(self) -> Dict[str, Any]:
+        offsets = self.offsets()
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "attributes": self.attributes,
+            "events_ms": {name: round(offset * 1000, 3) for name, offset in offsets.items()},
+            "spans_ms": {
+                name: round((offsets[end] - offsets[start]) * 1000, 3)
+                for name, start, end in _SPANS
+                if start in offsets and end in offsets
+            },
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        The trace in the OpenTelemetry protocol's JSON encoding: a root span for the
+        request, with the derived spans as children and the events attached to it.
+        """
+        offsets = self.offsets()
+        trace_id = hashlib.sha256(self.request_id.encode("utf-8")).hexdigest()[:32]
+        root_id = trace_id[:16]
+
+        def unix_nano(offset: float) -> str:
+            return str(int((self.started_at + offset) * 1e9))
+
+        def span_id(name: str) -> str:
+            return hashlib.sha256(f"{self.request_id}:{name}".encode("utf-8")).hexdigest()[:16]
+
+        attributes = [
+            {"key": key, "value": {"intValue": str(value)} if isinstance(value, int) else {"stringValue": str(value)}}
+            for key, value in {"request_id": self.request_id, **self.attributes}.items()
+        ]
+        spans = [{
+            "traceId": trace_id,
+            "spanId": root_id,
+            "name": "chat.request",
+            "kind": 2,
+            "startTimeUnixNano": unix_nano(0.0),
+            "endTimeUnixNano": unix_nano(max(offsets.values(), default=0.0)),
+            "attributes": attributes,
+            "events": [{"name": name, "timeUnixNano": unix_nano(offset)} for name, offset in offsets.items()],
+        }]
+        for name, start, end in _SPANS:
+            if name != "total" and start in offsets and end in offsets:
+                spans.append({
+                    "traceId": trace_id,
+                    "spanId": span_id(name),
+                    "parentSpanId": root_id,
+                    "name": f"chat.{name}",
+                    "kind": 1,
+                    "startTimeUnixNano": unix_nano(offsets[start]),
+                    "endTimeUnixNano": unix_nano(offsets[end]),
+                })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "chatbot-api"}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+
+
+class Tracer:
+    """
+    Creates request traces and keeps the last `buffer_size` finished ones in memory.
+    With `export_path` set, finished traces are also appended to that file as OTLP
+    JSON lines, written on a background thread.
+
+    When disabled, `start` returns None and callers skip every `mark`, so tracing
+    costs nothing.
+    """
+
+    def __init__(self, enabled: bool, buffer_size: int, export_path: Optional[str] = None) -> None:
+        self.enabled = enabled
+        self.export_path = export_path
+        self._traces: Deque[Trace] = deque(maxlen=buffer_size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if enabled and export_path:
+            os.makedirs(os.path.dirname(os.path.abspath(export_path)), exist_ok=True)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+    def start(self, request_id: str) -> Optional[Trace]:
+        if not self.enabled:
+            return None
+        trace = Trace(request_id)
+        trace.mark("received")
+        return trace
+
+    def finish(self, trace: Trace) -> None:
+        self._traces.append(trace)
+        if self._executor is not None:
+            self._executor.submit(self._export, trace)
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        return next((trace for trace in reversed(self._traces) if trace.request_id == request_id), None)
+
+    def recent(self, limit: int) -> List[Trace]:
+        """
+        The most recently finished traces, newest first.
+        """
+        return list(reversed(self._traces))[:limit]
+
+    def _export(self, trace: Trace) -> None:
+        try:
+            with open(self.export_path, "a", encoding="utf-8") as f:  # type: ignore[arg-type]
+                f.write(json.dumps(trace.to_otlp()) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to export trace {trace.request_id}: {e}")
+
+
+tracer = Tracer(
+    enabled=settings.TRACE_ENABLED,
+    buffer_size=settings.TRACE_BUFFER_SIZE,
+    export_path=settings.TRACE_EXPORT_PATH or None,
+)
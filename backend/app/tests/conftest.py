@@ -1,13 +1,18 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 
 # Import patch_modules first to set up mocking before app imports
 from app.tests import patch_modules
 from app.main import app
+from app.services.llm_service import llm_service
 
 # Apply service-specific patches after imports
 patch_modules.apply_service_patches()
 
+# The test client doesn't run the app's lifespan, so load the mocked model here
+asyncio.run(llm_service.start(warmup=False))
+
 @pytest.fixture
 def client() -> TestClient:
     return TestClient(app)
@@ -78,6 +78,12 @@ class MockLlamaClass:
                     yield chunk
 
         return Streamer()
+    
+    def create_chat_completion(self, messages: List[Dict[str, Any]], **kwargs: Any) -> Any:
+        return iter(self.create_chat_completion_stream(messages, **kwargs))
+    
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        return [1] + list(range(2, 2 + len(text.split())))
 
 _add_patch('llama_cpp.Llama', new=MockLlamaClass)
 
@@ -0,0 +1,36 @@
+"""Thread and batch size auto-tuning tests."""
+from pathlib import Path
+from unittest.mock import patch
+from app.services.autotune import AutoTuner, TuningProfile, thread_candidates
+
+def test_thread_candidates_include_physical_cores() -> None:
+    assert thread_candidates(16, 8) == [1, 2, 4, 8, 16]
+    assert thread_candidates(12, 6) == [1, 2, 4, 6, 8, 12]
+    assert thread_candidates(1, 0) == [1]
+
+def test_profiles_are_saved_per_model_and_reused(tmp_path: Path) -> None:
+    model_a = tmp_path / "a.gguf"
+    model_b = tmp_path / "b.gguf"
+    model_a.write_bytes(b"model a")
+    model_b.write_bytes(b"model b")
+    profile = TuningProfile(
+        n_threads=4,
+        n_threads_batch=8,
+        n_batch=256,
+        measurements={"prompt_threads": {"8": 900.0}, "batch_size": {"256": 1000.0}, "decode_threads": {"4": 20.0}},
+        calibration_seconds=1.0,
+    )
+    
+    with patch.object(AutoTuner, "calibrate", return_value=profile) as calibrate:
+        tuner = AutoTuner(str(tmp_path / "profiles.json"), prompt_tokens=128, decode_tokens=8)
+        assert not tuner.get_profile(str(model_a), max_threads=8, n_gpu_layers=0).reused
+        # A fresh tuner, as after a restart, finds the saved profile
+        reloaded = AutoTuner(str(tmp_path / "profiles.json"), prompt_tokens=128, decode_tokens=8)
+        reused = reloaded.get_profile(str(model_a), max_threads=8, n_gpu_layers=0)
+        assert calibrate.call_count == 1
+        reloaded.get_profile(str(model_b), max_threads=8, n_gpu_layers=0)
+        assert calibrate.call_count == 2
+    
+    assert reused.reused
+    assert reused.get_stats()["decode_tokens_per_second"] == 20.0
+    assert (reused.n_threads, reused.n_threads_batch, reused.n_batch) == (4, 8, 256)
@@ -0,0 +1,132 @@
+"""Batch job API and runner tests."""
+import asyncio
+import json
+import tempfile
+from typing import Any, AsyncIterator, List
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.services.batch_jobs import BatchJobStore, batch_jobs, prefix_order
+from app.services.model_registry import model_registry
+from app.services.scheduler import RequestScheduler
+
+async def echo(conversation: list, **kwargs: Any) -> AsyncIterator[str]:
+    yield f"Re: {conversation[-1]['content']}"
+
+def conversation(system: str, user: str) -> List[dict]:
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+def test_batch_job_api(client: TestClient) -> None:
+    lines = [
+        json.dumps({"id": "a", "messages": [{"role": "user", "content": "One"}]}),
+        "",
+        json.dumps({"messages": [{"role": "user", "content": "Two"}]}),
+    ]
+    response = client.post("/batches/?temperature=0", content="\n".join(lines))
+    assert response.status_code == 201
+    job_id = response.json()["data"]["job_id"]
+    assert client.get(f"/batches/{job_id}").json()["data"]["status"] == "queued"
+    assert client.get(f"/batches/{job_id}/results").status_code == 409
+    
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=echo):
+        asyncio.run(batch_jobs.process_pending())
+    
+    data = client.get(f"/batches/{job_id}").json()["data"]
+    assert (data["status"], data["completed"], data["failed"]) == ("completed", 2, 0)
+    response = client.get(f"/batches/{job_id}/results")
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+    assert [(r["id"], r["reply"]) for r in results] == [("a", "Re: One"), (None, "Re: Two")]
+    
+    assert client.delete(f"/batches/{job_id}").status_code == 200
+    assert client.get(f"/batches/{job_id}").status_code == 404
+    
+    assert client.post("/batches/", content='{"messages": [{"role": "robot", "content": "Hi"}]}').status_code == 422
+
+def test_batch_job_resumes_after_restart() -> None:
+    directory = tempfile.mkdtemp()
+    store = BatchJobStore(directory, concurrency=2, scheduler=RequestScheduler(2, 4), registry=model_registry)
+    items = [{"id": str(i), "messages": conversation("Be brief", f"Question {i}")} for i in range(4)]
+    job = store.create(items)
+    
+    # A crash after one conversation finished, part way through writing another
+    job.status = "running"
+    job.save()
+    with open(job.results_path, "w") as f:
+        f.write(json.dumps({"index": 2, "id": "2", "reply": "Earlier", "error": None}) + "\n")
+        f.write('{"index": 0, "id"')
+    
+    replied: List[str] = []
+    
+    async def record(conversation: list, **kwargs: Any) -> AsyncIterator[str]:
+        replied.append(conversation[-1]["content"])
+        yield "Later"
+    
+    restarted = BatchJobStore(directory, concurrency=1, scheduler=RequestScheduler(2, 4), registry=model_registry)
+    assert restarted.get(job.id).status == "queued"
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=record):
+        asyncio.run(restarted.process_pending())
+    
+    assert replied == ["Question 0", "Question 1", "Question 3"]
+    assert restarted.get(job.id).to_dict()["completed"] == 4
+    # New results start on a line of their own after the partial one is dropped
+    with open(job.results_path) as f:
+        assert sorted(json.loads(line)["index"] for line in f) == [0, 1, 2, 3]
+
+def test_deleting_a_job_cancels_its_running_conversations() -> None:
+    async def run() -> None:
+        scheduler = RequestScheduler(max_concurrency=1, max_queue_depth=4)
+        store = BatchJobStore(tempfile.mkdtemp(), concurrency=2, scheduler=scheduler, registry=model_registry)
+        job = store.create([{"id": None, "messages": conversation("Be brief", f"Question {i}")} for i in range(3)])
+        started = asyncio.Event()
+        
+        async def endless(conversation: list, **kwargs: Any) -> AsyncIterator[str]:
+            started.set()
+            await asyncio.sleep(10)
+            yield "Never"
+        
+        with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=endless):
+            runner = asyncio.create_task(store.process_pending())
+            await started.wait()
+            store.delete(job.id)
+            await asyncio.wait_for(runner, timeout=1)
+        
+        assert (scheduler.active, scheduler.queue_depth) == (0, 0)
+        assert all(m["active_requests"] == 0 for m in model_registry.list_models())
+    
+    asyncio.run(run())
+
+def test_preempted_conversations_are_retried() -> None:
+    async def run() -> None:
+        scheduler = RequestScheduler(max_concurrency=1, max_queue_depth=4)
+        store = BatchJobStore(tempfile.mkdtemp(), concurrency=1, scheduler=scheduler, registry=model_registry)
+        job = store.create([{"id": None, "messages": conversation("Be brief", "Hello")}])
+        started = asyncio.Event()
+        attempts = 0
+        
+        async def slow(conversation: list, **kwargs: Any) -> AsyncIterator[str]:
+            nonlocal attempts
+            attempts += 1
+            started.set()
+            if attempts == 1:
+                await asyncio.sleep(10)
+            yield "Done"
+        
+        with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=slow):
+            runner = asyncio.create_task(store.process_pending())
+            await started.wait()
+            interactive = scheduler.submit("user")
+            await asyncio.wait_for(scheduler.acquire(interactive), timeout=1)
+            scheduler.release(interactive)
+            await asyncio.wait_for(runner, timeout=1)
+        
+        assert (attempts, job.preemptions, job.status) == (2, 1, "completed")
+    
+    asyncio.run(run())
+
+def test_prefix_order_groups_shared_prompts() -> None:
+    items = [
+        {"messages": conversation("B", "1")},
+        {"messages": conversation("A", "2")},
+        {"messages": conversation("B", "3")},
+        {"messages": conversation("A", "4")},
+    ]
+    assert prefix_order(items) == [1, 3, 0, 2]
@@ -1,7 +1,13 @@
 """Chat endpoint tests."""
-from unittest.mock import patch
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
 from fastapi.testclient import TestClient
 from typing import Dict, Any
+from app.routers.chat import create_conversation_message, start_chat_reply
+from app.services.model_registry import model_registry
+from app.services.rate_limiter import RateLimiter
+from app.services.scheduler import scheduler
 from app.tests.utils.mock_llm import MockLLM
 
 def test_chat_model_info_endpoint(client: TestClient) -> None:
@@ -49,3 +55,22 @@ def test_chat_endpoint_with_valid_message(client: TestClient) -> None:
         
         assert "text/event-stream" in response.headers["content-type"]
         assert mock_stream.called
+
+def test_reply_cancelled_before_it_starts_releases_everything() -> None:
+    limiter = RateLimiter(tokens_per_minute=1, burst_tokens=100, daily_tokens=1000)
+    client = SimpleNamespace(client=SimpleNamespace(host="1.2.3.4"), headers={})
+    
+    async def run() -> None:
+        task = await start_chat_reply([create_conversation_message("user", "Hello")], client, AsyncMock())  # type: ignore[arg-type]
+        assert scheduler.active == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    
+    with patch('app.routers.chat.rate_limiter', limiter):
+        asyncio.run(run())
+    
+    assert scheduler.active == 0
+    assert all(m["active_requests"] == 0 for m in model_registry.list_models())
+    headers = limiter.headers("ip:1.2.3.4")
+    assert headers["X-RateLimit-Remaining-Tokens"] == "100"
+    assert headers["X-RateLimit-Remaining-Daily-Tokens"] == "1000"
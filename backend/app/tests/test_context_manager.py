@@ -0,0 +1,90 @@
+"""Context window management tests."""
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+from unittest.mock import patch
+import pytest
+from app.services.context_manager import ContextManager
+from app.services.llm_service import llm_service
+from app.services.model_registry import model_registry
+from app.services.scheduler import scheduler
+
+def words(text: str) -> List[int]:
+    return list(range(len(text.split())))
+
+def make_conversation(turns: int) -> list:
+    conversation = [{"role": "system", "content": "be nice"}]
+    for i in range(turns):
+        conversation.append({"role": "user", "content": f"question {i} " + "word " * 8})
+        conversation.append({"role": "assistant", "content": f"answer {i} " + "word " * 8})
+    conversation.append({"role": "user", "content": "last question"})
+    return conversation
+
+def test_short_conversation_is_untouched() -> None:
+    manager = ContextManager(context_tokens=100, reserve_tokens=20, max_tokens=50, tokenize=words, message_overhead=2)
+    conversation = make_conversation(1)
+    window = manager.fit(conversation)
+    
+    assert window.messages == conversation
+    assert window.prompt_tokens == 2 + 10 + 10 + 2 + 4 * 2
+    assert window.max_tokens == 50
+    assert not window.trimmed
+
+def test_oldest_turns_dropped_and_system_pinned() -> None:
+    manager = ContextManager(context_tokens=60, reserve_tokens=20, max_tokens=50, tokenize=words, message_overhead=2)
+    window = manager.fit(make_conversation(3))
+    
+    assert [m["content"].split()[0] for m in window.messages] == ["be", "question", "answer", "last"]
+    assert window.messages[1]["content"].startswith("question 2")
+    assert window.dropped_messages == 4
+    assert window.prompt_tokens <= 40
+    assert window.max_tokens == 60 - window.prompt_tokens
+    
+    with pytest.raises(ValueError):
+        manager.fit([{"role": "user", "content": "word " * 50}])
+
+def test_summary_replaces_dropped_turns_once_ready() -> None:
+    summarized: List[int] = []
+    
+    async def summarize(previous: Optional[str], messages: list) -> str:
+        summarized.append(len(messages))
+        return "they talked"
+    
+    manager = ContextManager(
+        context_tokens=60, reserve_tokens=20, max_tokens=50, tokenize=words, message_overhead=2,
+        policy="summary", summarize=summarize,
+    )
+    
+    async def run() -> None:
+        first = manager.fit(make_conversation(3))
+        assert not first.summarized
+        await asyncio.sleep(0)
+        
+        second = manager.fit(make_conversation(3))
+        assert second.summarized
+        assert second.messages[1] == {"role": "system", "content": "Summary of the earlier conversation: they talked"}
+        assert second.prompt_tokens <= 40
+    
+    asyncio.run(run())
+    assert summarized == [4]
+
+def test_summaries_wait_for_a_scheduler_slot_and_hold_the_model() -> None:
+    generated: List[str] = []
+    
+    async def reply(messages: list, **kwargs: Any) -> AsyncIterator[str]:
+        generated.append(messages[-1]["content"])
+        yield "They said hi."
+    
+    async def run() -> None:
+        replying = scheduler.submit("user")
+        summary = asyncio.create_task(llm_service._summarize_history(None, [{"role": "user", "content": "Hi"}]))
+        await asyncio.sleep(0.01)
+        # The reply using the only slot finishes first
+        assert generated == [] and {m["name"]: m["active_requests"] for m in model_registry.list_models()}[llm_service.model_name] == 1
+        scheduler.release(replying)
+        assert await asyncio.wait_for(summary, timeout=1) == "They said hi."
+    
+    with patch.object(llm_service, "get_llm_response_stream", side_effect=reply):
+        asyncio.run(run())
+    assert generated == ["user: Hi"]
+    assert scheduler.active == 0
+    assert all(m["active_requests"] == 0 for m in model_registry.list_models())
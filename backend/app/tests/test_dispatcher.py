@@ -0,0 +1,51 @@
+"""Multi-worker dispatcher tests."""
+import json
+from starlette.requests import Request
+from app.dispatcher import Dispatcher, affinity_key, forwarded_headers
+
+def chat_body(*contents: str) -> bytes:
+    roles = ["system", "user", "assistant", "user"]
+    return json.dumps({"messages": [{"role": r, "content": c} for r, c in zip(roles, contents)]}).encode()
+
+def test_affinity_key_identifies_conversations() -> None:
+    first_turn = affinity_key("/chat/", chat_body("Be brief.", "Hi"))
+    later_turn = affinity_key("/chat/", chat_body("Be brief.", "Hi", "Hello!", "How are you?"))
+    assert first_turn is not None and first_turn == later_turn
+    assert affinity_key("/chat/", chat_body("Be brief.", "Something else")) != first_turn
+    
+    assert affinity_key("/sessions/abc/reply", b"{}") == "session:abc"
+    assert affinity_key("/sessions/", b"{}") is None
+    assert affinity_key("/batches/abc/results", b"") == "batch:abc"
+    assert affinity_key("/chat/streams/abc", b"") == "stream:abc"
+    assert affinity_key("/health/", b"") is None
+    assert affinity_key("/chat/", b"not json") is None
+
+def test_pick_sticks_to_ready_workers_and_rebalances() -> None:
+    dispatcher = Dispatcher(n_workers=3, base_port=9000, max_imbalance=2)
+    for worker in dispatcher.workers:
+        worker.status = "ready"
+    
+    first = dispatcher.pick("chat:a")
+    first.in_flight += 1
+    # New conversations spread out; existing ones come back to their worker
+    assert dispatcher.pick("chat:b") is not first
+    assert dispatcher.pick("chat:a") is first
+    
+    # A conversation moves if its worker is far busier than the others...
+    first.in_flight += 3
+    moved = dispatcher.pick("chat:a")
+    assert moved is not first
+    assert dispatcher.pick("chat:a") is moved
+    
+    # ...or stops being ready
+    moved.status = "loading"
+    assert dispatcher.pick("chat:a") is not moved
+    assert dispatcher.get_stats()["rebalanced"] == 2
+
+def test_workers_get_the_client_ip_from_the_dispatcher_only() -> None:
+    request = Request({
+        "type": "http",
+        "headers": [(b"host", b"example.com"), (b"x-forwarded-for", b"6.6.6.6"), (b"x-real-ip", b"6.6.6.6"), (b"x-api-key", b"k")],
+        "client": ("1.2.3.4", 5000),
+    })
+    assert forwarded_headers(request) == [("x-api-key", "k"), ("x-forwarded-for", "1.2.3.4")]
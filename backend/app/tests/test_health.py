@@ -22,3 +22,43 @@ def test_health_endpoint(client: TestClient) -> None:
     model_info: Dict[str, Any] = data["model_info"]
     assert model_info["model_name"] == "test-model"
     assert model_info["n_params"] == 7000000000
+
+def test_liveness_and_readiness(client: TestClient) -> None:
+    from app.services.llm_service import llm_service
+    
+    assert client.get("/health/live").json() == {"status": "alive"}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    
+    llm_service.status = "warming"
+    try:
+        assert client.get("/health/live").status_code == 200
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "warming"
+        
+        response = client.post("/chat/", json={"messages": [{"role": "user", "content": "Hello"}]})
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+    finally:
+        llm_service.status = "ready"
+
+def test_health_serves_sampled_snapshot(client: TestClient) -> None:
+    import tempfile
+    from unittest.mock import patch
+    from app.services.system_sampler import page_cache_residency, system_sampler
+    
+    system_sampler.sample()
+    with patch("psutil.virtual_memory", side_effect=AssertionError("sampled on request")), \
+         patch("psutil.cpu_percent", side_effect=AssertionError("sampled on request")):
+        for _ in range(3):
+            system = client.get("/health/").json()["system_info"]["system"]
+            assert system["age_seconds"] >= 0
+            assert "process_rss" in system
+    
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(b"x" * 10000)
+        f.flush()
+        residency = page_cache_residency(f.name)
+        assert residency is None or 0.0 <= residency <= 1.0
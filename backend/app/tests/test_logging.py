@@ -0,0 +1,44 @@
+"""Structured logging tests."""
+import json
+import logging
+from fastapi.testclient import TestClient
+from app.utils.logging_utils import JsonFormatter, RequestContextFilter, SamplingFilter, request_id_var, truncate_text
+
+def make_record(message: str, level: int = logging.INFO, **extra: object) -> logging.LogRecord:
+    record = logging.LogRecord("app.test", level, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    RequestContextFilter().filter(record)
+    return record
+
+def test_json_records_are_truncated_and_tagged() -> None:
+    token = request_id_var.set("req-1")
+    try:
+        record = make_record("x" * 50, n_messages=3, prompt="y" * 50)
+    finally:
+        request_id_var.reset(token)
+    
+    entry = json.loads(JsonFormatter(max_chars=10).format(record))
+    assert entry["request_id"] == "req-1"
+    assert entry["level"] == "INFO" and entry["n_messages"] == 3
+    assert entry["message"].startswith("x" * 10 + "... [truncated, 50 chars, sha256 ")
+    assert entry["prompt"] == truncate_text("y" * 50, 10)
+    assert truncate_text("short", 10) == "short"
+
+def test_debug_records_are_sampled_per_request() -> None:
+    sampler = SamplingFilter(rate=0.5)
+    assert sampler.filter(make_record("kept", level=logging.WARNING))
+    
+    kept = set()
+    for i in range(200):
+        token = request_id_var.set(f"req-{i}")
+        try:
+            decisions = {sampler.filter(make_record("verbose", level=logging.DEBUG)) for _ in range(3)}
+        finally:
+            request_id_var.reset(token)
+        assert len(decisions) == 1
+        kept |= {i} if decisions == {True} else set()
+    assert 50 < len(kept) < 150
+
+def test_responses_carry_request_ids(client: TestClient) -> None:
+    assert client.get("/health/live", headers={"X-Request-ID": "abc"}).headers["X-Request-ID"] == "abc"
+    assert len(client.get("/health/live").headers["X-Request-ID"]) == 32
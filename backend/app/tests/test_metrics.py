@@ -0,0 +1,40 @@
+"""Prometheus metrics tests."""
+import asyncio
+from typing import List
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.services.llm_service import LLMService, llm_service
+
+def _sample(name: str, model: str) -> float:
+    return REGISTRY.get_sample_value(name, {"model": model}) or 0.0
+
+def test_metrics_endpoint_exposes_llm_series(client: TestClient) -> None:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    for name in ["llm_time_to_first_token_seconds", "llm_inter_token_latency_seconds", "llm_queue_depth", "llm_requests_total"]:
+        assert name in response.text
+
+def test_generation_records_latency_and_token_counts() -> None:
+    async def run() -> List[str]:
+        stream = LLMService.get_llm_response_stream(llm_service, [{"role": "user", "content": "Hello there"}])  # type: ignore[list-item]
+        return [chunk async for chunk in stream]
+    
+    model = llm_service.model_name
+    before_ttft = _sample("llm_time_to_first_token_seconds_count", model)
+    before_gaps = _sample("llm_inter_token_latency_seconds_count", model)
+    before_completion = _sample("llm_completion_tokens_sum", model)
+    before_prompt = _sample("llm_prompt_tokens_count", model)
+    
+    original_cache = llm_service.prefix_cache
+    llm_service.prefix_cache = None
+    try:
+        chunks = asyncio.run(run())
+    finally:
+        llm_service.prefix_cache = original_cache
+    
+    assert chunks == ["This is ", "a test ", "response"]
+    assert _sample("llm_time_to_first_token_seconds_count", model) == before_ttft + 1
+    assert _sample("llm_inter_token_latency_seconds_count", model) == before_gaps + 2
+    assert _sample("llm_completion_tokens_sum", model) == before_completion + 3
+    assert _sample("llm_prompt_tokens_count", model) == before_prompt + 1
+    assert _sample("llm_active_streams", model) == 0
@@ -0,0 +1,83 @@
+"""GGUF metadata reader and model catalog tests."""
+import struct
+import pytest
+from pathlib import Path
+from typing import Any, List, Tuple
+from unittest.mock import patch
+from app.config import settings
+from app.services.llm_service import LLMService
+from app.services.model_catalog import ModelCatalog
+from app.utils.gguf_utils import GGUFFormatError, read_gguf_metadata
+
+def gguf_string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+def write_gguf(path: Path, context_length: int, vocab: int) -> None:
+    metadata: List[Tuple[str, int, bytes]] = [
+        ("general.architecture", 8, gguf_string("llama")),
+        ("general.name", 8, gguf_string("test")),
+        ("general.file_type", 4, struct.pack("<I", 15)),
+        ("llama.context_length", 4, struct.pack("<I", context_length)),
+        ("llama.block_count", 4, struct.pack("<I", 2)),
+        ("tokenizer.ggml.tokens", 9, struct.pack("<IQ", 8, vocab) + b"".join(gguf_string(f"t{i}") for i in range(vocab))),
+        ("tokenizer.chat_template", 8, gguf_string("{{ messages }}")),
+    ]
+    tensors = [("token_embd.weight", [16, vocab], 12), ("output_norm.weight", [16], 0)]
+    data = b"GGUF" + struct.pack("<IQQ", 3, len(tensors), len(metadata))
+    for key, value_type, value in metadata:
+        data += gguf_string(key) + struct.pack("<I", value_type) + value
+    for name, dims, tensor_type in tensors:
+        data += gguf_string(name) + struct.pack("<I", len(dims)) + b"".join(struct.pack("<Q", d) for d in dims) + struct.pack("<IQ", tensor_type, 0)
+    path.write_bytes(data)
+
+def test_reads_metadata_from_the_header(tmp_path: Path) -> None:
+    write_gguf(tmp_path / "model.gguf", context_length=4096, vocab=100)
+    metadata = read_gguf_metadata(str(tmp_path / "model.gguf"))
+    
+    assert metadata["architecture"] == "llama"
+    assert metadata["quantization"] == "Q4_K_M"
+    assert metadata["context_length"] == 4096
+    assert metadata["block_count"] == 2
+    assert metadata["vocab_size"] == 100
+    assert metadata["parameter_count"] == 16 * 100 + 16
+    assert metadata["chat_template"] == "{{ messages }}"
+    
+    (tmp_path / "broken.gguf").write_bytes(b"GGUF" + struct.pack("<I", 3))
+    with pytest.raises(GGUFFormatError):
+        read_gguf_metadata(str(tmp_path / "broken.gguf"))
+    
+    # Cut off in the middle of a vocabulary too long to keep
+    data = (tmp_path / "model.gguf").read_bytes()
+    (tmp_path / "truncated.gguf").write_bytes(data[:data.index(b"t50")])
+    with pytest.raises(GGUFFormatError):
+        read_gguf_metadata(str(tmp_path / "truncated.gguf"))
+
+def test_catalog_rereads_only_changed_files(tmp_path: Path) -> None:
+    write_gguf(tmp_path / "a.gguf", context_length=2048, vocab=10)
+    write_gguf(tmp_path / "b.gguf", context_length=4096, vocab=10)
+    (tmp_path / "c.gguf").write_bytes(b"not a model")
+    catalog = ModelCatalog(str(tmp_path / "catalog.json"))
+    
+    models = catalog.scan(str(tmp_path))
+    assert models["a"]["context_length"] == 2048
+    assert models["c"] is None
+    assert catalog.get_stats()["headers_read"] == 3
+    
+    # Another process starts from the saved catalog
+    reloaded = ModelCatalog(str(tmp_path / "catalog.json"))
+    write_gguf(tmp_path / "b.gguf", context_length=8192, vocab=20)
+    models = reloaded.scan(str(tmp_path))
+    assert models["b"]["context_length"] == 8192
+    assert reloaded.get_stats()["headers_read"] == 1
+
+def test_context_longer_than_trained_is_rejected() -> None:
+    with patch.object(settings, "ENGINE_MODE", "single"):
+        too_long = LLMService("/app/models/test-model.gguf", n_ctx=4096)
+        too_long.metadata = {"context_length": 2048}
+        with pytest.raises(ValueError, match="N_CTX=4096"):
+            too_long._validate_metadata()
+        
+        fits = LLMService("/app/models/test-model.gguf", n_ctx=2048)
+        fits.metadata = {"context_length": 2048}
+        fits._validate_metadata()
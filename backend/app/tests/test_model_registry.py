@@ -0,0 +1,158 @@
+"""Model registry tests."""
+import asyncio
+import os
+import tempfile
+from typing import List, Optional
+from unittest.mock import patch
+import pytest
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.services.model_registry import ModelNotFoundError, ModelRegistry, SwapInProgressError
+
+class FakeService:
+    def __init__(self, path: str, n_ctx: Optional[int] = None, generation: int = 0) -> None:
+        self.model_path = path
+        self.model_name = os.path.splitext(os.path.basename(path))[0]
+        self.n_ctx = n_ctx or 2048
+        self.closed = False
+        self.status = "ready"
+    
+    async def start(self, warmup: bool = True) -> None:
+        pass
+    
+    def memory_bytes(self) -> int:
+        return 0 if self.closed else os.path.getsize(self.model_path)
+    
+    def close(self) -> None:
+        self.closed = True
+
+def test_lazy_loading_and_lru_eviction() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["default", "small", "large"]:
+            with open(os.path.join(tmp, f"{name}.gguf"), "wb") as f:
+                f.write(b"\0" * 100)
+        
+        loaded: List[FakeService] = []
+        
+        def loader(path: str) -> FakeService:
+            loaded.append(FakeService(path))
+            return loaded[-1]
+        
+        default = FakeService(os.path.join(tmp, "default.gguf"))
+        registry = ModelRegistry(model_dir=tmp, ram_budget_bytes=250, default=default, loader=loader)  # type: ignore[arg-type]
+        
+        async def run() -> None:
+            assert await registry.acquire() is default
+            small = await registry.acquire("small")
+            assert [s.model_name for s in loaded] == ["small"]
+            
+            # "small" is still in use, so loading "large" goes over budget instead of evicting it
+            large = await registry.acquire("large")
+            assert not small.closed
+            registry.release(small)
+            registry.release(large)
+            
+            assert await registry.acquire("small") is small
+            registry.release(small)
+            assert len(loaded) == 2
+            
+            with pytest.raises(ModelNotFoundError):
+                await registry.acquire("missing")
+        
+        asyncio.run(run())
+        
+        models = {m["name"]: m for m in registry.list_models()}
+        assert set(models) == {"default", "small", "large"}
+        assert models["default"]["default"] and models["default"]["loaded"]
+
+def test_budget_evicts_least_recently_used() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["default", "a", "b"]:
+            with open(os.path.join(tmp, f"{name}.gguf"), "wb") as f:
+                f.write(b"\0" * 100)
+        
+        default = FakeService(os.path.join(tmp, "default.gguf"))
+        registry = ModelRegistry(model_dir=tmp, ram_budget_bytes=250, default=default, loader=FakeService)  # type: ignore[arg-type]
+        
+        async def run() -> None:
+            a = await registry.acquire("a")
+            registry.release(a)
+            b = await registry.acquire("b")
+            registry.release(b)
+            assert a.closed and not b.closed and not default.closed
+        
+        asyncio.run(run())
+        assert registry.get_stats()["evictions"] == 1
+
+def test_unknown_model_is_404(client: TestClient) -> None:
+    response = client.post("/chat/", json={"messages": [{"role": "user", "content": "Hi"}], "model": "missing"})
+    assert response.status_code == 404
+
+def test_swap_drains_the_old_default() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["default", "next"]:
+            with open(os.path.join(tmp, f"{name}.gguf"), "wb") as f:
+                f.write(b"\0" * 100)
+        
+        default = FakeService(os.path.join(tmp, "default.gguf"))
+        registry = ModelRegistry(model_dir=tmp, ram_budget_bytes=0, default=default, loader=FakeService)  # type: ignore[arg-type]
+        
+        async def run() -> None:
+            streaming = await registry.acquire()
+            swap = await registry.swap_default("next", n_ctx=4096)
+            with pytest.raises(SwapInProgressError):
+                await registry.swap_default("next")
+            while swap.status == "loading":
+                await asyncio.sleep(0.001)
+            
+            # New requests go to the new model while the old one finishes its stream
+            assert swap.status == "draining"
+            new = await registry.acquire()
+            assert new.model_name == "next" and new.n_ctx == 4096
+            assert not default.closed
+            registry.release(new)
+            
+            registry.release(streaming)
+            while swap.status == "draining":
+                await asyncio.sleep(0.001)
+            await swap.task
+            assert swap.status == "done" and default.closed
+            assert "default" not in registry.get_stats()["loaded"]
+        
+        asyncio.run(run())
+
+def test_swap_to_a_loaded_model_replaces_it() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["default", "next"]:
+            with open(os.path.join(tmp, f"{name}.gguf"), "wb") as f:
+                f.write(b"\0" * 100)
+        
+        default = FakeService(os.path.join(tmp, "default.gguf"))
+        registry = ModelRegistry(model_dir=tmp, ram_budget_bytes=0, default=default, loader=FakeService)  # type: ignore[arg-type]
+        
+        async def run() -> None:
+            loaded = await registry.acquire("next")
+            swap = await registry.swap_default("next")
+            while swap.status == "loading":
+                await asyncio.sleep(0.001)
+            
+            # The instance loaded before the swap finishes its request, then is unloaded
+            assert registry.default is swap.new and registry.default is not loaded
+            assert not loaded.closed
+            registry.release(loaded)
+            await swap.task
+            assert swap.status == "done" and loaded.closed and default.closed
+            assert registry.get_stats()["loaded"] == ["next"]
+        
+        asyncio.run(run())
+
+def test_swap_is_refused_without_memory_for_both_models(client: TestClient) -> None:
+    # Without a configured key the admin endpoints don't exist
+    assert client.get("/admin/models/swap").status_code == 404
+    
+    admin = {"X-Admin-Key": "secret"}
+    with patch.object(settings, "ADMIN_API_KEY", "secret"):
+        assert client.get("/admin/models/swap", headers={"X-Admin-Key": "wrong"}).status_code == 401
+        with patch.object(settings, "SWAP_MEMORY_HEADROOM_MB", 1 << 40):
+            assert client.post("/admin/models/swap", json={}, headers=admin).status_code == 507
+        assert client.post("/admin/models/swap", json={"model": "missing"}, headers=admin).status_code == 404
@@ -0,0 +1,41 @@
+"""Prefix cache tests."""
+from pathlib import Path
+from app.services.prefix_cache import PrefixCache
+
+def test_lookup_returns_longest_shared_prefix() -> None:
+    cache = PrefixCache(ram_budget_bytes=1024, min_reuse_tokens=2)
+    cache.store([1, 2, 3, 4], b"a")
+    cache.store([1, 2, 9], b"b")
+    
+    found = cache.lookup([1, 2, 3, 4, 5, 6])
+    assert found is not None
+    assert found[0] == 4
+    assert found[1] == (1, 2, 3, 4)
+    assert found[2] == b"a"
+    
+    assert cache.lookup([7, 8, 9]) is None
+
+def test_longer_snapshot_replaces_its_prefixes() -> None:
+    cache = PrefixCache(ram_budget_bytes=1024, min_reuse_tokens=1)
+    cache.store([1, 2], b"short")
+    cache.store([1, 2, 3], b"long")
+    
+    assert cache.get_stats()["ram_entries"] == 1
+    assert cache.lookup([1, 2])[2] == b"long"  # type: ignore[index]
+
+def test_evicted_snapshots_spill_to_disk(tmp_path: Path) -> None:
+    cache = PrefixCache(ram_budget_bytes=10, disk_budget_bytes=100, disk_dir=str(tmp_path), min_reuse_tokens=1)
+    cache.store([1, 2, 3], b"x" * 8)
+    cache.store([4, 5, 6], b"y" * 8)
+    
+    stats = cache.get_stats()
+    assert stats["ram_entries"] == 1
+    assert stats["disk_entries"] == 1
+    
+    found = cache.lookup([1, 2, 3, 4])
+    assert found is not None and found[2] == b"x" * 8
+    
+    cache.record(found[0])
+    cache.record(0)
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["tokens_reused"]) == (1, 1, 3)
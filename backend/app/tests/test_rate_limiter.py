@@ -0,0 +1,65 @@
+"""Rate limiter tests."""
+import os
+import tempfile
+import pytest
+from typing import Any, AsyncIterator
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.services.rate_limiter import RateLimitExceededError, RateLimiter
+
+def test_buckets_refill_and_carry_debt() -> None:
+    now = 1_700_000_000.0
+    with patch('app.services.rate_limiter.time.time', side_effect=lambda: now):
+        limiter = RateLimiter(tokens_per_minute=60, burst_tokens=100)
+        limiter.acquire("a", 80)
+        # A long reply leaves the bucket in debt
+        limiter.charge("a", 50)
+        with pytest.raises(RateLimitExceededError) as exc_info:
+            limiter.acquire("a", 10)
+        assert exc_info.value.retry_after == 40
+        limiter.acquire("b", 10)
+        
+        now += 40
+        limiter.acquire("a", 10)
+        # Prompts larger than the burst only need a full bucket
+        now += 600
+        limiter.acquire("a", 500)
+        assert limiter.headers("a")["X-RateLimit-Remaining-Tokens"] == "0"
+
+def test_daily_quota_persists() -> None:
+    db_path = os.path.join(tempfile.mkdtemp(), "limits.db")
+    limiter = RateLimiter(tokens_per_minute=0, burst_tokens=0, daily_tokens=100, db_path=db_path)
+    limiter.acquire("a", 60)
+    limiter.charge("a", 30)
+    
+    restarted = RateLimiter(tokens_per_minute=0, burst_tokens=0, daily_tokens=100, db_path=db_path)
+    assert restarted.headers("a")["X-RateLimit-Remaining-Daily-Tokens"] == "10"
+    with pytest.raises(RateLimitExceededError):
+        restarted.acquire("a", 20)
+
+def test_chat_requests_are_charged_per_token(client: TestClient) -> None:
+    async def reply(conversation: list, usage: dict, **kwargs: Any) -> AsyncIterator[str]:
+        usage.update(prompt_tokens=10, completion_tokens=95)
+        yield "Hi!"
+    
+    limiter = RateLimiter(tokens_per_minute=1, burst_tokens=100)
+    body = {"messages": [{"role": "user", "content": "Hello"}], "temperature": 0.5}
+    with patch('app.routers.chat.rate_limiter', limiter), \
+         patch.object(settings, "RATE_LIMIT_API_KEYS", "secret,other"), \
+         patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=reply):
+        response = client.post("/chat/", json=body, headers={"X-API-Key": "secret"})
+        assert response.status_code == 200
+        assert int(response.headers["X-RateLimit-Remaining-Tokens"]) < 100
+        
+        response = client.post("/chat/", json=body, headers={"X-API-Key": "secret"})
+        assert response.status_code == 429
+        assert response.headers["X-RateLimit-Remaining-Tokens"] == "0"
+        assert int(response.headers["Retry-After"]) > 0
+        
+        # Other clients have their own budget
+        assert client.post("/chat/", json=body, headers={"X-API-Key": "other"}).status_code == 200
+        
+        # Made-up keys all share the budget of the client's IP
+        assert client.post("/chat/", json=body, headers={"X-API-Key": "made-up"}).status_code == 200
+        assert client.post("/chat/", json=body, headers={"X-API-Key": "made-up-too"}).status_code == 429
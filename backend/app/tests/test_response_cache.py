@@ -0,0 +1,61 @@
+"""Response cache tests."""
+import asyncio
+import os
+import tempfile
+from typing import List
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.services.llm_service import LLMService, llm_service
+from app.services.response_cache import ResponseCache, is_deterministic, response_cache_key
+
+def test_key_normalizes_prompts_and_ignores_seed_when_greedy() -> None:
+    base = response_cache_key("m", [{"role": "user", "content": "Hi\r\nthere"}], 0.0, None, 64)
+    assert response_cache_key("m", [{"role": "user", "content": "  Hi\nthere "}], 0.0, 7, 64) == base
+    assert response_cache_key("m", [{"role": "user", "content": "Hi\nthere"}], 0.5, 7, 64) != base
+    assert response_cache_key("other", [{"role": "user", "content": "Hi\nthere"}], 0.0, None, 64) != base
+    assert is_deterministic(0.0, None) and is_deterministic(0.7, 1) and not is_deterministic(0.7, None)
+
+def test_lru_ttl_and_persistence() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "responses.jsonl")
+        cache = ResponseCache(max_entries=2, ttl_seconds=60, path=path)
+        cache.put("a", ["1"])
+        cache.put("b", ["2"])
+        cache.get("a")
+        cache.put("c", ["3"])
+        assert cache.get("b") is None
+        
+        reloaded = ResponseCache(max_entries=2, ttl_seconds=60, path=path)
+        assert reloaded.get("c") == ["3"]
+        assert reloaded.get_stats()["entries"] == 2
+        assert reloaded.get_stats()["bytes_served"] == 1
+        
+        assert ResponseCache(max_entries=2, ttl_seconds=0, path=path).get("c") is None
+        
+        # Evicted and replaced entries don't pile up in the file
+        for i in range(50):
+            reloaded.put(f"key {i}", [str(i)])
+        with open(path) as f:
+            assert len(f.readlines()) <= 4
+        assert ResponseCache(max_entries=2, ttl_seconds=60, path=path).get("key 49") == ["49"]
+
+def test_deterministic_reply_is_replayed(client: TestClient) -> None:
+    async def generate() -> List[str]:
+        window = llm_service.fit_context(messages)
+        stream = LLMService.get_llm_response_stream(llm_service, window.messages, max_tokens=window.max_tokens, temperature=0.0)
+        return [chunk async for chunk in stream]
+    
+    messages: list = [{"role": "user", "content": "What are your opening hours?"}]
+    original_caches = llm_service.prefix_cache, llm_service.response_cache
+    llm_service.prefix_cache = None
+    llm_service.response_cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    try:
+        assert asyncio.run(generate()) == ["This is ", "a test ", "response"]
+        
+        with patch('app.services.llm_service.llm_service.get_llm_response_stream') as mock_stream:
+            response = client.post("/chat/", json={"messages": messages, "temperature": 0})
+        assert not mock_stream.called
+        assert "data: This is a test response" in response.text
+        assert llm_service.response_cache.get_stats()["hits"] == 1
+    finally:
+        llm_service.prefix_cache, llm_service.response_cache = original_caches
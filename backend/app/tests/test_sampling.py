@@ -0,0 +1,24 @@
+"""Sampling helper tests."""
+import numpy as np
+from app.services.sampling import Sampler, find_stop, partial_stop_length
+
+def test_sampler_is_reproducible_with_seed() -> None:
+    logits = np.random.default_rng(0).standard_normal(100).astype(np.float32)
+    
+    first = Sampler(temperature=0.8, seed=42)
+    second = Sampler(temperature=0.8, seed=42)
+    history = [1, 2, 3]
+    
+    assert [first.sample(logits, history) for _ in range(20)] == [second.sample(logits, history) for _ in range(20)]
+
+def test_greedy_sampler_picks_argmax() -> None:
+    logits = np.zeros(10, dtype=np.float32)
+    logits[7] = 5.0
+    assert Sampler(temperature=0, repeat_penalty=1.0).sample(logits, []) == 7
+
+def test_stop_sequence_detection() -> None:
+    stops = ["</s>", "[INST]"]
+    assert find_stop("Hello</s> there", stops) == 5
+    assert find_stop("Hello there", stops) == -1
+    assert partial_stop_length("Hello [IN", stops) == 3
+    assert partial_stop_length("Hello", stops) == 0
@@ -0,0 +1,75 @@
+"""Request scheduler tests."""
+import asyncio
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.services.scheduler import QueueFullError, RequestScheduler
+
+def test_scheduler_admits_in_fifo_order() -> None:
+    async def run() -> None:
+        scheduler = RequestScheduler(max_concurrency=1, max_queue_depth=2)
+        first = scheduler.submit("a")
+        second = scheduler.submit("b")
+        third = scheduler.submit("c")
+        
+        assert first.admitted
+        assert (second.position, third.position) == (1, 2)
+        
+        with pytest.raises(QueueFullError) as exc_info:
+            scheduler.submit("d")
+        assert exc_info.value.retry_after >= 1
+        
+        scheduler.release(first)
+        await asyncio.wait_for(scheduler.acquire(second), timeout=1)
+        assert scheduler.position(third) == 1
+        assert scheduler.get_stats()["rejected_total"] == 1
+    
+    asyncio.run(run())
+
+def test_scheduler_drops_cancelled_waiters() -> None:
+    async def run() -> None:
+        scheduler = RequestScheduler(max_concurrency=1, max_queue_depth=4)
+        holder = scheduler.submit()
+        waiter = scheduler.submit()
+        
+        task = asyncio.create_task(scheduler.acquire(waiter))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        
+        assert scheduler.queue_depth == 0
+        scheduler.release(holder)
+        assert scheduler.active == 0
+    
+    asyncio.run(run())
+
+def test_chat_endpoint_returns_429_when_queue_full(client: TestClient) -> None:
+    with patch('app.services.scheduler.scheduler.submit', side_effect=QueueFullError(7)):
+        response = client.post("/chat/", json={
+            "messages": [{"role": "user", "content": "Hello"}]
+        })
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+
+def test_interactive_requests_preempt_background_work() -> None:
+    async def run() -> None:
+        scheduler = RequestScheduler(max_concurrency=1, max_queue_depth=4)
+        background = scheduler.submit("batch", background=True)
+        queued_background = scheduler.submit("batch", background=True)
+        assert background.admitted and queued_background.position == 1
+        
+        interactive = scheduler.submit("user")
+        assert background.preempted.is_set()
+        
+        # The freed slot goes to the interactive request, not the waiting background one
+        scheduler.release(background)
+        await asyncio.wait_for(scheduler.acquire(interactive), timeout=1)
+        assert not queued_background.admitted
+        
+        scheduler.release(interactive)
+        await asyncio.wait_for(scheduler.acquire(queued_background), timeout=1)
+        stats = scheduler.get_stats()
+        assert (stats["background_active"], stats["background_preempted_total"], stats["admitted_total"]) == (1, 1, 1)
+    
+    asyncio.run(run())
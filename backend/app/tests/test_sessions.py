@@ -0,0 +1,51 @@
+"""Session API and store tests."""
+import os
+import tempfile
+import pytest
+from typing import Any, AsyncIterator
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.services.session_store import SessionNotFoundError, SessionStore
+
+def test_session_reply_is_stored(client: TestClient) -> None:
+    response = client.post("/sessions/", json={"messages": [{"role": "system", "content": "Be brief"}]})
+    assert response.status_code == 201
+    session_id = response.json()["data"]["session_id"]
+    
+    async def reply(conversation: list, **kwargs: Any) -> AsyncIterator[str]:
+        assert [m["content"] for m in conversation] == ["Be brief", "Hello there"]
+        yield "Hi!"
+    
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=reply):
+        response = client.post(f"/sessions/{session_id}/reply", json={"message": {"role": "user", "content": "Hello there"}})
+    assert "data: Hi!" in response.text
+    
+    data = client.get(f"/sessions/{session_id}").json()["data"]
+    assert [m["role"] for m in data["messages"]] == ["system", "user", "assistant"]
+    assert data["n_tokens"] > 0
+    
+    assert client.delete(f"/sessions/{session_id}").status_code == 200
+    assert client.get(f"/sessions/{session_id}").status_code == 404
+
+def test_expired_and_evicted_sessions() -> None:
+    store = SessionStore(ttl_seconds=60, max_sessions=1)
+    first = store.create()
+    second = store.create()
+    
+    with pytest.raises(SessionNotFoundError):
+        store.get(first.id)
+    
+    second.last_access -= 120
+    with pytest.raises(SessionNotFoundError):
+        store.get(second.id)
+
+def test_sqlite_backend_reloads_sessions() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        store = SessionStore(ttl_seconds=60, max_sessions=10, db_path=path)
+        session = store.create()
+        store.append(session, {"role": "user", "content": "Hello"}, [15043])
+        
+        reloaded = SessionStore(ttl_seconds=60, max_sessions=10, db_path=path).get(session.id)
+        assert reloaded.messages == [{"role": "user", "content": "Hello"}]
+        assert reloaded.message_tokens == [[15043]]
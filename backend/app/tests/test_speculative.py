@@ -0,0 +1,14 @@
+"""Speculative decoding drafter tests."""
+from app.services.speculative import PromptLookupDrafter
+
+def test_prompt_lookup_drafts_what_followed_the_latest_match() -> None:
+    drafter = PromptLookupDrafter(max_ngram=3, min_ngram=2)
+    
+    # "7 8" last occurred followed by 1 2 3
+    tokens = [7, 8, 9, 9, 7, 8, 1, 2, 3, 4, 5, 7, 8]
+    assert drafter.draft(0, tokens, 3) == [1, 2, 3]
+    # Longer n-grams win over more recent shorter ones
+    tokens = [1, 2, 3, 10, 11, 5, 2, 3, 20, 1, 2, 3]
+    assert drafter.draft(0, tokens, 2) == [10, 11]
+    # Nothing to propose without a repeated n-gram
+    assert drafter.draft(0, [1, 2, 3, 4], 4) == []
@@ -0,0 +1,108 @@
+"""Server-sent event framing, coalescing and resumption tests."""
+import asyncio
+import pytest
+from typing import AsyncIterator, List, Tuple
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.services.stream_registry import ReplayStream, StreamGapError
+from app.utils.sse_utils import coalesce_chunks, format_sse_event
+
+def test_multiline_payload_gets_one_data_field_per_line() -> None:
+    assert format_sse_event("a\nb\r\nc", event_id=3) == "id: 3\ndata: a\ndata: b\ndata: c\n\n"
+    assert format_sse_event("\n") == "data: \ndata: \n\n"
+
+def test_coalescing_flushes_on_size_and_on_stalls() -> None:
+    async def chunks() -> AsyncIterator[str]:
+        for text in ["ab", "cd", "ef", "gh"]:
+            yield text
+        await asyncio.sleep(0.2)
+        yield "late"
+    
+    async def run() -> List[Tuple[str, float]]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        return [(piece, loop.time() - start) async for piece in coalesce_chunks(chunks(), interval=0.05, max_bytes=6)]
+    
+    pieces = asyncio.run(run())
+    assert [piece for piece, _ in pieces] == ["abcdef", "gh", "late"]
+    # "gh" goes out when the window expires, not when "late" finally arrives
+    assert pieces[1][1] < 0.15
+
+def test_closing_coalescer_closes_source() -> None:
+    closed: List[bool] = []
+    
+    async def endless() -> AsyncIterator[str]:
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield "x"
+        finally:
+            closed.append(True)
+    
+    async def run() -> None:
+        frames = coalesce_chunks(endless(), interval=0.01, max_bytes=1024)
+        async for _ in frames:
+            break
+        await frames.aclose()
+    
+    asyncio.run(run())
+    assert closed == [True]
+
+def test_chat_stream_frames(client: TestClient) -> None:
+    async def reply() -> AsyncIterator[str]:
+        for text in ["Line one\n", "Line two"]:
+            yield text
+    
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', return_value=reply()):
+        response = client.post("/chat/", json={"messages": [{"role": "user", "content": "Hello"}]})
+    
+    assert response.headers["x-stream-encoding"] == "text"
+    assert response.text == "id: 1\ndata: Line one\ndata: Line two\n\nid: 2\ndata: [DONE]\n\n"
+
+def test_replay_stream_survives_reconnects() -> None:
+    async def run() -> None:
+        stream = ReplayStream("s", max_events=8, detach_grace_seconds=0.05)
+        resumed = asyncio.Event()
+        
+        async def produce() -> None:
+            for text in ["one", "two", "three"]:
+                stream.publish(text)
+                await resumed.wait()
+            stream.publish("[DONE]")
+            stream.close()
+        
+        stream.producer = asyncio.create_task(produce())
+        first = stream.read()
+        assert "data: one" in await first.__anext__()
+        await first.aclose()
+        
+        # Generation keeps going within the grace period, and a new reader picks up after event 1
+        await asyncio.sleep(0.01)
+        resumed.set()
+        frames = [frame async for frame in stream.read(1)]
+        assert frames[0] == "id: 2\ndata: two\n\n" and frames[-1] == "id: 4\ndata: [DONE]\n\n"
+        
+        abandoned = ReplayStream("t", max_events=2, detach_grace_seconds=0.01)
+        abandoned.producer = asyncio.create_task(asyncio.sleep(10))
+        for text in ["a", "b", "c"]:
+            abandoned.publish(text)
+        with pytest.raises(StreamGapError):
+            abandoned.check_resumable(0)
+        abandoned.detach()
+        await asyncio.sleep(0.05)
+        assert abandoned.producer.cancelled()
+    
+    asyncio.run(run())
+
+def test_chat_stream_can_be_resumed(client: TestClient) -> None:
+    async def reply() -> AsyncIterator[str]:
+        yield "Hello"
+    
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', return_value=reply()):
+        response = client.post("/chat/", json={"messages": [{"role": "user", "content": "Hello"}]})
+    stream_id = response.headers["x-stream-id"]
+    
+    response = client.get(f"/chat/streams/{stream_id}", headers={"Last-Event-ID": "1"})
+    assert response.text == "id: 2\ndata: [DONE]\n\n"
+    assert client.get("/chat/streams/unknown").status_code == 404
+    assert client.delete(f"/chat/streams/{stream_id}").status_code == 200
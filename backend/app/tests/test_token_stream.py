@@ -0,0 +1,89 @@
+"""Token stream handoff tests."""
+import asyncio
+import threading
+from typing import List
+from app.config import settings
+from app.services.token_stream import TokenStream
+
+def test_stream_delivers_items_from_thread_in_order() -> None:
+    async def run() -> List[str]:
+        stream = TokenStream(asyncio.get_running_loop(), maxsize=4)
+        
+        def produce() -> None:
+            for i in range(100):
+                stream.put(str(i))
+            stream.close()
+        
+        threading.Thread(target=produce).start()
+        return [item async for item in stream]
+
+    assert asyncio.run(run()) == [str(i) for i in range(100)]
+
+def test_stream_raises_producer_error() -> None:
+    async def run() -> None:
+        stream = TokenStream(asyncio.get_running_loop())
+        stream.put("partial")
+        stream.close(RuntimeError("decode failed"))
+        async for _ in stream:
+            pass
+
+    try:
+        asyncio.run(run())
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert str(e) == "decode failed"
+
+def test_cancelled_stream_unblocks_producer() -> None:
+    async def run() -> List[bool]:
+        stream = TokenStream(asyncio.get_running_loop(), maxsize=1)
+        results: List[bool] = []
+        
+        def produce() -> None:
+            results.append(stream.put("a"))
+            results.append(stream.put("b"))  # Blocks while "a" is unread
+        
+        producer = threading.Thread(target=produce)
+        producer.start()
+        await asyncio.sleep(0.05)
+        stream.cancel()
+        await asyncio.to_thread(producer.join, 2)
+        return results
+
+    assert asyncio.run(run()) == [True, False]
+
+def test_closing_single_stream_stops_generation() -> None:
+    from app.services.llm_service import LLMService, llm_service
+
+    produced: List[int] = []
+
+    class EndlessLlama:
+        def tokenize(self, text: bytes, special: bool = False) -> List[int]:
+            return [1, 2, 3]
+        
+        def create_chat_completion(self, **kwargs: object) -> object:
+            def chunks():  # type: ignore[no-untyped-def]
+                while True:
+                    produced.append(1)
+                    yield {"choices": [{"delta": {"content": "x"}}]}
+            return chunks()
+
+    async def run() -> None:
+        stream = LLMService.get_llm_response_stream(llm_service, [{"role": "user", "content": "Hi"}])  # type: ignore[list-item]
+        received = 0
+        async for _ in stream:
+            received += 1
+            if received == 3:
+                break
+        await stream.aclose()
+        await asyncio.sleep(0.2)
+
+    original_llm, original_cache = llm_service.llm, llm_service.prefix_cache
+    llm_service.llm, llm_service.prefix_cache = EndlessLlama(), None  # type: ignore[assignment]
+    try:
+        before = llm_service._requests_cancelled
+        asyncio.run(run())
+        assert llm_service._requests_cancelled == before + 1
+        # Only the bounded stream buffer (plus the chunk in flight) was generated ahead
+        assert len(produced) <= 3 + settings.STREAM_BUFFER_SIZE + 1
+    finally:
+        llm_service.llm, llm_service.prefix_cache = original_llm, original_cache
@@ -0,0 +1,46 @@
+"""Request tracing tests."""
+import json
+import os
+import tempfile
+from typing import Any, AsyncIterator
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.services.tracing import Trace, Tracer
+
+def test_trace_spans_and_otlp_export() -> None:
+    trace = Trace("abc")
+    for name, offset in [("received", 0.0), ("queued", 0.001), ("admitted", 0.011), ("first_token", 0.1), ("first_token", 0.2), ("last_token", 0.3)]:
+        trace.events.append((name, trace.start + offset))
+    
+    data = trace.to_dict()
+    assert data["events_ms"]["first_token"] == 100.0
+    assert data["spans_ms"] == {"queue": 10.0, "time_to_first_token": 100.0, "decode": 200.0}
+    
+    spans = trace.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["chat.request", "chat.queue", "chat.time_to_first_token", "chat.decode"]
+    assert all(span["parentSpanId"] == spans[0]["spanId"] for span in spans[1:])
+    assert len(spans[0]["traceId"]) == 32 and len(spans[0]["events"]) == 5
+
+def test_chat_requests_are_traced(client: TestClient) -> None:
+    export_path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+    tracer = Tracer(enabled=True, buffer_size=10, export_path=export_path)
+    
+    async def reply(conversation: list, trace: Trace, **kwargs: Any) -> AsyncIterator[str]:
+        trace.mark("first_token")
+        yield "Hi!"
+        trace.mark("last_token")
+    
+    with patch('app.routers.chat.tracer', tracer), patch('app.routers.debug.tracer', tracer), \
+         patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=reply):
+        response = client.post("/chat/", json={"messages": [{"role": "user", "content": "Hello"}]}, headers={"X-Request-ID": "req-42"})
+        assert "event: trace" in response.text
+        
+        data = client.get("/debug/traces/req-42").json()["data"]
+        assert {"received", "validated", "queued", "admitted", "first_token", "last_token", "stream_closed"} <= set(data["events_ms"])
+        assert data["attributes"]["prompt_tokens"] > 0
+        assert client.get("/debug/traces").json()["data"][0]["request_id"] == "req-42"
+        assert client.get("/debug/traces/unknown").status_code == 404
+    
+    tracer._executor.shutdown(wait=True)  # type: ignore[union-attr]
+    with open(export_path) as f:
+        assert json.loads(f.readline())["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] == "chat.request"
@@ -0,0 +1,50 @@
+"""WebSocket chat transport tests."""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+def test_replies_are_multiplexed_over_one_connection(client: TestClient) -> None:
+    async def reply(messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        for word in messages[-1]["content"].split():
+            await asyncio.sleep(0.001)
+            yield f"{word} "
+    
+    texts: Dict[str, str] = {"a": "", "b": ""}
+    done = set()
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=reply):
+        with client.websocket_connect("/ws/chat") as ws:
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "messages": [{"role": "user", "content": "one two three"}]}))
+            ws.send_bytes(json.dumps({"type": "chat", "id": "b", "messages": [{"role": "user", "content": "four five"}]}).encode())
+            while len(done) < 2:
+                message = ws.receive()
+                frame = json.loads(message["text"] if message.get("text") is not None else message["bytes"])
+                # Replies come back in the kind of frame they were requested in
+                assert (message.get("bytes") is not None) == (frame["id"] == "b")
+                if frame["type"] == "text":
+                    texts[frame["id"]] += frame["data"]
+                elif frame["type"] == "done":
+                    done.add(frame["id"])
+    
+    assert texts == {"a": "one two three ", "b": "four five "}
+
+def test_replies_can_be_cancelled(client: TestClient) -> None:
+    async def endless(*args: Any, **kwargs: Any) -> AsyncIterator[str]:
+        while True:
+            await asyncio.sleep(0.001)
+            yield "x"
+    
+    with patch('app.services.llm_service.llm_service.get_llm_response_stream', side_effect=endless):
+        with client.websocket_connect("/ws/chat") as ws:
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "messages": [{"role": "user", "content": "Hi"}]}))
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "messages": [{"role": "user", "content": "Hi"}]}))
+            ws.send_text(json.dumps({"type": "chat", "id": "b", "messages": [{"role": "system", "content": "Hi"}, {"role": "robot", "content": "Hi"}]}))
+            ws.send_text(json.dumps({"type": "cancel", "id": "a"}))
+            frames = []
+            while not frames or frames[-1]["type"] != "cancelled":
+                frames.append(json.loads(ws.receive_text()))
+    
+    errors = {frame["id"]: frame["status"] for frame in frames if frame["type"] == "error"}
+    assert errors == {"a": 409, "b": 422}
+    assert frames[-1] == {"id": "a", "type": "cancelled"}
@@ -0,0 +1,185 @@
+import mmap
+import struct
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+
+_MAGIC = b"GGUF"
+
+# Metadata value types: struct format and size of the fixed-size ones
+_SCALARS = {
+    0: ("<B", 1),   # uint8
+    1: ("<b", 1),   # int8
+    2: ("<H", 2),   # uint16
+    3: ("<h", 2),   # int16
+    4: ("<I", 4),   # uint32
+    5: ("<i", 4),   # int32
+    6: ("<f", 4),   # float32
+    7: ("<?", 1),   # bool
+    10: ("<Q", 8),  # uint64
+    11: ("<q", 8),  # int64
+    12: ("<d", 8),  # float64
+}
+_STRING = 8
+_ARRAY = 9
+
+# Arrays longer than this (vocabularies, merges) are skipped, keeping only their length
+_MAX_ARRAY_ITEMS = 64
+
+# llama.cpp's `general.file_type` values
+_FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 4: "Q4_1_SOME_F16", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+}
+# ggml tensor types, for files that don't record a file type
+_TENSOR_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 6: "Q5_0", 7: "Q5_1", 8: "Q8_0", 9: "Q8_1",
+    10: "Q2_K", 11: "Q3_K", 12: "Q4_K", 13: "Q5_K", 14: "Q6_K", 15: "Q8_K",
+}
+
+
+class GGUFFormatError(ValueError):
+    """
+    Raised when a file isn't a GGUF model this reader understands.
+    """
+
+
+class _Reader:
+    def __init__(self, buffer: mmap.mmap) -> None:
+        self.buffer = buffer
+        self.pos = 0
+
+    def unpack(self, fmt: str, size: int) -> Any:
+        if self.pos + size > len(self.buffer):
+            raise GGUFFormatError("Unexpected end of file")
+        value = struct.unpack_from(fmt, self.buffer, self.pos)[0]
+        self.pos += size
+        return value
+
+    def skip(self, size: int) -> None:
+        if self.pos + size > len(self.buffer):
+            raise GGUFFormatError("Unexpected end of file")
+        self.pos += size
+
+    def string(self) -> str:
+        length = self.unpack("<Q", 8)
+        start = self.pos
+        self.skip(length)
+        return self.buffer[start:self.pos].decode("utf-8", errors="replace")
+
+    def value(self, value_type: int) -> Any:
+        if value_type in _SCALARS:
+            return self.unpack(*_SCALARS[value_type])
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            item_type = self.unpack("<I", 4)
+            count = self.unpack("<Q", 8)
+            if count <= _MAX_ARRAY_ITEMS:
+                return [self.value(item_type) for _ in range(count)]
+            if item_type in _SCALARS:
+                self.skip(count * _SCALARS[item_type][1])
+            elif item_type == _STRING:
+                for _ in range(count):
+                    self.skip(self.unpack("<Q", 8))
+            else:
+                for _ in range(count):
+                    self.value(item_type)
+            return _SkippedArray(count)
+        raise GGUFFormatError(f"Unknown metadata value type {value_type}")
+
+
+class _SkippedArray:
+    def __init__(self, count: int) -> None:
+        self.count = count
+
+
+def read_gguf_metadata(path: str) -> Dict[str, Any]:
+    """
+    Read what a GGUF model is from its header, without loading any weights: the file
+    is memory-mapped and only the header, metadata and tensor descriptions are touched.
+
+    Args:
+        path: The model file.
+
+    Returns:
+        The architecture, name, parameter count, quantization, trained context length,
+        layer and head counts, vocabulary size and chat template, with None for
+        anything the file doesn't record.
+
+    Raises:
+        OSError: If the file can't be read.
+        GGUFFormatError: If the file isn't a supported GGUF model.
+    """
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise GGUFFormatError("Empty file")
+    try:
+        metadata, tensor_types = _parse(_Reader(buffer))
+    finally:
+        buffer.close()
+
+    architecture = metadata.get("general.architecture")
+
+    def arch(key: str) -> Optional[Any]:
+        return metadata.get(f"{architecture}.{key}")
+
+    file_type = metadata.get("general.file_type")
+    if file_type is not None:
+        quantization: Optional[str] = _FILE_TYPES.get(file_type, f"type {file_type}")
+    elif tensor_types:
+        # Most of the weights are in the type the file was quantized to
+        dominant = tensor_types.most_common(1)[0][0]
+        quantization = _TENSOR_TYPES.get(dominant, f"type {dominant}")
+    else:
+        quantization = None
+    tokens = metadata.get("tokenizer.ggml.tokens")
+    chat_template = metadata.get("tokenizer.chat_template")
+
+    return {
+        "format_version": metadata["__version__"],
+        "architecture": architecture,
+        "name": metadata.get("general.name"),
+        "parameter_count": sum(tensor_types.values()),
+        "quantization": quantization,
+        "context_length": arch("context_length"),
+        "embedding_length": arch("embedding_length"),
+        "block_count": arch("block_count"),
+        "head_count": arch("attention.head_count"),
+        "head_count_kv": arch("attention.head_count_kv"),
+        "vocab_size": tokens.count if isinstance(tokens, _SkippedArray) else len(tokens) if tokens else None,
+        "chat_template": chat_template if isinstance(chat_template, str) else None,
+    }
+
+def _parse(reader: _Reader) -> Tuple[Dict[str, Any], "Counter[int]"]:
+    """
+    The metadata key/value pairs, and the number of parameters stored in each tensor type.
+    """
+    if reader.buffer[:4] != _MAGIC:
+        raise GGUFFormatError("Not a GGUF file")
+    reader.pos = 4
+    version = reader.unpack("<I", 4)
+    if version < 2:
+        raise GGUFFormatError(f"GGUF version {version} is not supported")
+    n_tensors = reader.unpack("<Q", 8)
+    n_metadata = reader.unpack("<Q", 8)
+
+    metadata: Dict[str, Any] = {"__version__": version}
+    for _ in range(n_metadata):
+        key = reader.string()
+        metadata[key] = reader.value(reader.unpack("<I", 4))
+
+    parameters: "Counter[int]" = Counter()
+    for _ in range(n_tensors):
+        reader.string()
+        n_dims = reader.unpack("<I", 4)
+        elements = 1
+        for _ in range(n_dims):
+            elements *= reader.unpack("<Q", 8)
+        tensor_type = reader.unpack("<I", 4)
+        reader.unpack("<Q", 8)  # Offset of the tensor's data
+        parameters[tensor_type] += elements
+    return metadata, parameters
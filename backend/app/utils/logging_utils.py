@@ -0,0 +1,190 @@
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Awaitable, Callable, Dict, MutableMapping, Optional
+
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    """
+    Shorten text longer than `max_chars`, keeping its start, its length and a hash
+    of the whole so identical payloads can still be matched up across records.
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    digest = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()[:12]
+    return f"{text[:max_chars]}... [truncated, {len(text)} chars, sha256 {digest}]"
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Tags records with the id of the request being handled where they were logged.
+    Must run in the logging thread, before records are queued.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a `rate` fraction of records below `level`. Sampling is per request,
+    so a sampled request keeps all its verbose records.
+    """
+
+    def __init__(self, rate: float, level: int = logging.INFO) -> None:
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.level or self.rate >= 1.0:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.random() < self.rate
+        return int(hashlib.sha256(request_id.encode("utf-8")).hexdigest()[:8], 16) < self.rate * 0x100000000
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON objects, with messages and `extra` values
+    longer than `max_chars` truncated.
+    """
+
+    def __init__(self, max_chars: int) -> None:
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate_text(record.getMessage(), self.max_chars),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value if isinstance(value, (int, float, bool, type(None))) else truncate_text(str(value), self.max_chars)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TruncatingFormatter(logging.Formatter):
+    """
+    The plain text format, with long messages truncated.
+    """
+
+    def __init__(self, max_chars: int) -> None:
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate_text(record.message, self.max_chars)
+        return super().formatMessage(record)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records as they are, leaving formatting to the listener thread. The
+    standard QueueHandler formats each record in the logging thread first.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments are resolved now, as they could change before the listener gets to them
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def configure_logging(level: str, log_format: str, max_chars: int, debug_sample_rate: float) -> None:
+    """
+    Route all logging through a queue to a listener thread that formats and writes
+    records to stderr, so logging calls on the event loop only enqueue.
+
+    Args:
+        level: Root log level name, e.g. "INFO".
+        log_format: "json" for one JSON object per line, or "text".
+        max_chars: Longest message (and `extra` value) written in full, 0 for no limit.
+        debug_sample_rate: Fraction of requests whose DEBUG records are kept.
+    """
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter(max_chars) if log_format == "json" else TruncatingFormatter(max_chars))
+
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(SamplingFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Write out queued records and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving each HTTP request an id, taken from its X-Request-ID header
+    if it has one, for log records to carry. The id is echoed in the response.
+    """
+
+    def __init__(self, app: Callable[..., Awaitable[None]]) -> None:
+        self.app = app
+
+    async def __call__(self, scope: MutableMapping[str, Any], receive: Callable[..., Awaitable[Any]], send: Callable[..., Awaitable[None]]) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"x-request-id"), None)
+        request_id = (request_id or uuid.uuid4().hex)[:64]
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message: MutableMapping[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
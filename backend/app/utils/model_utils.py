@@ -12,6 +12,32 @@ def get_model_path() -> str:
     logger.info(f"Using model path: {model_path}")
     return model_path
 
+def model_name_from_path(model_path: str) -> str:
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+def get_chat_format(model_name: str) -> str:
+    """
+    The chat format for a model: its entry in MODEL_CHAT_FORMATS ("name=format,...")
+    if it has one, otherwise CHAT_FORMAT.
+    """
+    for entry in settings.MODEL_CHAT_FORMATS.split(","):
+        name, _, chat_format = entry.partition("=")
+        if name.strip() == model_name and chat_format.strip():
+            return chat_format.strip()
+    return settings.CHAT_FORMAT
+
+def list_model_files(model_dir: str) -> Dict[str, str]:
+    """
+    Map the name of every GGUF file in `model_dir` to its path.
+    """
+    if not os.path.isdir(model_dir):
+        return {}
+    return {
+        model_name_from_path(filename): os.path.join(model_dir, filename)
+        for filename in sorted(os.listdir(model_dir))
+        if filename.endswith(".gguf")
+    }
+
 def verify_model_exists(model_path: str) -> None:
     exists = os.path.exists(model_path)
     if not exists:
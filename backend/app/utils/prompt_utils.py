@@ -0,0 +1,38 @@
+from typing import Dict, List, Tuple
+
+from llama_cpp import ChatCompletionRequestMessage, llama_chat_format
+
+
+# Prompt formatters for the chat formats we can render outside of Llama.create_chat_completion
+CHAT_FORMATTERS: Dict[str, llama_chat_format.ChatFormatter] = {
+    "llama-2": llama_chat_format.format_llama2,
+    "alpaca": llama_chat_format.format_alpaca,
+    "vicuna": llama_chat_format.format,
+    "chatml": llama_chat_format.format_chatml,
+    "mistrallite": llama_chat_format.format_mistrallite,
+    "zephyr": llama_chat_format.format_zephyr,
+    "openchat": llama_chat_format.format_openchat,
+}
+
+
+def verify_chat_format(chat_format: str) -> None:
+    if chat_format not in CHAT_FORMATTERS:
+        raise ValueError(f"Unsupported chat format {chat_format!r} (supported: {list(CHAT_FORMATTERS)})")
+
+def format_prompt(conversation: List[ChatCompletionRequestMessage], chat_format: str) -> Tuple[str, List[str]]:
+    """
+    Render a conversation into the prompt text and stop sequences for the given chat format,
+    exactly as Llama.create_chat_completion would.
+    """
+    verify_chat_format(chat_format)
+    formatted = CHAT_FORMATTERS[chat_format](messages=conversation)
+    stops = formatted.stop if isinstance(formatted.stop, list) else [formatted.stop] if formatted.stop else []
+    return formatted.prompt, stops
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
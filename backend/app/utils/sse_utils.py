@@ -0,0 +1,92 @@
+import asyncio
+import json
+import re
+from typing import AsyncIterator, List, Optional
+
+
+_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+def format_sse_event(data: str, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """
+    Frame a payload as a single server-sent event.
+
+    Each line of `data` gets its own `data:` field, which clients join back together
+    with newlines, so text containing line breaks survives the framing intact.
+    """
+    fields = []
+    if event:
+        fields.append(f"event: {event}\n")
+    if event_id is not None:
+        fields.append(f"id: {event_id}\n")
+    for line in _LINE_BREAK.split(data):
+        fields.append(f"data: {line}\n")
+    fields.append("\n")
+    return "".join(fields)
+
+def encode_payload(text: str, encoding: str) -> str:
+    """
+    Encode a piece of reply text for the wire: verbatim ("text") or as a JSON string ("json").
+    """
+    return json.dumps(text) if encoding == "json" else text
+
+async def coalesce_chunks(chunks: AsyncIterator[str], interval: float, max_bytes: int) -> AsyncIterator[str]:
+    """
+    Merge text chunks that arrive close together into larger pieces.
+
+    A piece is emitted once `interval` seconds have passed since its first chunk
+    arrived or once it holds at least `max_bytes` of UTF-8, whichever comes first.
+    The interval is enforced even when generation stalls, so no text waits longer
+    than that. An interval of 0 passes chunks through unchanged.
+
+    Closing this generator closes `chunks` as well.
+    """
+    iterator = chunks.__aiter__()
+    if interval <= 0:
+        try:
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            await iterator.aclose()  # type: ignore[attr-defined]
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    deadline = 0.0
+    pending: Optional["asyncio.Future[str]"] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                continue
+
+            finished, pending = pending, None
+            try:
+                chunk = finished.result()
+            except StopAsyncIteration:
+                break
+
+            if not buffer:
+                deadline = loop.time() + interval
+            buffer.append(chunk)
+            size += len(chunk.encode("utf-8"))
+            if size >= max_bytes or loop.time() >= deadline:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await iterator.aclose()  # type: ignore[attr-defined]
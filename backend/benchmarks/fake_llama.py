@@ -0,0 +1,104 @@
+"""
+A stand-in for `llama_cpp.Llama` with a simple timing model, so the server can be
+load tested without a model file or the cost of real inference.
+
+Prompt evaluation takes `prompt_ms_per_token` per prompt token before the first
+token appears, then every generated token takes `decode_ms_per_token`. Reply
+lengths are drawn uniformly from [min_tokens, max_tokens], seeded from the prompt
+so the same workload always produces the same replies.
+
+Configured through FAKE_LLAMA_* environment variables, which lets a server started
+in a separate process pick up the load generator's settings.
+"""
+import hashlib
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class FakeLlamaConfig:
+    def __init__(
+        self,
+        prompt_ms_per_token: float = 0.5,
+        decode_ms_per_token: float = 20.0,
+        min_tokens: int = 32,
+        max_tokens: int = 256,
+        seed: int = 0,
+    ) -> None:
+        self.prompt_ms_per_token = prompt_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "FakeLlamaConfig":
+        return cls(
+            prompt_ms_per_token=float(os.environ.get("FAKE_LLAMA_PROMPT_MS_PER_TOKEN", "0.5")),
+            decode_ms_per_token=float(os.environ.get("FAKE_LLAMA_DECODE_MS_PER_TOKEN", "20")),
+            min_tokens=int(os.environ.get("FAKE_LLAMA_MIN_TOKENS", "32")),
+            max_tokens=int(os.environ.get("FAKE_LLAMA_MAX_TOKENS", "256")),
+            seed=int(os.environ.get("FAKE_LLAMA_SEED", "0")),
+        )
+
+    def to_env(self) -> Dict[str, str]:
+        return {
+            "FAKE_LLAMA_PROMPT_MS_PER_TOKEN": str(self.prompt_ms_per_token),
+            "FAKE_LLAMA_DECODE_MS_PER_TOKEN": str(self.decode_ms_per_token),
+            "FAKE_LLAMA_MIN_TOKENS": str(self.min_tokens),
+            "FAKE_LLAMA_MAX_TOKENS": str(self.max_tokens),
+            "FAKE_LLAMA_SEED": str(self.seed),
+        }
+
+
+class FakeLlama:
+    """
+    Implements the parts of `llama_cpp.Llama` that the single-context mode of
+    LLMService uses. Tokens are whitespace-separated words.
+    """
+
+    def __init__(self, *args: Any, config: Optional[FakeLlamaConfig] = None, **kwargs: Any) -> None:
+        self.config = config or FakeLlamaConfig.from_env()
+        self.model_path: str = kwargs.get("model_path", "")
+        self.n_batch: int = kwargs.get("n_batch", 512)
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        return ([1] if add_bos else []) + [2] * len(text.split())
+
+    def reply_length(self, prompt: str, seed: Optional[int] = None) -> int:
+        digest = hashlib.sha256(f"{self.config.seed}:{seed}:{prompt}".encode("utf-8")).digest()
+        return random.Random(digest).randint(self.config.min_tokens, self.config.max_tokens)
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = False,
+        max_tokens: Optional[int] = None,
+        seed: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        n_tokens = self.reply_length(prompt, seed)
+        if max_tokens:
+            n_tokens = min(n_tokens, max_tokens)
+        return self._stream(len(prompt.split()), n_tokens)
+
+    def _stream(self, n_prompt: int, n_tokens: int) -> Iterator[Dict[str, Any]]:
+        # Sleep until each token is due rather than for a fixed time per token, so
+        # the server's own overhead doesn't accumulate into the modelled latency
+        due = time.perf_counter() + n_prompt * self.config.prompt_ms_per_token / 1000
+        for i in range(n_tokens):
+            due += self.config.decode_ms_per_token / 1000
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield {
+                "id": "fake-completion",
+                "object": "chat.completion.chunk",
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": f"t{i} "},
+                    "finish_reason": "length" if i == n_tokens - 1 else None,
+                }],
+            }
@@ -0,0 +1,262 @@
+"""
+Load test of the streaming chat endpoint against a FakeLlama backend.
+
+Starts the server (benchmarks.serve) in a subprocess, drives `/chat/` with
+concurrent SSE clients and reports time to first token, the gap between streamed
+chunks, throughput and the server's CPU use. Everything runs offline, and the
+fake model's latency is fixed, so differences between runs come from the web and
+streaming layers. Run from the backend directory:
+
+    python -m benchmarks.load_test --clients 8 --requests 64 --output results.json \\
+        --thresholds benchmarks/thresholds.json
+
+Exits with status 1 if any threshold is violated. Server settings can be passed
+with --server-env, e.g. --server-env SSE_FLUSH_INTERVAL_MS=0.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import psutil
+
+from benchmarks.fake_llama import FakeLlamaConfig
+
+
+class RequestResult:
+    def __init__(self) -> None:
+        self.status: Optional[int] = None
+        self.ttft: Optional[float] = None
+        self.gaps: List[float] = []
+        self.tokens = 0
+        self.duration = 0.0
+        self.error: Optional[str] = None
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """
+    Summary statistics of a list of durations in seconds, in milliseconds by default.
+    """
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "mean": None, "max": None}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 3)
+
+    return {
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "mean": round(statistics.fmean(ordered) * scale, 3),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+async def run_request(client: httpx.AsyncClient, url: str, prompt: str) -> RequestResult:
+    """
+    Send one chat request and time the streamed reply, frame by frame.
+    """
+    result = RequestResult()
+    start = time.perf_counter()
+    last: Optional[float] = None
+    try:
+        async with client.stream("POST", f"{url}/chat/", json={"messages": [{"role": "user", "content": prompt}]}) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                await response.aread()
+                result.error = response.text[:200]
+                return result
+
+            encoding = response.headers.get("X-Stream-Encoding", "text")
+            event: Optional[str] = None
+            data: List[str] = []
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[6:] if line.startswith("data: ") else line[5:])
+                elif not line and data:
+                    payload = "\n".join(data)
+                    is_message = event is None
+                    event, data = None, []
+                    if not is_message:
+                        continue
+                    if payload == "[DONE]":
+                        break
+                    if payload == "[ERROR]":
+                        result.error = "server reported an error"
+                        break
+
+                    now = time.perf_counter()
+                    if last is None:
+                        result.ttft = now - start
+                    else:
+                        result.gaps.append(now - last)
+                    last = now
+                    text = json.loads(payload) if encoding == "json" else payload
+                    result.tokens += len(text.split())
+    except httpx.HTTPError as e:
+        result.error = str(e)
+    finally:
+        result.duration = time.perf_counter() - start
+    return result
+
+
+async def run_load(url: str, clients: int, n_requests: int, prompt_words: int) -> List[RequestResult]:
+    """
+    Send `n_requests` requests from `clients` concurrent clients, each starting its
+    next request as soon as the previous one finishes.
+    """
+    counter = iter(range(n_requests))
+    results: List[RequestResult] = []
+    filler = " ".join(["lorem"] * max(0, prompt_words - 2))
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        for i in counter:
+            results.append(await run_request(client, url, f"Request {i} {filler}"))
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(300.0), limits=limits) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+    return results
+
+
+def summarize(results: List[RequestResult], wall: float, cpu_seconds: Optional[float]) -> Dict[str, Any]:
+    completed = [r for r in results if r.status == 200 and r.error is None]
+    tokens = sum(r.tokens for r in completed)
+    return {
+        "requests": len(results),
+        "completed": len(completed),
+        "rejected": sum(1 for r in results if r.status == 429),
+        "failed": sum(1 for r in results if r.error is not None and r.status != 429),
+        "wall_seconds": round(wall, 3),
+        "ttft_ms": percentiles([r.ttft for r in completed if r.ttft is not None]),
+        "inter_chunk_ms": percentiles([gap for r in completed for gap in r.gaps]),
+        "request_duration_ms": percentiles([r.duration for r in completed]),
+        "tokens": tokens,
+        "throughput_tokens_per_second": round(tokens / wall, 2) if wall else 0.0,
+        "requests_per_second": round(len(completed) / wall, 2) if wall else 0.0,
+        "server_cpu_seconds": round(cpu_seconds, 3) if cpu_seconds is not None else None,
+        "server_cpu_percent": round(100 * cpu_seconds / wall, 1) if cpu_seconds is not None and wall else None,
+        "server_cpu_ms_per_1k_tokens": round(1e6 * cpu_seconds / tokens, 2) if cpu_seconds is not None and tokens else None,
+    }
+
+
+def check_thresholds(summary: Dict[str, Any], thresholds: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    Compare a summary against {"dotted.key": {"max": x, "min": y}} limits and describe
+    every violation. Missing values count as violations.
+    """
+    violations = []
+    for key, limits in thresholds.items():
+        value: Any = summary
+        for part in key.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value is None:
+            violations.append(f"{key}: no value")
+            continue
+        if "max" in limits and value > limits["max"]:
+            violations.append(f"{key}: {value} > max {limits['max']}")
+        if "min" in limits and value < limits["min"]:
+            violations.append(f"{key}: {value} < min {limits['min']}")
+    return violations
+
+
+def start_server(port: int, config: FakeLlamaConfig, server_env: List[str]) -> subprocess.Popen:
+    env = {**os.environ, **config.to_env(), "WARMUP_PROMPT": ""}
+    for entry in server_env:
+        name, _, value = entry.partition("=")
+        env[name] = value
+    return subprocess.Popen([sys.executable, "-m", "benchmarks.serve", "--port", str(port)], env=env)
+
+
+def wait_until_ready(url: str, server: Optional[subprocess.Popen], timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} wasn't ready within {timeout:.0f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Test an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent SSE clients")
+    parser.add_argument("--requests", type=int, default=64, help="Total requests")
+    parser.add_argument("--prompt-words", type=int, default=64)
+    parser.add_argument("--prompt-ms-per-token", type=float, default=0.5)
+    parser.add_argument("--decode-ms-per-token", type=float, default=5.0)
+    parser.add_argument("--min-tokens", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-env", action="append", default=[], metavar="NAME=VALUE", help="Setting for the started server")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--thresholds", help="JSON file of limits to enforce")
+    args = parser.parse_args()
+
+    config = FakeLlamaConfig(
+        prompt_ms_per_token=args.prompt_ms_per_token,
+        decode_ms_per_token=args.decode_ms_per_token,
+        min_tokens=args.min_tokens,
+        max_tokens=args.max_tokens,
+        seed=args.seed,
+    )
+    server = None if args.url else start_server(args.port, config, args.server_env)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+
+    try:
+        wait_until_ready(url, server)
+        process = psutil.Process(server.pid) if server is not None else None
+        cpu_before = sum(process.cpu_times()[:2]) if process is not None else 0.0
+
+        start = time.perf_counter()
+        results = asyncio.run(run_load(url, args.clients, args.requests, args.prompt_words))
+        wall = time.perf_counter() - start
+
+        cpu_seconds = sum(process.cpu_times()[:2]) - cpu_before if process is not None else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    summary = summarize(results, wall, cpu_seconds)
+    report = {
+        "config": {
+            "clients": args.clients,
+            "requests": args.requests,
+            "prompt_words": args.prompt_words,
+            "fake_llama": vars(config),
+            "server_env": args.server_env,
+        },
+        "results": summary,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            violations = check_thresholds(summary, json.load(f))
+        for violation in violations:
+            print(f"THRESHOLD VIOLATED: {violation}", file=sys.stderr)
+        if violations:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
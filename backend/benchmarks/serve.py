@@ -0,0 +1,42 @@
+"""
+Run the API server with FakeLlama in place of llama.cpp (see benchmarks.fake_llama).
+Started by benchmarks.load_test, or by hand from the backend directory:
+
+    python -m benchmarks.serve --port 8765
+"""
+import argparse
+import os
+import tempfile
+
+import llama_cpp
+
+from benchmarks.fake_llama import FakeLlama
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    # The service only checks that the model file exists before handing it to Llama
+    model_dir = tempfile.mkdtemp(prefix="fake-llama-")
+    model_path = os.path.join(model_dir, "fake-model.gguf")
+    with open(model_path, "wb") as f:
+        f.write(b"GGUF")
+    os.environ["MODEL_PATH"] = model_path
+    os.environ["MODEL_DIR"] = model_dir
+    # FakeLlama only stands in for the high-level API used by the single-context mode
+    os.environ["ENGINE_MODE"] = "single"
+    os.environ["PREFIX_CACHE_RAM_MB"] = "0"
+
+    llama_cpp.Llama = FakeLlama  # type: ignore[misc,assignment]
+
+    import uvicorn
+    from app.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compare decoding speed with and without speculative decoding on a real model.
+
+Runs the same requests through a BatchEngine without a drafter and with one, checks
+that both produce identical text, and reports generated tokens per second and the
+draft acceptance rate. The default prompts ask the model to rework a passage, the
+kind of reply prompt-lookup drafting is good at. Run from the backend directory:
+
+    python -m benchmarks.speculative --model /app/models/llama-2-7b-chat.gguf --mode prompt_lookup
+    python -m benchmarks.speculative --model big.gguf --mode draft_model --draft-model small.gguf
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.batch_engine import BatchEngine
+from app.services.speculative import DraftModel, Drafter, PromptLookupDrafter
+
+PASSAGE = (
+    "The service streams replies from a local model. Each request is queued, admitted "
+    "when a slot is free, and decoded in a shared batch. Finished slots keep their cache "
+    "so the next turn of a conversation only evaluates the new messages."
+)
+PROMPTS = [
+    f"Repeat the following text exactly:\n\n{PASSAGE}",
+    f"Fix any typos in this text and return it in full:\n\n{PASSAGE}",
+    f"Rewrite this text as a bulleted list, keeping the wording:\n\n{PASSAGE}",
+]
+
+
+async def run(engine: BatchEngine, prompts: List[str], max_tokens: int, temperature: float, seed: int) -> Tuple[List[str], int, float]:
+    texts = []
+    tokens = 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        usage: Dict[str, int] = {}
+        parts = [part async for part in engine.generate(
+            [{"role": "user", "content": prompt}],  # type: ignore[list-item]
+            temperature=temperature, max_tokens=max_tokens, seed=seed, usage=usage,
+        )]
+        texts.append("".join(parts))
+        tokens += usage["completion_tokens"]
+    return texts, tokens, time.perf_counter() - start
+
+
+def benchmark(args: argparse.Namespace, drafter: Optional[Drafter]) -> Tuple[List[str], Dict[str, Any]]:
+    engine = BatchEngine(
+        model_path=args.model,
+        n_slots=1,
+        slot_ctx=args.ctx,
+        n_batch=args.batch,
+        n_threads=args.threads,
+        n_gpu_layers=0,
+        chat_format=args.chat_format,
+        drafter=drafter,
+        n_draft=args.n_draft,
+    )
+    try:
+        texts, tokens, elapsed = asyncio.run(run(engine, PROMPTS, args.max_tokens, args.temperature, args.seed))
+        return texts, {
+            "tokens": tokens,
+            "seconds": round(elapsed, 3),
+            "tokens_per_second": round(tokens / elapsed, 2),
+            **engine.get_speculative_stats(),
+        }
+    finally:
+        engine.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--mode", choices=["prompt_lookup", "draft_model"], default="prompt_lookup")
+    parser.add_argument("--draft-model")
+    parser.add_argument("--n-draft", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ctx", type=int, default=1024)
+    parser.add_argument("--batch", type=int, default=512)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--chat-format", default="llama-2")
+    args = parser.parse_args()
+
+    baseline_texts, baseline = benchmark(args, None)
+    if args.mode == "draft_model":
+        if not args.draft_model:
+            parser.error("--mode draft_model needs --draft-model")
+        drafter: Drafter = DraftModel(args.draft_model, n_seq=1, seq_ctx=args.ctx, n_batch=args.batch, n_threads=args.threads)
+    else:
+        drafter = PromptLookupDrafter()
+    texts, speculative = benchmark(args, drafter)
+
+    print(f"{'':>12} {'tokens':>8} {'seconds':>9} {'tokens/s':>9} {'accepted':>9}")
+    print(f"{'baseline':>12} {baseline['tokens']:>8} {baseline['seconds']:>9} {baseline['tokens_per_second']:>9} {'-':>9}")
+    print(
+        f"{args.mode:>12} {speculative['tokens']:>8} {speculative['seconds']:>9} {speculative['tokens_per_second']:>9} "
+        f"{speculative['acceptance_rate']:>9.1%}"
+    )
+    print(f"speedup: {speculative['tokens_per_second'] / baseline['tokens_per_second']:.2f}x")
+    print(f"identical output: {texts == baseline_texts}")
+    if texts != baseline_texts:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
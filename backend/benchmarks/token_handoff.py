@@ -0,0 +1,108 @@
+"""
+Microbenchmark of the per-token handoff between the decode thread and the event loop.
+
+Streams a long reply from the test suite's MockLlamaClass through the single-context
+path of LLMService and compares it with the previous approach of one
+`asyncio.to_thread` hop per chunk. Run from the backend directory:
+
+    python -m benchmarks.token_handoff --tokens 20000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+os.environ.setdefault("PREFIX_CACHE_RAM_MB", "0")
+
+# Patches llama_cpp.Llama and the model utilities before the service is imported
+from app.tests import patch_modules
+from app.services.llm_service import llm_service
+
+CONVERSATION = [{"role": "user", "content": "Hello"}]
+
+
+class LongMockLlama(patch_modules.MockLlamaClass):
+    """
+    The test mock, repeating its first content chunk to produce a reply of any length.
+    """
+
+    def __init__(self, n_chunks: int) -> None:
+        super().__init__()
+        self.n_chunks = n_chunks
+        self.chunk = next(chunk for chunk in self.create_chat_completion_stream([]) if chunk["choices"][0]["delta"])
+
+    def create_chat_completion(self, messages: List[Dict[str, Any]], **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        return (self.chunk for _ in range(self.n_chunks))
+
+
+async def to_thread_per_chunk(llm: LongMockLlama) -> int:
+    """
+    The previous implementation: one default-executor hop per generated chunk.
+    """
+    def next_or_none(it: Iterator[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        try:
+            return next(it)
+        except StopIteration:
+            return None
+
+    response_iter = llm.create_chat_completion(messages=CONVERSATION, stream=True)
+    count = 0
+    while True:
+        chunk = await asyncio.to_thread(next_or_none, response_iter)
+        if chunk is None:
+            break
+        if chunk["choices"][0]["delta"].get("content"):
+            count += 1
+    return count
+
+
+async def decode_thread(llm: LongMockLlama) -> int:
+    """
+    The current implementation: the whole generation runs on the decode thread.
+    """
+    llm_service.llm = llm  # type: ignore[assignment]
+    count = 0
+    async for _ in llm_service._stream_single(CONVERSATION, temperature=0.7, max_tokens=llm.n_chunks, seed=None, usage={}):  # type: ignore[arg-type]
+        count += 1
+    return count
+
+
+def measure(name: str, run: Callable[[LongMockLlama], Awaitable[int]], n_chunks: int, repeats: int) -> Dict[str, Any]:
+    timings = []
+    for _ in range(repeats):
+        llm = LongMockLlama(n_chunks)
+        start = time.perf_counter()
+        count = asyncio.run(run(llm))
+        timings.append(time.perf_counter() - start)
+        assert count == n_chunks, f"{name} streamed {count} of {n_chunks} chunks"
+
+    best = min(timings)
+    return {
+        "name": name,
+        "best_seconds": round(best, 4),
+        "median_seconds": round(statistics.median(timings), 4),
+        "us_per_token": round(best / n_chunks * 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=20000, help="Chunks per simulated reply")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per implementation")
+    args = parser.parse_args()
+
+    results = [
+        measure("to_thread_per_chunk", to_thread_per_chunk, args.tokens, args.repeats),
+        measure("decode_thread", decode_thread, args.tokens, args.repeats),
+    ]
+    for result in results:
+        print(f"{result['name']:>20}: {result['us_per_token']:8.2f} us/token (best {result['best_seconds']}s, median {result['median_seconds']}s)")
+    print(f"{'speedup':>20}: {results[0]['us_per_token'] / results[1]['us_per_token']:.1f}x")
+
+    patch_modules.stop_all_patches()
+
+
+if __name__ == "__main__":
+    main()
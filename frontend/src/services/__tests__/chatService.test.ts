@@ -1,6 +1,6 @@
 import { describe, it, expect, vi, beforeEach, afterEach, Mock } from 'vitest';
 import axios from 'axios';
-import { sendChatMessage, streamChatMessage } from '../chatService';
+import { createEventParser, sendChatMessage, streamChatMessage } from '../chatService';
 import { ChatMessage } from '../../types/ChatMessage';
 
 // Mock axios
@@ -122,10 +122,70 @@ describe('chatService', () => {
       await new Promise(resolve => setTimeout(resolve, 0));
 
       // Validate onChunk was called
-      expect(mockOnChunk).toHaveBeenCalledWith('{"test":"value');
+      expect(mockOnChunk).toHaveBeenCalledWith('{"test":"value"}');
       expect(mockOnDone).toHaveBeenCalled();
     });
 
+    it('reassembles events split across reads and multi-line payloads', async () => {
+      const encoder = new TextEncoder();
+      const mockReader = {
+        read: vi
+          .fn()
+          .mockResolvedValueOnce({
+            done: false,
+            value: encoder.encode('event: queue\ndata: {"position": 1}\n\nid: 1\ndata: Hello\ndata: wor'),
+          })
+          .mockResolvedValueOnce({
+            done: false,
+            value: encoder.encode('ld\n\nid: 2\ndata: [DONE]\n\n'),
+          }),
+      };
+
+      mockFetch.mockResolvedValue({
+        ok: true,
+        body: {
+          getReader: () => mockReader,
+        },
+      });
+
+      streamChatMessage(mockMessages, mockOnChunk, mockOnDone, mockOnError);
+
+      // Wait for promises to resolve
+      await new Promise(resolve => setTimeout(resolve, 0));
+
+      expect(mockOnChunk).toHaveBeenCalledTimes(1);
+      expect(mockOnChunk).toHaveBeenCalledWith('Hello\nworld');
+      expect(mockOnDone).toHaveBeenCalledTimes(1);
+    });
+
+    it('decodes JSON-encoded payloads', async () => {
+      const encoder = new TextEncoder();
+      const mockReader = {
+        read: vi
+          .fn()
+          .mockResolvedValueOnce({
+            done: false,
+            value: encoder.encode('id: 1\ndata: "a\\nb"\n\nid: 2\ndata: [DONE]\n\n'),
+          }),
+      };
+
+      mockFetch.mockResolvedValue({
+        ok: true,
+        headers: new Headers({ 'X-Stream-Encoding': 'json' }),
+        body: {
+          getReader: () => mockReader,
+        },
+      });
+
+      streamChatMessage(mockMessages, mockOnChunk, mockOnDone, mockOnError);
+
+      // Wait for promises to resolve
+      await new Promise(resolve => setTimeout(resolve, 0));
+
+      expect(mockOnChunk).toHaveBeenCalledWith('a\nb');
+      expect(mockOnDone).toHaveBeenCalledTimes(1);
+    });
+
     it('handles errors correctly', async () => {
       mockFetch.mockRejectedValue(new Error('Network Error'));
 
@@ -165,4 +225,15 @@ describe('chatService', () => {
       expect(mockOnError).not.toHaveBeenCalled();
     });
   });
+
+  describe('createEventParser', () => {
+    it('ignores comments and blocks without data', () => {
+      const parser = createEventParser();
+
+      expect(parser.push(': keep-alive\n\nevent: ping\n\ndata: x\r\n\r\n')).toEqual([
+        { event: 'message', data: 'x' },
+      ]);
+      expect(parser.flush()).toEqual([]);
+    });
+  });
 });
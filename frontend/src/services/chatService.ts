@@ -13,6 +13,73 @@ export async function sendChatMessage(messages: ChatMessage[]): Promise<ChatResp
   }
 }
 
+export interface ServerSentEvent {
+  event: string;
+  data: string;
+  id?: string;
+}
+
+/**
+ * Incremental parser for a text/event-stream body. Events may be split across reads
+ * or arrive several to a read; multi-line payloads come as repeated `data:` fields.
+ */
+export function createEventParser() {
+  let buffer = '';
+
+  const parseBlock = (block: string): ServerSentEvent | null => {
+    const event: ServerSentEvent = { event: 'message', data: '' };
+    const data: string[] = [];
+
+    for (const line of block.split(/\r\n|\r|\n/)) {
+      if (line === '' || line.startsWith(':')) {
+        continue;
+      }
+      const colon = line.indexOf(':');
+      const field = colon === -1 ? line : line.slice(0, colon);
+      let value = colon === -1 ? '' : line.slice(colon + 1);
+      if (value.startsWith(' ')) {
+        value = value.slice(1);
+      }
+
+      if (field === 'data') {
+        data.push(value);
+      } else if (field === 'event') {
+        event.event = value;
+      } else if (field === 'id') {
+        event.id = value;
+      }
+    }
+
+    if (data.length === 0) {
+      return null;
+    }
+    event.data = data.join('\n');
+    return event;
+  };
+
+  const take = (blocks: string[]): ServerSentEvent[] =>
+    blocks.map(parseBlock).filter((event): event is ServerSentEvent => event !== null);
+
+  return {
+    push(text: string): ServerSentEvent[] {
+      buffer += text;
+      const blocks = buffer.split(/\r\n\r\n|\n\n|\r\r/);
+      buffer = blocks.pop() ?? '';
+      return take(blocks);
+    },
+    // Parse whatever is left once the stream ends, even without a trailing blank line
+    flush(): ServerSentEvent[] {
+      const rest = buffer;
+      buffer = '';
+      return take([rest]);
+    },
+  };
+}
+
+// Reconnections attempted after a dropped stream, before giving up on the reply
+const MAX_RESUME_ATTEMPTS = 3;
+const RESUME_DELAY_MS = 500;
+
 export function streamChatMessage(
   messages: ChatMessage[],
   onChunk: (chunk: string) => void,
@@ -20,62 +87,120 @@ export function streamChatMessage(
   onError: (error: Error) => void
 ): StreamingController {
   const controller = new AbortController();
+  let streamId: string | null = null;
+  let lastEventId = '0';
+  let jsonPayloads = false;
 
-  fetch(`${API_URL}/chat/`, {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-      Accept: 'text/event-stream',
-    },
-    body: JSON.stringify({ messages }),
-    signal: controller.signal,
-  })
-    .then(async response => {
-      if (!response.ok) {
-        throw new Error(`HTTP error! Status: ${response.status}`);
-      }
+  // Reads a response until the reply ends; returns whether it finished with [DONE]
+  const consume = async (response: Response): Promise<boolean> => {
+    if (!response.ok) {
+      throw new Error(`HTTP error! Status: ${response.status}`);
+    }
 
-      if (!response.body) {
-        throw new Error('No response body.');
-      }
+    if (!response.body) {
+      throw new Error('No response body.');
+    }
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder('utf-8');
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    const parser = createEventParser();
 
-      try {
-        while (true) {
-          const { value, done } = await reader.read();
+    const dispatch = (events: ServerSentEvent[]): boolean => {
+      for (const event of events) {
+        if (event.id !== undefined) {
+          lastEventId = event.id;
+        }
+
+        // Named events (e.g. queue position updates) are not part of the reply
+        if (event.event !== 'message') {
+          continue;
+        }
+
+        if (event.data === '[DONE]') {
+          return true;
+        }
 
-          if (done) {
-            onDone();
-            break;
-          }
+        onChunk(jsonPayloads ? JSON.parse(event.data) : event.data);
+      }
+      return false;
+    };
 
-          const data = decoder.decode(value, { stream: true });
-          const text = data.substring(6, data.length - 2);
+    while (true) {
+      const { value, done } = await reader.read();
 
-          if (text === '[DONE]') {
-            onDone();
-            break;
-          }
+      if (done) {
+        return dispatch(parser.flush());
+      }
 
-          onChunk(text);
+      if (dispatch(parser.push(decoder.decode(value, { stream: true })))) {
+        return true;
+      }
+    }
+  };
+
+  const run = async () => {
+    let response = await fetch(`${API_URL}/chat/`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ messages }),
+      signal: controller.signal,
+    });
+    streamId = response.headers?.get('X-Stream-ID') ?? null;
+    jsonPayloads = response.headers?.get('X-Stream-Encoding') === 'json';
+
+    // The server keeps generating when the connection drops, so reattach to the same
+    // stream after the last event received rather than asking for a new reply
+    for (let attempt = 0; ; attempt++) {
+      let dropped: unknown = null;
+      try {
+        if (await consume(response)) {
+          onDone();
+          return;
         }
       } catch (error) {
-        if (error instanceof Error) {
-          if (error.name !== 'AbortError') {
-            onError(error);
-          }
+        if (!response.ok || (error instanceof Object && 'name' in error && error.name === 'AbortError')) {
+          throw error;
         }
+        dropped = error;
       }
-    })
-    .catch(error => {
-      if (error.name !== 'AbortError') {
-        onError(error);
-      } else {
+
+      if (streamId === null || attempt >= MAX_RESUME_ATTEMPTS) {
+        if (dropped !== null) {
+          throw dropped;
+        }
         onDone();
+        return;
       }
-    });
 
-  return { abort: () => controller.abort() };
+      await new Promise(resolve => setTimeout(resolve, RESUME_DELAY_MS * 2 ** attempt));
+      response = await fetch(`${API_URL}/chat/streams/${streamId}`, {
+        headers: {
+          Accept: 'text/event-stream',
+          'Last-Event-ID': lastEventId,
+        },
+        signal: controller.signal,
+      });
+    }
+  };
+
+  run().catch(error => {
+    if (error.name !== 'AbortError') {
+      onError(error);
+    } else {
+      onDone();
+    }
+  });
+
+  return {
+    abort: () => {
+      controller.abort();
+      // Dropping the connection alone leaves the reply generating for a while, in case we resume
+      if (streamId !== null) {
+        fetch(`${API_URL}/chat/streams/${streamId}`, { method: 'DELETE' }).catch(() => undefined);
+      }
+    },
+  };
 }